@@ -1,5 +1,18 @@
 import argparse
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses retried (after a backoff) when a server is briefly unavailable.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 
 def fetch_example(url: str) -> None:
@@ -14,7 +27,121 @@ def fetch_example(url: str) -> None:
         print(f"Error fetching {url}: {e}")
 
 
-def main():
+@dataclass
+class FetchResult:
+    url: str
+    status: Optional[int]
+    seconds: float
+    size: int = 0
+    attempts: int = 1
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and self.status < 400
+
+
+def make_session(
+    per_host: int = 4, retries: int = 2, backoff: float = 0.2, hosts: int = 10
+) -> requests.Session:
+    """Return a Session that keeps at most per_host connections to each host.
+
+    Requests beyond that wait for a free connection rather than opening
+    more. Connection errors, read errors and RETRY_STATUSES are retried up
+    to retries times, sleeping backoff * 2**n seconds in between (or as long
+    as a Retry-After header asks).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max(hosts, 10),
+        pool_maxsize=per_host,
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_one(session: requests.Session, url: str, timeout: float) -> FetchResult:
+    started = time.perf_counter()
+    try:
+        with session.get(url, timeout=timeout) as response:
+            size = len(response.content)
+            retries = getattr(response.raw, "retries", None)
+            attempts = len(retries.history) + 1 if retries is not None else 1
+            return FetchResult(
+                url, response.status_code, time.perf_counter() - started, size, attempts
+            )
+    except requests.exceptions.RequestException as e:
+        return FetchResult(url, None, time.perf_counter() - started, error=str(e))
+
+
+def fetch_many(
+    urls: List[str],
+    concurrency: int = 16,
+    per_host: int = 4,
+    retries: int = 2,
+    backoff: float = 0.2,
+    timeout: float = 5,
+) -> List[FetchResult]:
+    """Fetch urls on concurrency threads sharing one pooled Session.
+
+    Results come back in the order of urls.
+    """
+    hosts = len({urlsplit(url).netloc for url in urls})
+    with make_session(per_host, retries, backoff, hosts) as session:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(lambda url: fetch_one(session, url, timeout), urls))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    idx = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[idx]
+
+
+def summarize(results: List[FetchResult], wall_seconds: float) -> str:
+    latencies = sorted(r.seconds * 1000 for r in results)
+    failed = sum(not r.ok for r in results)
+    size = sum(r.size for r in results)
+    lines = [
+        f"{len(results)} URLs, {len(results) - failed} ok, {failed} failed "
+        f"in {wall_seconds:.2f}s ({len(results) / wall_seconds:.1f} req/s, "
+        f"{size / wall_seconds / 1024:.1f} KiB/s)"
+    ]
+    if latencies:
+        lines.append(
+            "latency ms: "
+            + " ".join(
+                f"{name}={percentile(latencies, pct):.1f}"
+                for name, pct in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+            )
+        )
+    return "\n".join(lines)
+
+
+def read_urls(path: str) -> Iterable[str]:
+    """URLs from a file (- for stdin), one per line; # starts a comment."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv=None) -> int:
     parser = argparse.ArgumentParser(description="CLI to fetch content from websites")
     parser.add_argument(
         "--url",
@@ -22,10 +149,62 @@ def main():
         default="https://www.example.com",
         help="URL to fetch (default: https://www.example.com)",
     )
+    parser.add_argument(
+        "urls", nargs="*", help="Fetch these URLs concurrently and report on each"
+    )
+    parser.add_argument(
+        "--urls-file",
+        help="Also fetch the URLs in this file, one per line (- for stdin)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="Requests in flight at once"
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=4, help="Connections kept open per host"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2, help="Retries after errors and 429/5xx"
+    )
+    parser.add_argument(
+        "--backoff", type=float, default=0.2, help="First retry delay in seconds"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=5, help="Seconds to wait per attempt"
+    )
 
-    args = parser.parse_args()
-    fetch_example(args.url)
+    args = parser.parse_args(argv)
+    for name in ("concurrency", "per_host"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+    if args.retries < 0 or args.backoff < 0:
+        parser.error("--retries and --backoff cannot be negative")
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    urls = list(args.urls)
+    if args.urls_file:
+        try:
+            urls += read_urls(args.urls_file)
+        except OSError as e:
+            parser.error(f"cannot read --urls-file: {e}")
+    if not urls and not args.urls_file:
+        fetch_example(args.url)
+        return 0
+
+    started = time.perf_counter()
+    results = fetch_many(
+        urls, args.concurrency, args.per_host, args.retries, args.backoff, args.timeout
+    )
+    wall = time.perf_counter() - started
+    for r in results:
+        outcome = r.error if r.error is not None else r.status
+        retried = f" after {r.attempts} attempts" if r.attempts > 1 else ""
+        print(
+            f"{'ok  ' if r.ok else 'FAIL'} {r.url} {outcome} "
+            f"{r.seconds * 1000:.1f}ms{retried}"
+        )
+    print(summarize(results, wall))
+    return 0 if all(r.ok for r in results) else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
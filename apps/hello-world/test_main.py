@@ -0,0 +1,125 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import main
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            server.hits[self.path] = hits = server.hits.get(self.path, 0) + 1
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.05)
+            if self.path == "/missing":
+                self._reply(404, b"not found")
+            elif self.path == "/down" or (self.path == "/flaky" and hits <= 2):
+                self._reply(503, b"try again")
+            else:
+                self._reply(200, b"hello")
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.lock = threading.Lock()
+    httpd.clients, httpd.hits = set(), {}
+    httpd.active = httpd.peak = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_fetch_many_pools_connections_per_host(server):
+    urls = [f"{server.base}/slow/{i}" for i in range(12)]
+    results = main.fetch_many(urls, concurrency=8, per_host=2, retries=0)
+    assert [r.url for r in results] == urls
+    assert all(r.ok and r.size == 5 for r in results)
+    assert server.peak <= 2
+    # Connections are kept alive and reused instead of one per request.
+    assert len(server.clients) <= 2
+
+
+def test_fetch_many_retries_and_reports_failures(server):
+    missing = f"http://127.0.0.1:{_closed_port()}/"
+    flaky, not_found = f"{server.base}/flaky", f"{server.base}/missing"
+    results = main.fetch_many([flaky, not_found, missing], retries=2, backoff=0)
+    by_url = {r.url: r for r in results}
+    assert by_url[flaky].ok and by_url[flaky].attempts == 3
+    assert by_url[not_found].status == 404 and not by_url[not_found].ok
+    assert by_url[missing].status is None and by_url[missing].error
+
+    (gave_up,) = main.fetch_many([f"{server.base}/down"], retries=1, backoff=0)
+    assert gave_up.status == 503 and gave_up.attempts == 2 and not gave_up.ok
+
+
+def test_cli_reports_each_url_and_a_summary(server, tmp_path, capsys):
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text(f"# health checks\n{server.base}/a\n\n{server.base}/b  # b\n")
+    assert main.main([f"{server.base}/c", "--urls-file", str(url_file)]) == 0
+    out = capsys.readouterr().out
+    assert out.count("ok  ") == 3
+    assert "3 URLs, 3 ok, 0 failed" in out and "p99=" in out
+
+    assert main.main([f"{server.base}/missing", "--retries", "0"]) == 1
+    assert "FAIL" in capsys.readouterr().out
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 11)]
+    assert [main.percentile(values, p) for p in (0, 10, 50, 90, 99, 100)] == [
+        1.0,
+        1.0,
+        5.0,
+        9.0,
+        10.0,
+        10.0,
+    ]
+    assert main.percentile([7.0], 50) == 7.0
+
+
+@pytest.mark.parametrize(
+    "args, error",
+    [
+        (["--concurrency", "0", "http://x/"], "--concurrency must be at least 1"),
+        (["--per-host", "0", "http://x/"], "--per-host must be at least 1"),
+        (["--timeout", "0", "http://x/"], "--timeout must be positive"),
+        (["--urls-file", "/nonexistent/urls.txt"], "cannot read --urls-file"),
+    ],
+)
+def test_cli_rejects_bad_arguments(args, error, capsys):
+    with pytest.raises(SystemExit) as exc:
+        main.main(args)
+    assert exc.value.code == 2
+    assert error in capsys.readouterr().err
@@ -2,8 +2,13 @@
 
 __all__ = [
     "main",
+    "agent",
     "commands",
     "crypto",
+    "generator",
     "storage",
     "core",
+    "aio",
+    "cache",
+    "transfer",
 ]
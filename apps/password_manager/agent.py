@@ -0,0 +1,235 @@
+"""Key agent: holds derived vault keys in memory so the CLI can skip Argon2.
+
+The agent listens on a Unix domain socket that only the owning user can
+open (0700 directory, 0600 socket, and a peer-uid check where the platform
+supports SO_PEERCRED). Requests and responses are single JSON lines. Keys
+are dropped after an idle timeout, on an explicit lock, or when the agent
+stops; dropped keys are overwritten in place first.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+SOCKET_ENV = "BRAHMAND5_AGENT_SOCK"
+DEFAULT_IDLE_TIMEOUT = 900.0
+
+# Generous upper bound on a request or response line.
+_MAX_MESSAGE = 64 * 1024
+
+
+class AgentError(Exception):
+    """The agent is unreachable or rejected a request."""
+
+
+def socket_path() -> Path:
+    """Resolve the agent socket: $BRAHMAND5_AGENT_SOCK, else a per-user default."""
+    env = os.environ.get(SOCKET_ENV)
+    if env:
+        return Path(env).expanduser()
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    base = Path(runtime) if runtime else Path.home() / ".local" / "share"
+    return base / "brahmand5" / "agent.sock"
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid
+
+
+def _wipe(buf: bytearray) -> None:
+    for i in range(len(buf)):
+        buf[i] = 0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        uid = _peer_uid(self.connection)
+        if uid is not None and uid != os.getuid():
+            return
+        line = self.rfile.readline(_MAX_MESSAGE)
+        try:
+            req = json.loads(line)
+            resp = self.server.agent.dispatch(req)
+        except Exception as e:
+            resp = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(resp).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def service_actions(self) -> None:
+        # Runs between polls of serve_forever(); a cheap place to expire keys.
+        self.agent.expire_idle()
+
+
+class KeyAgent:
+    """In-memory store of vault keys served over a Unix socket.
+
+    Keys are indexed by the resolved vault path. Creating the agent binds the
+    socket; serve_forever() then handles requests until "stop" is received.
+    """
+
+    def __init__(
+        self,
+        sock_path: Optional[Path] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.sock_path = Path(sock_path) if sock_path else socket_path()
+        self.idle_timeout = idle_timeout
+        self._keys = {}  # db path -> (bytearray key, last used monotonic time)
+        self._lock = threading.Lock()
+        self._server = self._bind()
+        self._server.agent = self
+
+    def _bind(self) -> _Server:
+        if not self.sock_path.parent.exists():
+            self.sock_path.parent.mkdir(mode=0o700, parents=True)
+        if self.sock_path.exists():
+            if is_running(self.sock_path):
+                raise AgentError(f"An agent is already listening on {self.sock_path}")
+            self.sock_path.unlink()
+        old_umask = os.umask(0o177)
+        try:
+            server = _Server(str(self.sock_path), _Handler)
+        finally:
+            os.umask(old_umask)
+        self.sock_path.chmod(0o600)
+        return server
+
+    def dispatch(self, req: dict) -> dict:
+        op = req.get("op")
+        if op == "ping":
+            return {"ok": True, "vaults": self.vault_count()}
+        if op == "add":
+            self.add_key(req["db"], bytes.fromhex(req["key"]))
+            return {"ok": True}
+        if op == "get":
+            key = self.get_key(req["db"])
+            return {"ok": True, "key": key.hex() if key is not None else None}
+        if op == "lock":
+            self.lock(req.get("db"))
+            return {"ok": True}
+        if op == "stop":
+            # shutdown() blocks until serve_forever() returns, so not from here.
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+    def vault_count(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def add_key(self, db: str, key: bytes) -> None:
+        with self._lock:
+            self._drop(db)
+            self._keys[db] = (bytearray(key), time.monotonic())
+
+    def get_key(self, db: str) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._keys.get(db)
+            if item is None:
+                return None
+            key, last_used = item
+            if now - last_used > self.idle_timeout:
+                self._drop(db)
+                return None
+            self._keys[db] = (key, now)
+            return bytes(key)
+
+    def lock(self, db: Optional[str] = None) -> None:
+        with self._lock:
+            for path in [db] if db else [*self._keys]:
+                self._drop(path)
+
+    def expire_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for path, (_key, last_used) in [*self._keys.items()]:
+                if now - last_used > self.idle_timeout:
+                    self._drop(path)
+
+    def _drop(self, db: str) -> None:
+        item = self._keys.pop(db, None)
+        if item is not None:
+            _wipe(item[0])
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        try:
+            self._server.serve_forever(poll_interval=poll_interval)
+        finally:
+            self.lock()
+            self._server.server_close()
+            try:
+                self.sock_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self) -> None:
+        self._server.shutdown()
+
+    def detach(self) -> None:
+        """Close this process's copy of the listening socket (after a fork)."""
+        self._server.socket.close()
+
+
+def request(op: str, sock_path: Optional[Path] = None, **fields) -> dict:
+    """Send one request to the agent and return its response."""
+    path = Path(sock_path) if sock_path else socket_path()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(str(path))
+            sock.sendall(json.dumps({"op": op, **fields}).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline(_MAX_MESSAGE)
+    except OSError as e:
+        raise AgentError(f"No agent at {path}: {e}") from e
+    if not line:
+        raise AgentError(f"Agent at {path} closed the connection")
+    resp = json.loads(line)
+    if not resp.get("ok"):
+        raise AgentError(resp.get("error", "request failed"))
+    return resp
+
+
+def is_running(sock_path: Optional[Path] = None) -> bool:
+    try:
+        request("ping", sock_path)
+    except AgentError:
+        return False
+    return True
+
+
+def get_key(db_path: Path, sock_path: Optional[Path] = None) -> Optional[bytes]:
+    """Return the cached key for db_path, or None if no agent holds one."""
+    try:
+        resp = request("get", sock_path, db=str(db_path))
+    except AgentError:
+        return None
+    return bytes.fromhex(resp["key"]) if resp["key"] else None
+
+
+def add_key(db_path: Path, key: bytes, sock_path: Optional[Path] = None) -> None:
+    request("add", sock_path, db=str(db_path), key=key.hex())
+
+
+def lock(db_path: Optional[Path] = None, sock_path: Optional[Path] = None) -> None:
+    request("lock", sock_path, db=str(db_path) if db_path else None)
+
+
+def stop(sock_path: Optional[Path] = None) -> None:
+    request("stop", sock_path)
@@ -0,0 +1,220 @@
+"""asyncio front end to the vault for use inside event-loop services.
+
+SQLite work runs on one dedicated thread that owns the vault's connection.
+Requests queue there back to back, so several coroutines can have reads and
+writes in flight without waiting on each other's round trips through the
+event loop. Argon2 and AES-GCM run on a separate, bounded thread pool. The
+loop itself never blocks on either.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+from . import core, crypto, storage
+from .models import KdfParams
+
+# Threads for Argon2 and AES-GCM. Each concurrent unlock holds the vault's
+# Argon2 memory cost (64 MiB by default), which this also bounds.
+DEFAULT_CRYPTO_WORKERS = min(4, os.cpu_count() or 1)
+
+# Operations allowed in flight at once; callers beyond this wait their turn.
+DEFAULT_MAX_PENDING = 64
+
+
+def _derive_and_check(
+    master_password: str, salt: bytes, kdf: KdfParams, key_check: bytes
+) -> Optional[bytes]:
+    key = crypto.derive_key(master_password, salt, params=kdf)
+    return key if crypto.verify_key_check(key, key_check) else None
+
+
+class AsyncVault:
+    """A core.Vault driven from coroutines.
+
+    Open it with ``await AsyncVault.open(path)`` or ``async with``, and close
+    it with aclose(). At most max_pending operations run at a time; further
+    calls wait without blocking the loop, which gives callers backpressure.
+    Cancelling a call that has not reached its thread yet means it never runs.
+    A write that has already started still commits.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        crypto_workers: int = DEFAULT_CRYPTO_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.db_path = Path(db_path)
+        self._db = ThreadPoolExecutor(1, thread_name_prefix="vault-db")
+        self._crypto = ThreadPoolExecutor(
+            crypto_workers, thread_name_prefix="vault-crypto"
+        )
+        self._slots = asyncio.Semaphore(max_pending)
+        self._vault = None
+
+    @classmethod
+    async def open(
+        cls,
+        db_path: Path,
+        key: Optional[bytes] = None,
+        crypto_workers: int = DEFAULT_CRYPTO_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        busy_timeout: float = storage.BUSY_TIMEOUT,
+    ) -> "AsyncVault":
+        """Open a session; the connection is created on the database thread."""
+        self = cls(db_path, crypto_workers, max_pending)
+        try:
+            self._vault = await self._on_db(
+                core.Vault, self.db_path, None, busy_timeout=busy_timeout
+            )
+            if key is not None:
+                await self._on_db(self._set_key, key)
+        except BaseException:
+            await self.aclose()
+            raise
+        return self
+
+    async def aclose(self) -> None:
+        if self._vault is not None:
+            await self._on_db(self._vault.close)
+            self._vault = None
+        self._db.shutdown(wait=False)
+        self._crypto.shutdown(wait=False)
+
+    async def __aenter__(self) -> "AsyncVault":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    def _on_db(self, fn, *args, **kwargs) -> asyncio.Future:
+        return asyncio.wrap_future(self._db.submit(fn, *args, **kwargs))
+
+    def _on_crypto(self, fn, *args) -> asyncio.Future:
+        return asyncio.wrap_future(self._crypto.submit(fn, *args))
+
+    def _set_key(self, key: bytes) -> None:
+        # Runs on the database thread. Reading record_format here caches it,
+        # so encrypting on a crypto thread never touches the connection.
+        self._vault.key = key
+        self._vault.record_format
+
+    @property
+    def key(self) -> Optional[bytes]:
+        return self._vault.key
+
+    @property
+    def unlocked(self) -> bool:
+        return self._vault.unlocked
+
+    async def unlock(self, master_password: str) -> bool:
+        """Check master_password and unlock; Argon2 runs on a crypto thread."""
+        async with self._slots:
+            meta = await self._on_db(storage.fetch_metadata, self._vault.conn)
+            if not meta:
+                raise RuntimeError("Vault not initialized")
+            if meta.key_check is None:
+                # One-time legacy upgrade; it writes, so it stays on the
+                # database thread with the connection.
+                if not await self._on_db(self._vault.unlock, master_password):
+                    return False
+                await self._on_db(self._set_key, self._vault.key)
+                return True
+            key = await self._on_crypto(
+                _derive_and_check, master_password, meta.salt, meta.kdf, meta.key_check
+            )
+            if key is None:
+                return False
+            await self._on_db(self._set_key, key)
+            return True
+
+    async def unlock_with_key(self, key: bytes) -> bool:
+        async with self._slots:
+            if not await self._on_db(self._vault.unlock_with_key, key):
+                return False
+            await self._on_db(self._set_key, key)
+            return True
+
+    async def add_entry(
+        self,
+        service: str,
+        username: str,
+        password: str,
+        notes: Optional[str] = None,
+    ) -> str:
+        async with self._slots:
+            row, search_change = await self._on_crypto(
+                self._vault._encrypt_new_entry, service, username, password, notes
+            )
+            await self._on_db(self._vault._insert_row, row, search_change)
+            return row[0]
+
+    async def get_entry(self, entry_id: str) -> Optional[dict]:
+        async with self._slots:
+            self._vault._require_cipher()
+            row = await self._on_db(self._vault._fetch_row, entry_id)
+            if not row:
+                return None
+            entry = await self._on_crypto(self._vault._decrypt_entry, row)
+            try:
+                return entry.to_dict()
+            finally:
+                entry.wipe()
+
+    async def iter_entries(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        page_size: int = core.LIST_PAGE_SIZE,
+        since: Optional[storage.Timestamp] = None,
+        modified_since: Optional[storage.Timestamp] = None,
+    ) -> AsyncIterator[dict]:
+        """Yield entries newest first with decrypted service/username.
+
+        Works like Vault.iter_entries_decrypted(). The next page is read while
+        the current one is decrypted. Nothing more is read until the consumer
+        asks for it, so a slow consumer holds at most two pages.
+        """
+        self._vault._require_cipher()
+        pages = await self._on_db(
+            self._vault._iter_list_pages,
+            limit,
+            after,
+            page_size,
+            since,
+            modified_since,
+        )
+        fetch = self._on_db(next, pages, None)
+        try:
+            while True:
+                async with self._slots:
+                    rows = await fetch
+                    if rows is None:
+                        return
+                    fetch = self._on_db(next, pages, None)
+                    plain = await self._on_crypto(
+                        self._vault._decrypt_rows,
+                        [(r[0], r[1:3], r[5]) for r in rows],
+                        True,
+                    )
+                for r, fields in zip(rows, plain):
+                    if fields is None:
+                        continue
+                    service, username = fields
+                    yield {
+                        "id": r[0],
+                        "service": service.decode("utf-8"),
+                        "username": username.decode("utf-8"),
+                        "created_at": storage.micros_to_iso(r[6]),
+                        "updated_at": storage.micros_to_iso(r[7]),
+                    }
+        finally:
+            fetch.cancel()
+
+    async def list_entries(
+        self, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> List[dict]:
+        return [e async for e in self.iter_entries(limit, after)]
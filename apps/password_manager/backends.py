@@ -0,0 +1,542 @@
+"""Stores for encrypted entry rows, and a log-structured one beside SQLite.
+
+An entry row is the ten columns of the entries table, in the order of
+core._INSERT_ENTRY_SQL: id, the service, username, password and notes
+blobs, the record blob, created_at and updated_at (epoch microseconds) and
+the service and username blind indexes. Blobs may be None. Stores never
+see plaintext; core encrypts rows before they arrive and decrypts them
+after they leave.
+
+EntryStore is what the vault reads and writes rows through. The vault's
+own store is storage.SqliteEntryStore, which runs on the session's
+connection and so joins its transactions. LogEntryStore keeps rows in an
+append-only file instead, for read-heavy copies of a vault that rarely
+change: lookups are a dict probe and a slice of a memory-mapped file, and
+opening it reads a compact index rather than the log. Either can be passed
+to core.Vault as its store.
+"""
+
+import abc
+import array
+import bisect
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+Row = tuple
+
+
+class EntryStore(abc.ABC):
+    """Encrypted entry rows by id.
+
+    A store implements the abstract methods. The queries below them (page,
+    find, after and unindexed) have versions built on scan(), which reads
+    every row per call; a store that can answer them from an index should
+    override them.
+    """
+
+    @abc.abstractmethod
+    def get(self, entry_id: str) -> Optional[Row]:
+        """Return the row with this id, or None."""
+
+    @abc.abstractmethod
+    def get_many(self, entry_ids: List[str]) -> List[Row]:
+        """Return the rows of those ids that exist, in no particular order."""
+
+    @abc.abstractmethod
+    def scan(self) -> Iterator[Row]:
+        """Yield every row, oldest created_at first."""
+
+    def put(self, row: Row) -> None:
+        """Store a row, replacing any row with the same id."""
+        self.put_many([row])
+
+    @abc.abstractmethod
+    def put_many(self, rows: Iterable[Row]) -> None:
+        """Store rows as put() does."""
+
+    @abc.abstractmethod
+    def delete(self, entry_id: str) -> bool:
+        """Remove a row; return False if there was none."""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """The number of rows."""
+
+    def page(
+        self,
+        limit: int,
+        before: Optional[Tuple[int, str]] = None,
+        since: Optional[int] = None,
+        modified_since: Optional[int] = None,
+    ) -> List[Row]:
+        """Up to limit rows, newest (created_at, id) first.
+
+        Only rows whose (created_at, id) is below before, created at or after
+        since and updated at or after modified_since are returned.
+        """
+        rows = (
+            row
+            for row in self.scan()
+            if (before is None or (row[6], row[0]) < before)
+            and (since is None or row[6] >= since)
+            and (modified_since is None or row[7] >= modified_since)
+        )
+        return heapq.nlargest(limit, rows, key=lambda row: (row[6], row[0]))
+
+    def find(
+        self, service_idx: Optional[bytes] = None, username_idx: Optional[bytes] = None
+    ) -> List[Row]:
+        """Rows with the given blind indexes, newest created_at first."""
+        rows = [
+            row
+            for row in self.scan()
+            if (service_idx is None or row[8] == service_idx)
+            and (username_idx is None or row[9] == username_idx)
+        ]
+        return rows[::-1]
+
+    def after(self, entry_id: str, limit: int) -> List[Row]:
+        """Up to limit rows with ids above entry_id, in id order."""
+        rows = (row for row in self.scan() if row[0] > entry_id)
+        return heapq.nsmallest(limit, rows, key=lambda row: row[0])
+
+    def unindexed(self, limit: int) -> List[Row]:
+        """Up to limit rows lacking a service or username blind index."""
+        rows = (row for row in self.scan() if row[8] is None or row[9] is None)
+        return list(itertools.islice(rows, limit))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# The log starts with a magic number and a generation, which changes each
+# time compaction rewrites the file. Records follow back to back, each a
+# fixed header and then the id and the blobs. The header holds the length
+# of the rest of the record, a CRC-32 of it, the op, a bit per blob that is
+# None, the id's length, the seven blob lengths, created_at and updated_at.
+_LOG_MAGIC = b"B5LOG\x00\x00\x02"
+_LOG_HEADER = struct.Struct("<8s8s")
+_RECORD = struct.Struct("<IIBBH7Iqq")
+# The length and CRC-32 that start a record; the CRC covers the rest.
+_PREFIX = struct.Struct("<II")
+_CHECKED = _PREFIX.size
+_TIMESTAMP = struct.Struct("<q")
+_CREATED_AT_OFFSET = _RECORD.size - 16
+_UPDATED_AT_OFFSET = _RECORD.size - 8
+_PUT, _DELETE = 1, 2
+
+# The index file: magic, generation, log bytes covered, dead bytes, row
+# count and the length of the ids, then the ids joined by newlines, the
+# records' offsets as little-endian uint64s and a CRC-32 of all of it.
+_INDEX_MAGIC = b"B5IDX\x00\x00\x02"
+_INDEX_HEADER = struct.Struct("<8s8sQQII")
+_CRC = struct.Struct("<I")
+
+# Row columns that are None, by the null bits of a record's header.
+_BLOB_COLUMNS = (1, 2, 3, 4, 5, 8, 9)
+_NULL_COLUMNS = [
+    tuple(c for i, c in enumerate(_BLOB_COLUMNS) if nulls >> i & 1)
+    for nulls in range(1 << len(_BLOB_COLUMNS))
+]
+
+# Rows put_many() encodes and appends at a time.
+_WRITE_BATCH_SIZE = 1000
+
+# Rows scan() reads per turn of holding the store's lock.
+_SCAN_BATCH_SIZE = 256
+
+
+def _encode(op: int, row: Row) -> bytes:
+    entry_id = row[0].encode("utf-8")
+    if b"\n" in entry_id:
+        raise ValueError("Entry ids cannot contain newlines")
+    if op == _PUT:
+        blobs = (*row[1:6], *row[8:10])
+        created_at, updated_at = row[6], row[7]
+    else:
+        blobs, created_at, updated_at = (None,) * 7, 0, 0
+    nulls = sum(1 << i for i, b in enumerate(blobs) if b is None)
+    body = _RECORD.pack(
+        0,
+        0,
+        op,
+        nulls,
+        len(entry_id),
+        *(0 if b is None else len(b) for b in blobs),
+        created_at,
+        updated_at,
+    )[_CHECKED:] + b"".join([entry_id, *(b for b in blobs if b is not None)])
+    return _PREFIX.pack(len(body), zlib.crc32(body)) + body
+
+
+def _decode(view, checked: memoryview, offset: int) -> Row:
+    """The row of the put record at offset in view, after checking its CRC.
+
+    checked is a memoryview of view, so the CRC is computed without a copy.
+    """
+    length, crc, _op, nulls, id_length, *lengths, created_at, updated_at = (
+        _RECORD.unpack_from(view, offset)
+    )
+    if zlib.crc32(checked[offset + _CHECKED : offset + _CHECKED + length]) != crc:
+        raise ValueError(f"Corrupt entry log record at offset {offset}")
+    # Unrolled, since this runs once per row of a scan.
+    start = offset + _RECORD.size
+    a = start + id_length
+    b = a + lengths[0]
+    c = b + lengths[1]
+    d = c + lengths[2]
+    e = d + lengths[3]
+    f = e + lengths[4]
+    g = f + lengths[5]
+    h = g + lengths[6]
+    row = (
+        view[start:a].decode("utf-8"),
+        view[a:b],
+        view[b:c],
+        view[c:d],
+        view[d:e],
+        view[e:f],
+        created_at,
+        updated_at,
+        view[f:g],
+        view[g:h],
+    )
+    if nulls:
+        row = list(row)
+        for column in _NULL_COLUMNS[nulls]:
+            row[column] = None
+        row = tuple(row)
+    return row
+
+
+def _little_endian(values: array.array) -> bytes:
+    if sys.byteorder == "little":
+        return values.tobytes()
+    swapped = array.array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class LogEntryStore(EntryStore):
+    """Entry rows in an append-only file, read through a memory map.
+
+    Every put or delete appends a record, so a write costs one write() (and
+    an fsync when durable) however large the file is. An in-memory dict maps
+    each id to the offset of its latest record. close() saves that dict to
+    an index file next to the log; opening loads it and replays only the
+    records written after it, so open time does not grow with the log's
+    history. A torn record at the end of the log (a crash mid-append) fails
+    its CRC and is cut off on open.
+
+    Replaced and deleted rows stay in the file until compact() rewrites it
+    with only the live ones; needs_compaction says when that is worthwhile.
+    One process may have the store open at a time.
+    """
+
+    def __init__(self, path: Path, durable: bool = True):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.durable = durable
+        self._lock = threading.RLock()
+        # id -> offset of its latest record
+        self._slots: Dict[str, int] = {}
+        # Bytes of records that no longer hold a live row.
+        self._dead = 0
+        # (created_at, id) of the live rows in order, for page(); built on
+        # demand and dropped by every write.
+        self._keys = None
+        self._dirty = False
+        if not self.path.exists():
+            with open(self.path, "wb") as f:
+                f.write(_LOG_HEADER.pack(_LOG_MAGIC, os.urandom(8)))
+                f.flush()
+                os.fsync(f.fileno())
+        self._file = open(self.path, "r+b")
+        self._map = None
+        try:
+            self._load()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _load(self) -> None:
+        header = self._file.read(_LOG_HEADER.size)
+        magic, self._generation = (
+            _LOG_HEADER.unpack(header)
+            if len(header) == _LOG_HEADER.size
+            else (None, None)
+        )
+        if magic != _LOG_MAGIC:
+            raise ValueError(f"{self.path} is not an entry log")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._remap()
+        self._replay(self._load_index())
+
+    def _load_index(self) -> int:
+        """Load the saved index if it matches the log; return where it ends."""
+        try:
+            data = self.index_path.read_bytes()
+        except FileNotFoundError:
+            return _LOG_HEADER.size
+        if len(data) < _INDEX_HEADER.size + _CRC.size:
+            return _LOG_HEADER.size
+        (crc,) = _CRC.unpack_from(data, len(data) - _CRC.size)
+        if zlib.crc32(memoryview(data)[: -_CRC.size]) != crc:
+            return _LOG_HEADER.size
+        magic, generation, covered, dead, count, ids_length = _INDEX_HEADER.unpack_from(
+            data
+        )
+        if (
+            magic != _INDEX_MAGIC
+            or generation != self._generation
+            or covered > self._size
+        ):
+            return _LOG_HEADER.size
+        pos = _INDEX_HEADER.size + ids_length
+        ids = data[_INDEX_HEADER.size : pos].decode("utf-8").split("\n")
+        offsets = array.array("Q")
+        offsets.frombytes(data[pos : len(data) - _CRC.size])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        if count == 0:
+            ids = []
+        if len(ids) != count or len(offsets) != count:
+            return _LOG_HEADER.size
+        self._slots = dict(zip(ids, offsets))
+        self._dead = dead
+        return covered
+
+    def _replay(self, pos: int) -> None:
+        """Apply the records from pos on; cut off a torn one at the end."""
+        view, end = self._map, self._size
+        while pos + _RECORD.size <= end:
+            length, crc, op, _nulls, id_length = _RECORD.unpack_from(view, pos)[:5]
+            start = pos + _CHECKED
+            if start + length > end or zlib.crc32(view[start : start + length]) != crc:
+                break
+            entry_id = view[pos + _RECORD.size : pos + _RECORD.size + id_length].decode(
+                "utf-8"
+            )
+            self._apply(op, entry_id, pos, _CHECKED + length)
+            pos = start + length
+            self._dirty = True
+        if pos < end:
+            self._map.close()
+            self._map = None
+            self._file.truncate(pos)
+            self._size = pos
+            self._dirty = True
+            self._remap()
+
+    def _apply(self, op: int, entry_id: str, offset: int, size: int) -> None:
+        self._keys = None
+        old = self._slots.pop(entry_id, None)
+        if old is not None:
+            self._dead += self._record_size(old)
+        if op == _PUT:
+            self._slots[entry_id] = offset
+        else:
+            self._dead += size
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _view(self, end: int) -> mmap.mmap:
+        # Appends do not touch the map; it is renewed once a read reaches
+        # past its end.
+        if end > len(self._map):
+            self._remap()
+        return self._map
+
+    def _record_size(self, offset: int) -> int:
+        view = self._view(offset + _CHECKED)
+        return _CHECKED + _PREFIX.unpack_from(view, offset)[0]
+
+    def _rows(self, offsets: Iterable[int]) -> List[Row]:
+        """Read the records at offsets; the caller holds the lock."""
+        view = self._view(self._size)
+        # Released before the map can be renewed, which it refuses while
+        # views of it exist.
+        with memoryview(view) as checked:
+            return [_decode(view, checked, offset) for offset in offsets]
+
+    def get(self, entry_id: str) -> Optional[Row]:
+        with self._lock:
+            offset = self._slots.get(entry_id)
+            return self._rows([offset])[0] if offset is not None else None
+
+    def get_many(self, entry_ids: List[str]) -> List[Row]:
+        with self._lock:
+            slots = self._slots
+            return self._rows([slots[i] for i in entry_ids if i in slots])
+
+    def _ordered(self) -> List[int]:
+        """Offsets of the live records, oldest created_at first."""
+        view = self._view(self._size)
+        unpack = _TIMESTAMP.unpack_from
+        # File order first, so rows created in the same microsecond come out
+        # in the order they were written; the second sort is stable.
+        offsets = sorted(self._slots.values())
+        offsets.sort(key=lambda offset: unpack(view, offset + _CREATED_AT_OFFSET)[0])
+        return offsets
+
+    def scan(self) -> Iterator[Row]:
+        with self._lock:
+            generation = self._generation
+            offsets = self._ordered()
+        for start in range(0, len(offsets), _SCAN_BATCH_SIZE):
+            with self._lock:
+                if self._generation != generation:
+                    raise RuntimeError("The log was compacted during the scan")
+                rows = self._rows(offsets[start : start + _SCAN_BATCH_SIZE])
+            yield from rows
+
+    def page(
+        self,
+        limit: int,
+        before: Optional[Tuple[int, str]] = None,
+        since: Optional[int] = None,
+        modified_since: Optional[int] = None,
+    ) -> List[Row]:
+        with self._lock:
+            view = self._view(self._size)
+            if self._keys is None:
+                unpack = _TIMESTAMP.unpack_from
+                self._keys = sorted(
+                    (unpack(view, offset + _CREATED_AT_OFFSET)[0], entry_id)
+                    for entry_id, offset in self._slots.items()
+                )
+            keys, slots = self._keys, self._slots
+            i = len(keys) if before is None else bisect.bisect_left(keys, before)
+            offsets = []
+            while i > 0 and len(offsets) < limit:
+                i -= 1
+                created_at, entry_id = keys[i]
+                if since is not None and created_at < since:
+                    break
+                offset = slots[entry_id]
+                if (
+                    modified_since is None
+                    or _TIMESTAMP.unpack_from(view, offset + _UPDATED_AT_OFFSET)[0]
+                    >= modified_since
+                ):
+                    offsets.append(offset)
+            return self._rows(offsets)
+
+    def after(self, entry_id: str, limit: int) -> List[Row]:
+        with self._lock:
+            ids = sorted(self._slots)
+            start = bisect.bisect_right(ids, entry_id)
+            return self._rows([self._slots[i] for i in ids[start : start + limit]])
+
+    def _append(self, records: List[Tuple[int, Row]]) -> None:
+        encoded = [_encode(op, row) for op, row in records]
+        with self._lock:
+            self._file.seek(self._size)
+            self._file.write(b"".join(encoded))
+            self._file.flush()
+            if self.durable:
+                os.fsync(self._file.fileno())
+            offset = self._size
+            self._size += sum(map(len, encoded))
+            for (op, row), record in zip(records, encoded):
+                self._apply(op, row[0], offset, len(record))
+                offset += len(record)
+            self._dirty = True
+
+    def put_many(self, rows: Iterable[Row]) -> None:
+        """Append rows, _WRITE_BATCH_SIZE per write() (and fsync)."""
+        for batch in itertools.batched(rows, _WRITE_BATCH_SIZE):
+            self._append([(_PUT, row) for row in batch])
+
+    def delete(self, entry_id: str) -> bool:
+        with self._lock:
+            if entry_id not in self._slots:
+                return False
+            self._append([(_DELETE, (entry_id,))])
+            return True
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def needs_compaction(self) -> bool:
+        """Whether superseded records take up more than half of the log."""
+        return self._dead * 2 > self._size - _LOG_HEADER.size
+
+    def compact(self) -> None:
+        """Rewrite the log with only the live rows, oldest first."""
+        with self._lock:
+            generation = os.urandom(8)
+            tmp = self.path.with_name(self.path.name + ".compact")
+            ids = {offset: entry_id for entry_id, offset in self._slots.items()}
+            slots = {}
+            with open(tmp, "wb") as f:
+                f.write(_LOG_HEADER.pack(_LOG_MAGIC, generation))
+                new_offset = _LOG_HEADER.size
+                view = self._view(self._size)
+                for offset in self._ordered():
+                    record = view[offset : offset + self._record_size(offset)]
+                    slots[ids[offset]] = new_offset
+                    f.write(record)
+                    new_offset += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self._map.close()
+            self._map = None
+            self._file.close()
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "r+b")
+            self._generation, self._slots, self._dead = generation, slots, 0
+            self._size = new_offset
+            self._remap()
+            self._save_index()
+
+    def _save_index(self) -> None:
+        ids = "\n".join(self._slots).encode("utf-8")
+        data = b"".join(
+            [
+                _INDEX_HEADER.pack(
+                    _INDEX_MAGIC,
+                    self._generation,
+                    self._size,
+                    self._dead,
+                    len(self._slots),
+                    len(ids),
+                ),
+                ids,
+                _little_endian(array.array("Q", self._slots.values())),
+            ]
+        )
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data + _CRC.pack(zlib.crc32(data)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+        self._dirty = False
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._dirty:
+                self._save_index()
+            self._map.close()
+            self._file.close()
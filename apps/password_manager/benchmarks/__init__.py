@@ -0,0 +1 @@
+"""Standalone benchmark suite; run with `python -m apps.password_manager.benchmarks`."""
@@ -0,0 +1,464 @@
+"""Benchmarks for the password manager hot paths.
+
+Each (operation, vault size) case runs in a fresh child process so that peak
+RSS and I/O counters belong to that case alone. Results are written as JSON
+and can be compared against an earlier run to flag regressions:
+
+    python -m apps.password_manager.benchmarks --sizes 10,1000
+    python -m apps.password_manager.benchmarks --compare .benchmarks/<old>.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .. import core, crypto, storage
+from ..backends import LogEntryStore
+from ..generator import generate_many
+
+MASTER_PASSWORD = "benchmark-master-password"
+DEFAULT_SIZES = (10, 1000)
+FULL_SIZES = (10, 1000, 100_000, 1_000_000)
+DEFAULT_OUTPUT_DIR = Path(".benchmarks")
+
+# A case stops sampling once it has MIN_SAMPLES and has run for TIME_BUDGET
+# seconds, or when it reaches MAX_SAMPLES.
+MIN_SAMPLES = 3
+MAX_SAMPLES = 1000
+TIME_BUDGET = 1.0
+
+# Number of distinct ids get_entry cycles through.
+LOOKUP_IDS = 1000
+
+# Thread count for the *_parallel cases, compared against the serial ones.
+PARALLEL_WORKERS = os.cpu_count() or 1
+
+
+class Context:
+    """What an operation's setup needs: a populated vault and its key.
+
+    The key is derived once by the parent so that Argon2's memory does not
+    show up in the peak RSS of cases that never unlock.
+    """
+
+    def __init__(self, db_path: Path, size: int, key: bytes):
+        self.db_path = db_path
+        self.size = size
+        self.key = key
+        self._vault = None
+
+    @property
+    def vault(self) -> core.Vault:
+        if self._vault is None:
+            self._vault = core.Vault(self.db_path, self.key)
+        return self._vault
+
+    def sample_ids(self, n: int) -> List[str]:
+        cur = self.vault.conn.execute(
+            "SELECT id FROM entries ORDER BY RANDOM() LIMIT ?", (n,)
+        )
+        return [r[0] for r in cur]
+
+    def log_store(self) -> Path:
+        """Copy the vault's rows into a LogEntryStore; return its path."""
+        path = self.db_path.parent / "entries.log"
+        if not path.exists():
+            with LogEntryStore(path, durable=False) as store:
+                store.put_many(self.vault.entries.scan())
+        return path
+
+    def close(self) -> None:
+        if self._vault is not None:
+            self._vault.close()
+
+
+def _op_init_vault(ctx: Context) -> Callable[[], object]:
+    counter = iter(range(MAX_SAMPLES))
+    scratch = ctx.db_path.parent / "init"
+    scratch.mkdir(exist_ok=True)
+    return lambda: core.init_vault(scratch / f"{next(counter)}.db", MASTER_PASSWORD)
+
+
+def _op_unlock_vault(ctx: Context) -> Callable[[], object]:
+    return lambda: core.unlock_vault(ctx.db_path, MASTER_PASSWORD)
+
+
+def _op_add_entry(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    return lambda: vault.add_entry("bench.example", "bench-user", "bench-pw", None)
+
+
+def _op_get_entry(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    ids = ctx.sample_ids(LOOKUP_IDS)
+    counter = iter(range(sys.maxsize))
+    return lambda: vault.get_entry(ids[next(counter) % len(ids)])
+
+
+def _op_list_entries_decrypted(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    return vault.list_entries_decrypted
+
+
+def _op_list_entries_decrypted_parallel(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    vault.workers = PARALLEL_WORKERS
+    return vault.list_entries_decrypted
+
+
+def _op_export_entries(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    return lambda: sum(1 for _ in vault.export_entries())
+
+
+def _op_export_entries_parallel(ctx: Context) -> Callable[[], object]:
+    vault = ctx.vault
+    vault.workers = PARALLEL_WORKERS
+    return lambda: sum(1 for _ in vault.export_entries())
+
+
+def _op_search(ctx: Context) -> Callable[[], object]:
+    # The first search builds and stores the index; time the queries after it.
+    vault = ctx.vault
+    vault.search("warm up")
+    queries = [f"service-{ctx.size // 2}", "user7", "note 12", "exmaple srvice"]
+    counter = iter(range(sys.maxsize))
+    return lambda: vault.search(queries[next(counter) % len(queries)])
+
+
+# The store_* cases time the entry stores on their own, without decryption:
+# opening one, reading single rows by id and reading every row.
+
+
+def _open_store(backend: str, path: Path):
+    if backend == "log":
+        return LogEntryStore(path)
+    return storage.SqliteEntryStore.open(path)
+
+
+def _store_path(ctx: Context, backend: str) -> Path:
+    return ctx.log_store() if backend == "log" else ctx.db_path
+
+
+def _op_store_open(backend: str) -> Callable[[Context], Callable[[], object]]:
+    def setup(ctx: Context) -> Callable[[], object]:
+        path = _store_path(ctx, backend)
+        (entry_id,) = ctx.sample_ids(1)
+
+        # Up to the first lookup, which is when SQLite reads the schema.
+        def open_and_get():
+            with _open_store(backend, path) as store:
+                return store.get(entry_id)
+
+        return open_and_get
+
+    return setup
+
+
+def _op_store_get(backend: str) -> Callable[[Context], Callable[[], object]]:
+    def setup(ctx: Context) -> Callable[[], object]:
+        store = _open_store(backend, _store_path(ctx, backend))
+        ids = ctx.sample_ids(LOOKUP_IDS)
+        counter = iter(range(sys.maxsize))
+        return lambda: store.get(ids[next(counter) % len(ids)])
+
+    return setup
+
+
+def _op_store_scan(backend: str) -> Callable[[Context], Callable[[], object]]:
+    def setup(ctx: Context) -> Callable[[], object]:
+        store = _open_store(backend, _store_path(ctx, backend))
+        return lambda: sum(1 for _ in store.scan())
+
+    return setup
+
+
+def _op_generate_strong_password(ctx: Context) -> Callable[[], object]:
+    return lambda: crypto.generate_strong_password(20, include_symbols=True)
+
+
+def _op_generate_many(ctx: Context) -> Callable[[], object]:
+    # One call produces 10k passwords; divide the timings to compare per item.
+    return lambda: sum(1 for _ in generate_many(10_000, 20, include_symbols=True))
+
+
+# name -> (setup, whether the case depends on vault size, whether it adds rows)
+# Cases that add rows run after the read-only ones for the same vault size.
+OPERATIONS: Dict[str, tuple] = {
+    "init_vault": (_op_init_vault, False, False),
+    "unlock_vault": (_op_unlock_vault, False, False),
+    "add_entry": (_op_add_entry, True, True),
+    "get_entry": (_op_get_entry, True, False),
+    "list_entries_decrypted": (_op_list_entries_decrypted, True, False),
+    "list_entries_decrypted_parallel": (
+        _op_list_entries_decrypted_parallel,
+        True,
+        False,
+    ),
+    "export_entries": (_op_export_entries, True, False),
+    "export_entries_parallel": (_op_export_entries_parallel, True, False),
+    "search": (_op_search, True, False),
+    **{
+        f"store_{name}_{backend}": (setup(backend), True, False)
+        for name, setup in (
+            ("open", _op_store_open),
+            ("get", _op_store_get),
+            ("scan", _op_store_scan),
+        )
+        for backend in ("sqlite", "log")
+    },
+    "generate_strong_password": (_op_generate_strong_password, False, False),
+    "generate_many": (_op_generate_many, False, False),
+}
+
+
+def populate(db_path: Path, size: int) -> bytes:
+    """Create a vault at db_path holding size synthetic entries; return its key."""
+    with core.Vault.create(db_path, MASTER_PASSWORD) as vault:
+        vault.import_entries(
+            {
+                "service": f"service-{i}.example",
+                "username": f"user{i}@example.com",
+                "password": f"password-{i}",
+                "notes": f"note {i}" if i % 4 == 0 else None,
+            }
+            for i in range(size)
+        )
+        return vault.key
+
+
+def _proc_io() -> Optional[Dict[str, int]]:
+    # Linux only. rchar/wchar count bytes through read()/write(), which is
+    # what SQLite's page reads and writes go through (cache hits included).
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(": ") for line in f)}
+    except OSError:
+        return None
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss survives fork+exec on Linux, so a spawned child would inherit
+    # the parent's Argon2 high-water mark; VmHWM belongs to this process only.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _percentile(sorted_samples: List[float], pct: float) -> float:
+    idx = min(len(sorted_samples) - 1, round(pct / 100 * (len(sorted_samples) - 1)))
+    return sorted_samples[idx]
+
+
+def run_case(op: str, db_path: Path, size: int, key: bytes) -> dict:
+    """Time one operation against the vault at db_path, in this process."""
+    setup = OPERATIONS[op][0]
+    ctx = Context(db_path, size, key)
+    page_size = ctx.vault.conn.execute("PRAGMA page_size").fetchone()[0]
+    fn = setup(ctx)
+
+    io_before = _proc_io()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < MAX_SAMPLES:
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+        if len(samples) >= MIN_SAMPLES and time.perf_counter() - started > TIME_BUDGET:
+            break
+    io_after = _proc_io()
+    ctx.close()
+
+    samples.sort()
+    result = {
+        "op": op,
+        "size": size,
+        "samples": len(samples),
+        "mean_us": statistics.fmean(samples),
+        "min_us": samples[0],
+        "p50_us": _percentile(samples, 50),
+        "p90_us": _percentile(samples, 90),
+        "p99_us": _percentile(samples, 99),
+        "max_us": samples[-1],
+        "peak_rss_kb": _peak_rss_kb(),
+    }
+    if io_before and io_after:
+        n = len(samples)
+        read_bytes = io_after["rchar"] - io_before["rchar"]
+        write_bytes = io_after["wchar"] - io_before["wchar"]
+        result.update(
+            {
+                "read_pages_per_op": read_bytes / page_size / n,
+                "write_pages_per_op": write_bytes / page_size / n,
+                "read_syscalls_per_op": (io_after["syscr"] - io_before["syscr"]) / n,
+                "write_syscalls_per_op": (io_after["syscw"] - io_before["syscw"]) / n,
+            }
+        )
+    return result
+
+
+def _child(op: str, db_path: str, size: int, key: bytes, queue) -> None:
+    queue.put(run_case(op, Path(db_path), size, key))
+
+
+def run_isolated(op: str, db_path: Path, size: int, key: bytes) -> dict:
+    """Run a case in a spawned child process and return its result."""
+    mp = multiprocessing.get_context("spawn")
+    queue = mp.Queue()
+    proc = mp.Process(target=_child, args=(op, str(db_path), size, key, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def run_suite(
+    sizes=DEFAULT_SIZES, ops=None, isolate: bool = True, log=print
+) -> List[dict]:
+    ops = list(ops or OPERATIONS)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pm-bench-") as tmp:
+        unsized = [op for op in ops if not OPERATIONS[op][1]]
+        sized = sorted(
+            (op for op in ops if OPERATIONS[op][1]), key=lambda op: OPERATIONS[op][2]
+        )
+        plan = [(min(sizes), unsized)] + [(size, sized) for size in sizes]
+        keys = {}
+        for size, case_ops in plan:
+            if not case_ops:
+                continue
+            db_path = Path(tmp) / str(size) / "vault.db"
+            if size not in keys:
+                db_path.parent.mkdir()
+                log(f"populating {size} entries...")
+                keys[size] = populate(db_path, size)
+            for op in case_ops:
+                runner = run_isolated if isolate else run_case
+                result = runner(op, db_path, size, keys[size])
+                if not OPERATIONS[op][1]:
+                    result["size"] = None
+                results.append(result)
+                log(_format_row(result))
+    return results
+
+
+def _format_row(r: dict) -> str:
+    size = "-" if r["size"] is None else r["size"]
+    return (
+        f"{r['op']:<26} {size:>9} p50={r['p50_us']:>12.1f}us "
+        f"p90={r['p90_us']:>12.1f}us p99={r['p99_us']:>12.1f}us "
+        f"rss={r['peak_rss_kb'] / 1024:>7.1f}MiB"
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def make_report(results: List[dict]) -> dict:
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Return a line per case whose p50 grew by more than threshold (a ratio)."""
+    old = {(r["op"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        prev = old.get((r["op"], r["size"]))
+        if prev is None:
+            continue
+        ratio = r["p50_us"] / prev["p50_us"]
+        if ratio > threshold:
+            regressions.append(
+                f"{r['op']} size={r['size']}: p50 {prev['p50_us']:.1f}us -> "
+                f"{r['p50_us']:.1f}us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Comma-separated vault sizes, or 'full' for "
+        + ",".join(map(str, FULL_SIZES)),
+    )
+    parser.add_argument(
+        "--ops", help="Comma-separated operations (default: all)", default=None
+    )
+    parser.add_argument("--output", type=Path, help="Where to write the JSON report")
+    parser.add_argument(
+        "--compare", type=Path, help="Baseline JSON report to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Fail if a p50 exceeds the baseline by this ratio (default 1.2)",
+    )
+    parser.add_argument(
+        "--no-isolate",
+        action="store_true",
+        help="Run every case in this process (faster, but RSS/I/O are shared)",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = (
+        FULL_SIZES
+        if args.sizes == "full"
+        else tuple(int(s) for s in args.sizes.split(","))
+    )
+    ops = args.ops.split(",") if args.ops else None
+    unknown = set(ops or ()) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+
+    report = make_report(run_suite(sizes, ops, isolate=not args.no_isolate))
+    output = args.output or DEFAULT_OUTPUT_DIR / (
+        f"{report['commit'] or 'unknown'}-{int(time.time())}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"wrote {output}")
+
+    if args.compare:
+        regressions = compare(
+            json.loads(args.compare.read_text()), report, args.threshold
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
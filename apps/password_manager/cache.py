@@ -0,0 +1,79 @@
+"""Bounded in-memory cache of decrypted entries for long-lived vault sessions."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .models import Entry
+
+
+class EntryCache:
+    """LRU cache of decrypted entries with an optional time-to-live.
+
+    Holds at most max_size entries; the least recently used one is evicted
+    first, and entries older than ttl seconds are treated as missing. Evicted,
+    expired and invalidated entries have their secret buffers wiped.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # id -> (Entry, inserted at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, entry_id: str) -> Optional[Entry]:
+        with self._lock:
+            item = self._entries.get(entry_id)
+            if item is not None and self._expired(item[1]):
+                self._drop(entry_id)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return item[0]
+
+    def put(self, entry: Entry) -> None:
+        with self._lock:
+            self._drop(entry.id)
+            self._entries[entry.id] = (entry, self._clock())
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, entry_id: str) -> None:
+        with self._lock:
+            self._drop(entry_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry_id in [*self._entries]:
+                self._drop(entry_id)
+
+    def purge_expired(self) -> None:
+        with self._lock:
+            for entry_id, (_entry, inserted) in [*self._entries.items()]:
+                if self._expired(inserted):
+                    self._drop(entry_id)
+
+    def _expired(self, inserted: float) -> bool:
+        return self.ttl is not None and self._clock() - inserted > self.ttl
+
+    def _drop(self, entry_id: str) -> None:
+        item = self._entries.pop(entry_id, None)
+        if item is not None:
+            item[0].wipe()
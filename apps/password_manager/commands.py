@@ -1,21 +1,371 @@
+import io
+import os
+import sys
 import typer
 from pathlib import Path
-from . import core, storage, crypto
+from typing import TYPE_CHECKING, List
+from .models import KdfParams
+
+# Subcommands import the vault modules they need when they run: argon2,
+# cryptography and sqlite3 dominate startup, and `generate` or `--help`
+# need none of them.
+if TYPE_CHECKING:
+    from . import core
 
 app = typer.Typer()
+agent_app = typer.Typer(help="Cache unlocked vault keys in a background agent")
+app.add_typer(agent_app, name="agent")
+
+# Environment variable naming a file that holds the master password.
+PASSWORD_FILE_ENV = "BRAHMAND5_PASSWORD_FILE"
+
+# --format values of get, list and find; text is the human-readable default.
+OUTPUT_FORMATS = ("text", "json", "jsonl", "tsv")
+
+
+# Where _secret() reads from; set from the global options per run.
+_password_source = {}
+
+
+@app.callback()
+def _global_options(
+    ctx: typer.Context,
+    password_fd: int = typer.Option(
+        None,
+        "--password-fd",
+        help="Read the master password, then any other passwords asked for, "
+        "one per line from this file descriptor",
+    ),
+    password_file: str = typer.Option(
+        None,
+        "--password-file",
+        envvar=PASSWORD_FILE_ENV,
+        help="Read the master password, then any other passwords asked for, "
+        "one per line from this file",
+    ),
+    password_stdin: bool = typer.Option(
+        False,
+        "--password-stdin",
+        help="Read the master password, then any other passwords asked for, "
+        "one per line from stdin",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print where the time went (KDF, SQL, AEAD) to stderr",
+    ),
+    profile_export: str = typer.Option(
+        None,
+        "--profile-export",
+        help="Write every traced span to this file as JSON lines",
+    ),
+):
+    """Keep credentials in an encrypted local vault"""
+    if (password_fd is not None) + (password_file is not None) + password_stdin > 1:
+        typer.echo("Give only one master password source", err=True)
+        raise typer.Exit(code=2)
+    _password_source.clear()
+    if password_fd is not None:
+        _password_source["fd"] = password_fd
+    elif password_file is not None:
+        _password_source["file"] = Path(password_file).expanduser()
+    elif password_stdin:
+        _password_source["stdin"] = True
+    if profile or profile_export:
+        _start_profile(ctx, profile, profile_export)
+
+
+def _start_profile(ctx: typer.Context, show: bool, export: str) -> None:
+    """Trace the command; report when it finishes, even if it fails."""
+    import json
+
+    from . import trace
+
+    stream = open(export, "w", encoding="utf-8") if export else None
+    trace.enable(trace.jsonl_exporter(stream) if stream else None)
+
+    def finish() -> None:
+        recorder = trace.disable()
+        if stream is not None:
+            summary = recorder.summary()
+            del summary["spans"]
+            stream.write(json.dumps(summary) + "\n")
+            stream.close()
+        if show:
+            typer.echo(recorder.format_summary(), err=True)
+
+    ctx.call_on_close(finish)
+
+
+def _source_line():
+    """The next line of the --password-* source, or None if there is no more.
+
+    The source is opened on first use and read a line at a time after that,
+    so each call gets the line after the previous one.
+    """
+    if not _password_source:
+        return None
+    try:
+        if "stream" not in _password_source:
+            if "fd" in _password_source:
+                stream = open(_password_source["fd"], encoding="utf-8", closefd=False)
+            elif "file" in _password_source:
+                with open(_password_source["file"], encoding="utf-8") as f:
+                    stream = io.StringIO(f.read())
+            else:
+                stream = sys.stdin
+            _password_source["stream"] = stream
+        line = _password_source["stream"].readline()
+    except OSError as e:
+        typer.echo(f"Cannot read the password source: {e}", err=True)
+        raise typer.Exit(code=2)
+    return line.rstrip("\r\n") if line else None
+
+
+def _secret(prompt: str, confirm: bool = False) -> str:
+    """Read a password from the source given on the command line, or prompt.
+
+    The first line of --password-fd, --password-file or --password-stdin is
+    the master password; each later prompt of the command (a new master
+    password, an entry's password) takes the next line. Without a source,
+    or once it has no lines left, this prompts. Line endings are dropped.
+    """
+    line = _source_line()
+    if line is None:
+        return typer.prompt(prompt, hide_input=True, confirmation_prompt=confirm)
+    return line
+
+
+def _check_output_format(fmt: str) -> None:
+    if fmt not in OUTPUT_FORMATS:
+        typer.echo(
+            f"Unsupported format {fmt!r}; expected one of {', '.join(OUTPUT_FORMATS)}",
+            err=True,
+        )
+        raise typer.Exit(code=2)
+
+
+def _write_rows(rows, fmt: str, fields=None) -> int:
+    """Write rows to stdout as json, jsonl or tsv; return the count.
+
+    fields are the TSV columns, by default those of a full entry.
+    """
+    from . import transfer
+
+    return transfer.write_entries(sys.stdout, rows, fmt, fields or transfer.FIELDS)
+
+
+# TSV columns of list, find and search rows, which carry no secrets.
+_LIST_FIELDS = ("id", "service", "username", "created_at", "updated_at")
+_PREVIEW_FIELDS = ("id", "service", "username", "record", "created_at", "updated_at")
+_SEARCH_FIELDS = ("id", "service", "username", "score")
+
+_OUTPUT_FORMAT_OPTION = typer.Option(
+    "text", "--format", "-f", help="Output as text, json, jsonl or tsv"
+)
+
+
+def _open_vault(
+    db: str, workers: int = 1, resume_rekey: bool = False, prompt: bool = True
+) -> "core.Vault":
+    """Return an unlocked vault session.
+
+    Uses the key cached by a running agent when there is one, and falls back
+    to reading or prompting for the master password (see _secret()); the
+    master password line of a --password-* source is used up either way, so
+    later lines keep their meaning. Without prompt it exits rather than ask
+    on the terminal. Exits if an interrupted rekey has to be finished first,
+    unless resume_rekey is set.
+    """
+    from . import agent, core, storage
+
+    path = storage.resolve_db_path(db)
+    vault = core.Vault(path, workers=workers)
+    cached = agent.get_key(path)
+    if cached is not None and vault.unlock_with_key(cached):
+        _source_line()
+    else:
+        master = _secret("Master password") if prompt else _source_line()
+        if master is None:
+            vault.close()
+            typer.echo(
+                "No master password to unlock with; give --password-fd or "
+                "--password-file, or unlock the vault in the agent",
+                err=True,
+            )
+            raise typer.Exit(code=2)
+        if not vault.unlock(master):
+            vault.close()
+            typer.echo("Invalid master password", err=True)
+            raise typer.Exit(code=1)
+    if vault.rekey_pending and not resume_rekey:
+        vault.close()
+        typer.echo("A rekey was interrupted; run `rekey` to finish it", err=True)
+        raise typer.Exit(code=1)
+    return vault
+
+
+_WORKERS_OPTION = typer.Option(
+    1, "--workers", "-j", min=1, help="Threads used to decrypt entries"
+)
+
+
+# Argon2 options shared by init and rekey.
+_TIME_COST_OPTION = typer.Option(None, "--time-cost", help="Argon2 passes")
+_MEMORY_OPTION = typer.Option(None, "--memory-mib", help="Argon2 memory in MiB")
+_PARALLELISM_OPTION = typer.Option(None, "--parallelism", help="Argon2 lanes")
+_CALIBRATE_OPTION = typer.Option(
+    False, "--calibrate", help="Benchmark this host to pick the Argon2 time cost"
+)
+_TARGET_MS_OPTION = typer.Option(
+    500, "--target-ms", help="Unlock time to aim for when calibrating"
+)
+_RECORD_FORMAT_HELP = "Entry layout: 1 = a blob per field, 2 = one blob per entry"
+
+
+def _kdf_params(
+    base: KdfParams,
+    time_cost: int,
+    memory_mib: int,
+    parallelism: int,
+    calibrate: bool,
+    target_ms: int,
+) -> KdfParams:
+    """Apply the Argon2 command-line options on top of base."""
+    memory_cost = memory_mib * 1024 if memory_mib else base.memory_cost
+    if calibrate:
+        from . import crypto
+
+        typer.echo("Calibrating Argon2 parameters...", err=True)
+        return crypto.calibrate_kdf(target_ms / 1000, memory_cost, parallelism)
+    return KdfParams(
+        time_cost or base.time_cost, memory_cost, parallelism or base.parallelism
+    )
+
+
+def _describe_kdf(kdf: KdfParams) -> str:
+    return (
+        f"time_cost={kdf.time_cost} memory={kdf.memory_cost // 1024}MiB "
+        f"parallelism={kdf.parallelism}"
+    )
+
+
+def _compile_policy(length: int, include_symbols: bool, policy: str):
+    """Compile --policy, or the policy --length and -s describe."""
+    from . import generator
+
+    try:
+        if policy is not None:
+            return generator.parse_policy(policy).compile()
+        return generator.PasswordPolicy.default(length, include_symbols).compile()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if policy is None:
+            raise
+        typer.echo(f"Invalid policy: {e}", err=True)
+        raise typer.Exit(code=2)
 
 
 @app.command()
-def init(db: str = typer.Option(None, "--db", help="Path to vault DB")):
+def init(
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    time_cost: int = _TIME_COST_OPTION,
+    memory_mib: int = _MEMORY_OPTION,
+    parallelism: int = _PARALLELISM_OPTION,
+    calibrate: bool = _CALIBRATE_OPTION,
+    target_ms: int = _TARGET_MS_OPTION,
+    record_format: int = typer.Option(
+        1, "--record-format", min=1, max=2, help=_RECORD_FORMAT_HELP
+    ),
+):
     """Initialize a new vault"""
+    from . import core, storage
+
     path = storage.resolve_db_path(db)
-    master = typer.prompt(
-        "Choose a master password", hide_input=True, confirmation_prompt=True
+    kdf = _kdf_params(
+        KdfParams(),
+        time_cost,
+        memory_mib,
+        parallelism,
+        calibrate,
+        target_ms,
     )
-    core.init_vault(path, master)
+    master = _secret("Choose a master password", confirm=True)
+    core.Vault.create(path, master, kdf, record_format).close()
     typer.echo(f"Initialized vault at {path}")
 
 
+@app.command()
+def calibrate(
+    target_ms: int = typer.Option(500, "--target-ms", help="Unlock time to aim for"),
+    memory_mib: int = typer.Option(
+        KdfParams().memory_cost // 1024,
+        "--memory-mib",
+        help="Argon2 memory in MiB",
+    ),
+    parallelism: int = typer.Option(
+        None, "--parallelism", help="Argon2 lanes (default: CPU count)"
+    ),
+):
+    """Pick Argon2 settings that unlock in about --target-ms on this host"""
+    from . import crypto
+
+    kdf = crypto.calibrate_kdf(target_ms / 1000, memory_mib * 1024, parallelism)
+    typer.echo(_describe_kdf(kdf))
+    typer.echo(
+        f"Use with: --time-cost {kdf.time_cost} --memory-mib "
+        f"{kdf.memory_cost // 1024} --parallelism {kdf.parallelism}"
+    )
+
+
+@app.command()
+def rekey(
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    time_cost: int = _TIME_COST_OPTION,
+    memory_mib: int = _MEMORY_OPTION,
+    parallelism: int = _PARALLELISM_OPTION,
+    calibrate: bool = _CALIBRATE_OPTION,
+    target_ms: int = _TARGET_MS_OPTION,
+    record_format: int = typer.Option(
+        None,
+        "--record-format",
+        min=1,
+        max=2,
+        help=_RECORD_FORMAT_HELP + " (default: keep the current one)",
+    ),
+):
+    """Re-encrypt the vault under a new master password and/or Argon2 settings"""
+    from . import agent
+
+    with _open_vault(db, resume_rekey=True) as vault:
+        if vault.rekey_pending:
+            # The new key, settings and layout were fixed when it started.
+            typer.echo("Resuming the interrupted rekey", err=True)
+            master = _secret("New master password")
+            try:
+                count = vault.rekey(master)
+            except ValueError as e:
+                typer.echo(str(e), err=True)
+                raise typer.Exit(code=1)
+        else:
+            kdf = _kdf_params(
+                vault.kdf_params(),
+                time_cost,
+                memory_mib,
+                parallelism,
+                calibrate,
+                target_ms,
+            )
+            master = _secret("New master password", confirm=True)
+            count = vault.rekey(master, kdf, record_format=record_format)
+        kdf = vault.kdf_params()
+    # Any key the agent holds for this vault is now useless.
+    try:
+        agent.lock(vault.db_path)
+    except agent.AgentError:
+        pass
+    typer.echo(f"Re-encrypted {count} entries ({_describe_kdf(kdf)})")
+
+
 @app.command()
 def add(
     service: str = typer.Argument(...),
@@ -24,31 +374,124 @@ def add(
     notes: str = typer.Option(None, "--notes"),
 ):
     """Add a credential"""
-    path = storage.resolve_db_path(db)
-    master = typer.prompt("Master password", hide_input=True)
-    key = core.unlock_vault(path, master)
-    if not key:
-        typer.echo("Invalid master password", err=True)
-        raise typer.Exit(code=1)
-    pwd = typer.prompt("Password", hide_input=True)
-    entry_id = core.add_entry(path, key, service, username, pwd, notes)
+    with _open_vault(db) as vault:
+        pwd = _secret("Password")
+        entry_id = vault.add_entry(service, username, pwd, notes)
     typer.echo(entry_id)
 
 
 @app.command()
-def get(entry_id: str, db: str = typer.Option(None, "--db", help="Path to vault DB")):
-    """Get a credential by ID"""
-    path = storage.resolve_db_path(db)
-    master = typer.prompt("Master password", hide_input=True)
-    key = core.unlock_vault(path, master)
-    if not key:
-        typer.echo("Invalid master password", err=True)
-        raise typer.Exit(code=1)
-    ent = core.get_entry(path, key, entry_id)
-    if not ent:
+def get(
+    entry_ids: List[str] = typer.Argument(None, help="Entry ids"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    ids_from: str = typer.Option(
+        None, "--ids-from", help="Also read ids, one per line, from a file or -"
+    ),
+    fmt: str = _OUTPUT_FORMAT_OPTION,
+    workers: int = _WORKERS_OPTION,
+):
+    """Get credentials by ID, unlocking once for all of them"""
+    _check_output_format(fmt)
+    if not entry_ids and ids_from is None:
+        typer.echo("Give at least one entry id", err=True)
+        raise typer.Exit(code=2)
+    missing = []
+    with _open_vault(db, workers) as vault:
+        ids = [*(entry_ids or ())]
+        if ids_from is not None:
+            # Read after unlocking: with --password-stdin the first line of
+            # stdin is the master password.
+            if ids_from == "-":
+                ids.extend(line.strip() for line in sys.stdin if line.strip())
+            else:
+                with open(ids_from, encoding="utf-8") as f:
+                    ids.extend(line.strip() for line in f if line.strip())
+
+        def found():
+            for entry_id, ent in zip(ids, vault.get_entries(ids)):
+                if ent is None:
+                    missing.append(entry_id)
+                else:
+                    yield ent
+
+        if fmt == "text":
+            for ent in found():
+                typer.echo(ent)
+        else:
+            _write_rows(found(), fmt)
+    for entry_id in missing:
+        typer.echo(f"Not found: {entry_id}", err=True)
+    if missing:
+        raise typer.Exit(code=2)
+
+
+@app.command()
+def update(
+    entry_id: str,
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    service: str = typer.Option(None, "--service", help="New service name"),
+    username: str = typer.Option(None, "--username", help="New username"),
+    password: bool = typer.Option(
+        False, "--password", help="Prompt for a new password"
+    ),
+    notes: str = typer.Option(None, "--notes", help='New notes ("" clears them)'),
+):
+    """Change fields of a credential"""
+    if service is None and username is None and notes is None and not password:
+        typer.echo("Nothing to update", err=True)
+        raise typer.Exit(code=2)
+    with _open_vault(db) as vault:
+        pwd = _secret("Password") if password else None
+        try:
+            found = vault.update_entry(entry_id, service, username, pwd, notes)
+        except ValueError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=2)
+    if not found:
+        typer.echo("Not found", err=True)
+        raise typer.Exit(code=2)
+    typer.echo(f"Updated {entry_id}")
+
+
+@app.command()
+def rotate(
+    entry_id: str,
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    length: int = typer.Option(20, "--length", "-l", help="Length of the password"),
+    include_symbols: bool = typer.Option(
+        False, "--include-symbols", "-s", help="Include symbols (@#$%) in the password"
+    ),
+    policy: str = typer.Option(
+        None,
+        "--policy",
+        help="JSON policy, inline or a file path; overrides --length and -s",
+    ),
+):
+    """Replace a credential's password with a newly generated one"""
+    pwd = _compile_policy(length, include_symbols, policy).generate()
+    with _open_vault(db) as vault:
+        found = vault.update_entry(entry_id, password=pwd)
+    if not found:
+        typer.echo("Not found", err=True)
+        raise typer.Exit(code=2)
+    typer.echo(f"New password: {pwd}")
+
+
+@app.command()
+def delete(
+    entry_id: str,
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="Do not ask to confirm"),
+):
+    """Delete a credential"""
+    with _open_vault(db) as vault:
+        if not yes and not typer.confirm(f"Delete {entry_id}?"):
+            raise typer.Exit(code=1)
+        found = vault.delete_entry(entry_id)
+    if not found:
         typer.echo("Not found", err=True)
         raise typer.Exit(code=2)
-    typer.echo(ent)
+    typer.echo(f"Deleted {entry_id}")
 
 
 @app.command()
@@ -57,38 +500,421 @@ def list(
     preview: bool = typer.Option(
         False, "--preview", help="Show encrypted fields without decryption"
     ),
+    workers: int = _WORKERS_OPTION,
+    limit: int = typer.Option(
+        None, "--limit", "-n", min=1, help="Show at most this many entries"
+    ),
+    after: str = typer.Option(
+        None, "--after", help="Continue after this entry id (newest first)"
+    ),
+    fmt: str = _OUTPUT_FORMAT_OPTION,
+    since: str = typer.Option(
+        None, "--since", help="Only entries created at or after this UTC time"
+    ),
+    modified_since: str = typer.Option(
+        None,
+        "--modified-since",
+        help="Only entries changed at or after this UTC time",
+    ),
 ):
     """List entries"""
-    path = storage.resolve_db_path(db)
-    master = typer.prompt("Master password", hide_input=True)
-    key = core.unlock_vault(path, master)
-    if not key:
-        typer.echo("Invalid master password", err=True)
-        raise typer.Exit(code=1)
+    from . import storage
+
+    _check_output_format(fmt)
+    try:
+        since, modified_since = (
+            storage.to_micros(t) if t is not None else None
+            for t in (since, modified_since)
+        )
+    except ValueError as e:
+        typer.echo(f"Invalid time: {e}", err=True)
+        raise typer.Exit(code=2)
+    with _open_vault(db, workers) as vault:
+        last_id = None
+        try:
+            if preview:
+                rows = vault.iter_entries_preview(
+                    limit, after, since=since, modified_since=modified_since
+                )
+                fields = _PREVIEW_FIELDS
+            else:
+                rows = vault.iter_entries_decrypted(
+                    limit, after, since=since, modified_since=modified_since
+                )
+                fields = _LIST_FIELDS
+            if fmt != "text":
+
+                def tracked():
+                    nonlocal last_id
+                    for r in rows:
+                        last_id = r["id"]
+                        yield r
+
+                _write_rows(tracked(), fmt, fields)
+            elif preview:
+                # Show encrypted output
+                for r in rows:
+                    if r["record"]:
+                        typer.echo(f"{r['id']}  record={r['record'][:16]}...")
+                    else:
+                        typer.echo(
+                            f"{r['id']}  service={r['service'][:16]}...  username={r['username'][:16]}..."
+                        )
+                    last_id = r["id"]
+            else:
+                # Show decrypted output
+                for r in rows:
+                    typer.echo(f"{r['id']}  {r['service']}  {r['username']}")
+                    last_id = r["id"]
+        except ValueError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=2)
+    if limit is not None and last_id is not None:
+        typer.echo(f"Next page: --after {last_id}", err=True)
 
-    if preview:
-        rows = core.list_entries_preview(path)
-        # Show encrypted output
+
+@app.command()
+def find(
+    service: str = typer.Option(None, "--service", "-s", help="Exact service name"),
+    username: str = typer.Option(None, "--username", "-u", help="Exact username"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    fmt: str = _OUTPUT_FORMAT_OPTION,
+):
+    """Find credentials by exact service and/or username"""
+    _check_output_format(fmt)
+    if service is None and username is None:
+        typer.echo("Give --service and/or --username", err=True)
+        raise typer.Exit(code=2)
+    with _open_vault(db) as vault:
+        rows = vault.find_entries(service=service, username=username)
+    if fmt != "text":
+        _write_rows(rows, fmt, _LIST_FIELDS)
+    if not rows:
+        typer.echo("Not found", err=True)
+        raise typer.Exit(code=2)
+    if fmt == "text":
         for r in rows:
-            typer.echo(
-                f"{r['id']}  service={r['service'][:16]}...  username={r['username'][:16]}..."
-            )
-    else:
-        rows = core.list_entries_decrypted(path, key)
-        # Show decrypted output
+            typer.echo(f"{r['id']}  {r['service']}  {r['username']}")
+
+
+@app.command()
+def search(
+    query: str = typer.Argument(..., help="Words to look for"),
+    limit: int = typer.Option(20, "--limit", "-n", help="Most results to show"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    fmt: str = _OUTPUT_FORMAT_OPTION,
+):
+    """Fuzzy-search service, username and notes, best matches first"""
+    _check_output_format(fmt)
+    with _open_vault(db) as vault:
+        rows = vault.search(query, limit)
+    if fmt != "text":
+        _write_rows(rows, fmt, _SEARCH_FIELDS)
+    if not rows:
+        typer.echo("Not found", err=True)
+        raise typer.Exit(code=2)
+    if fmt == "text":
         for r in rows:
             typer.echo(f"{r['id']}  {r['service']}  {r['username']}")
 
 
+@app.command("import")
+def import_entries(
+    source: str = typer.Argument(..., help="File to read, or - for stdin"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    fmt: str = typer.Option(
+        None, "--format", help="csv, json or jsonl (default: from file suffix)"
+    ),
+    batch_size: int = typer.Option(
+        None, "--batch-size", help="Rows per executemany() batch (default: 1000)"
+    ),
+):
+    """Import credentials from a CSV, JSON or JSON Lines file"""
+    from . import core, transfer
+
+    path = None if source == "-" else Path(source)
+    try:
+        fmt = transfer.detect_format(path, fmt)
+    except ValueError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=2)
+    with _open_vault(db) as vault:
+        stream = sys.stdin if path is None else open(path, newline="", encoding="utf-8")
+        try:
+            count = vault.import_entries(
+                transfer.read_entries(stream, fmt),
+                batch_size=batch_size or core.IMPORT_BATCH_SIZE,
+            )
+        except (ValueError, KeyError) as e:
+            typer.echo(f"Import failed, nothing was stored: {e}", err=True)
+            raise typer.Exit(code=2)
+        finally:
+            if path is not None:
+                stream.close()
+    typer.echo(f"Imported {count} entries", err=True)
+
+
+@app.command()
+def export(
+    dest: str = typer.Argument("-", help="File to write, or - for stdout"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    fmt: str = typer.Option(
+        None, "--format", help="csv, json or jsonl (default: from file suffix)"
+    ),
+    workers: int = _WORKERS_OPTION,
+):
+    """Export all credentials, decrypted, as CSV, JSON or JSON Lines"""
+    from . import storage, transfer
+
+    path = None if dest == "-" else Path(dest)
+    try:
+        fmt = transfer.detect_format(path, fmt)
+    except ValueError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=2)
+    with _open_vault(db, workers) as vault:
+        if path is None:
+            count = transfer.write_entries(sys.stdout, vault.export_entries(), fmt)
+        else:
+            # Created owner-only, so the plaintext is never readable by others;
+            # a file that already existed keeps its mode until the chmod.
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as stream:
+                storage.set_file_permissions(path)
+                count = transfer.write_entries(stream, vault.export_entries(), fmt)
+    typer.echo(f"Exported {count} entries", err=True)
+
+
+@app.command()
+def sync(
+    peer: str = typer.Argument(None, help="Another copy of the vault to sync with"),
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    remote: str = typer.Option(
+        None,
+        "--remote",
+        help="Command that runs `sync --serve` by the other copy, e.g. over ssh",
+    ),
+    serve: bool = typer.Option(
+        False, "--serve", help="Answer a `sync --remote` client on stdin/stdout"
+    ),
+):
+    """Exchange changes with another copy of the vault"""
+    import shlex
+    import subprocess
+
+    from . import core
+    from . import sync as sync_module
+
+    if (peer is not None) + (remote is not None) + serve != 1:
+        typer.echo("Give exactly one of PEER, --remote and --serve", err=True)
+        raise typer.Exit(code=2)
+    if serve and "stdin" in _password_source:
+        typer.echo(
+            "--serve reads the sync from stdin; use --password-fd or --password-file",
+            err=True,
+        )
+        raise typer.Exit(code=2)
+    if peer is not None and not Path(peer).exists():
+        typer.echo(f"No vault at {peer}", err=True)
+        raise typer.Exit(code=2)
+    # The master password prompt would read the client's sync messages.
+    with _open_vault(db, prompt=not serve) as vault:
+        try:
+            if serve:
+                report = sync_module.serve(vault, sys.stdin, sys.stdout)
+            elif remote is not None:
+                proc = subprocess.Popen(
+                    shlex.split(remote),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                    encoding="utf-8",
+                )
+                try:
+                    report = sync_module.sync_stream(vault, proc.stdout, proc.stdin)
+                finally:
+                    proc.stdin.close()
+                    proc.wait()
+            else:
+                with core.Vault(Path(peer)) as other:
+                    if not other.unlock_with_key(vault.key):
+                        raise ValueError(
+                            "The vaults do not share a key; "
+                            "only copies of one vault can be synced"
+                        )
+                    report = sync_module.sync_vaults(vault, other)
+        except (ValueError, RuntimeError, ConnectionError, OSError) as e:
+            typer.echo(f"Sync failed: {e}", err=True)
+            raise typer.Exit(code=1)
+    typer.echo(
+        f"Received {report.received} changes ({report.applied} applied), "
+        f"sent {report.sent} ({report.peer_applied} applied)",
+        err=True,
+    )
+
+
+@app.command()
+def maintain(
+    db: str = typer.Option(None, "--db", help="Path to vault DB"),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Rewrite the whole file with VACUUM (blocks writers while it runs)",
+    ),
+):
+    """Vacuum, checkpoint the WAL, ANALYZE and check the vault's integrity"""
+    from . import storage
+
+    path = storage.resolve_db_path(db)
+    if not path.exists():
+        typer.echo(f"No vault at {path}", err=True)
+        raise typer.Exit(code=2)
+    report = storage.run_maintenance(path, full)
+    mib = 1024 * 1024
+    typer.echo(
+        f"Pages: {report.page_count} x {report.page_size} bytes "
+        f"({report.page_count * report.page_size / mib:.1f} MiB), "
+        f"{report.free_pages} free, {report.pages_vacuumed} reclaimed"
+    )
+    typer.echo(f"Auto-vacuum: {report.auto_vacuum}")
+    if report.auto_vacuum != "incremental":
+        typer.echo("Run `maintain --full` once to enable incremental vacuum")
+    busy = " (readers active, not fully checkpointed)" if report.checkpoint_busy else ""
+    typer.echo(f"WAL: {report.wal_bytes} bytes{busy}")
+    if report.changes_pruned:
+        typer.echo(f"Superseded sync log rows pruned: {report.changes_pruned}")
+    for table, rows in report.row_counts.items():
+        typer.echo(f"Rows in {table}: {rows}")
+    typer.echo(f"Integrity: {'; '.join(report.integrity)}")
+    if not report.ok:
+        raise typer.Exit(code=1)
+
+
 @app.command()
 def generate(
     length: int = typer.Option(20, "--length", "-l", help="Length of the password"),
     include_symbols: bool = typer.Option(
         False, "--include-symbols", "-s", help="Include symbols (@#$%) in the password"
     ),
+    count: int = typer.Option(
+        None,
+        "--count",
+        "-n",
+        min=1,
+        help="Print this many passwords, one per line, without the label",
+    ),
+    policy: str = typer.Option(
+        None,
+        "--policy",
+        help="JSON policy, inline or a file path; overrides --length and -s",
+    ),
 ):
     """Generate a strong, random password."""
-    password = crypto.generate_strong_password(
-        length=length, include_symbols=include_symbols
+    compiled = _compile_policy(length, include_symbols, policy)
+    if policy is not None:
+        typer.echo(f"Entropy: {compiled.entropy_bits:.1f} bits", err=True)
+    if count is not None:
+        sys.stdout.writelines(f"{p}\n" for p in compiled.generate_many(count))
+        return
+    typer.echo(f"Generated password: {compiled.generate()}")
+
+
+@agent_app.command("start")
+def agent_start(
+    timeout: float = typer.Option(
+        None,
+        "--timeout",
+        help="Forget keys unused for this many seconds (default: 900)",
+    ),
+    foreground: bool = typer.Option(
+        False, "--foreground", help="Run in this process instead of detaching"
+    ),
+):
+    """Start the key agent"""
+    from . import agent
+
+    if timeout is None:
+        timeout = agent.DEFAULT_IDLE_TIMEOUT
+    try:
+        key_agent = agent.KeyAgent(idle_timeout=timeout)
+    except agent.AgentError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    if foreground:
+        typer.echo(f"Agent listening on {key_agent.sock_path}")
+        try:
+            key_agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    # The socket is bound before forking so it is usable as soon as we return.
+    if os.fork():
+        key_agent.detach()
+        typer.echo(f"Agent listening on {key_agent.sock_path}")
+        return
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        key_agent.serve_forever()
+    finally:
+        os._exit(0)
+
+
+@agent_app.command("stop")
+def agent_stop():
+    """Stop the key agent, forgetting all keys"""
+    from . import agent
+
+    try:
+        agent.stop()
+    except agent.AgentError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    typer.echo("Agent stopped")
+
+
+@agent_app.command("status")
+def agent_status():
+    """Show whether the agent is running"""
+    from . import agent
+
+    try:
+        resp = agent.request("ping")
+    except agent.AgentError:
+        typer.echo("Agent not running")
+        raise typer.Exit(code=1)
+    typer.echo(
+        f"Agent running at {agent.socket_path()}, {resp['vaults']} vault(s) unlocked"
     )
-    typer.echo(f"Generated password: {password}")
+
+
+@agent_app.command("unlock")
+def agent_unlock(db: str = typer.Option(None, "--db", help="Path to vault DB")):
+    """Unlock a vault and hand its key to the agent"""
+    from . import agent
+
+    if not agent.is_running():
+        typer.echo("Agent not running; start it with `agent start`", err=True)
+        raise typer.Exit(code=1)
+    with _open_vault(db) as vault:
+        agent.add_key(vault.db_path, vault.key)
+    typer.echo(f"Unlocked {vault.db_path}")
+
+
+@agent_app.command("lock")
+def agent_lock(
+    db: str = typer.Option(
+        None, "--db", help="Vault to lock (default: every vault the agent holds)"
+    ),
+):
+    """Make the agent forget a vault key (or all of them)"""
+    from . import agent, storage
+
+    try:
+        agent.lock(storage.resolve_db_path(db) if db else None)
+    except agent.AgentError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    typer.echo("Locked")
@@ -1,28 +1,999 @@
+import itertools
+import json
+import os
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, List
+from typing import Iterable, Iterator, Optional, List, Union
 
-from . import crypto, storage
+from . import crypto, generator, storage, trace
+from .backends import EntryStore
+from .cache import EntryCache
+from .models import Entry, KdfParams, RekeyProgress
+from .search import SearchIndex
 
+# sqlite3 caches prepared statements per connection keyed by SQL text, so a
+# long-lived Vault reuses these without re-parsing them on every call.
+_INSERT_ENTRY_SQL = "INSERT INTO entries(id, service, username, password, notes, record, created_at, updated_at, service_idx, username_idx) VALUES(?,?,?,?,?,?,?,?,?,?)"
 
-def init_vault(db_path: Path, master_password: str) -> None:
-    import os
+# Rows encrypted and handed to the entry store at a time by import_entries().
+IMPORT_BATCH_SIZE = 1000
 
-    salt = os.urandom(16)
-    master_hash = crypto.hash_master_password(master_password)
-    storage.initialize_db(db_path, salt, master_hash)
+# Rows fetched (and decrypted) per page when iterating the entry list.
+LIST_PAGE_SIZE = 500
+
+# Results returned by Vault.search() unless asked for more or fewer.
+SEARCH_LIMIT = 20
+
+# Logged search index changes a session applies before it folds them into a
+# freshly stored index, which keeps the log (and session start-up) short.
+SEARCH_LOG_LIMIT = 1000
+
+# Associated data binding the search index and its log entries to their role.
+_SEARCH_INDEX_AAD = b"search-index"
+_SEARCH_LOG_AAD = b"search-log"
+
+# Entry layouts: 1 encrypts service, username, password and notes separately;
+# 2 packs them into one AES-GCM record with the entry id as associated data,
+# which saves three nonces, three tags and three AEAD calls per row. Format 2
+# is opt-in per vault; readers accept both, so a vault converted by rekey
+# reads the same before and after.
+RECORD_FORMATS = (1, 2)
+DEFAULT_RECORD_FORMAT = 1
+
+_REKEY_PENDING = "A rekey is unfinished; run rekey again to finish it"
+
+
+def _seal_fields(
+    cipher, entry_id: str, fields: List[Optional[bytes]], record_format: int
+) -> tuple:
+    """Encrypt plaintext fields into (service, username, password, notes, record)."""
+    if record_format == 2:
+        return (None, None, None, None, crypto.encrypt_record(cipher, entry_id, fields))
+    encrypted = (
+        crypto.encrypt_with(cipher, f) if f is not None else None for f in fields
+    )
+    return (*encrypted, None)
+
+
+def _open_fields(cipher, entry_id: str, blobs: tuple, record) -> List[Optional[bytes]]:
+    """Decrypt one row's field columns, or its record, into plaintext fields."""
+    if record is not None:
+        return crypto.decrypt_record(cipher, entry_id, record)[: len(blobs)]
+    return [crypto.decrypt_with(cipher, b) if b is not None else None for b in blobs]
+
+
+def _reencrypt_row(
+    row: tuple, old_cipher, new_cipher, new_index_key: bytes, record_format: int
+) -> tuple:
+    """Re-encrypt an entry row, and its blind indexes, under the new key."""
+    id_ = row[0]
+    plain = _open_fields(old_cipher, id_, row[1:5], row[5])
+    service, username = plain[0].decode("utf-8"), plain[1].decode("utf-8")
+    return (
+        id_,
+        *_seal_fields(new_cipher, id_, plain, record_format),
+        row[6],
+        row[7],
+        crypto.blind_index(new_index_key, "service", service),
+        crypto.blind_index(new_index_key, "username", username),
+    )
+
+
+def _log_change(entry_id: str, op: str) -> tuple:
+    """A statement appending a local put or del of entry_id to the change log."""
+    return storage.LOG_CHANGE_SQL, (entry_id, op, storage.now_micros())
+
+
+def _apply_search_change(index: SearchIndex, change: list) -> None:
+    op, entry_id, *args = change
+    if op == "put":
+        index.put(entry_id, *args)
+    elif op == "patch":
+        index.patch(entry_id, *args)
+    else:
+        index.remove(entry_id)
+
+
+def _entry_dict(row: tuple, fields: List[Optional[bytes]]) -> dict:
+    """Build an entry dict from an entry row and its plaintext fields."""
+    service, username, password, notes = fields
+    return {
+        "id": row[0],
+        "service": service.decode("utf-8"),
+        "username": username.decode("utf-8"),
+        "password": password.decode("utf-8"),
+        "notes": notes.decode("utf-8") if notes else None,
+        "created_at": storage.micros_to_iso(row[6]),
+        "updated_at": storage.micros_to_iso(row[7]),
+    }
+
+
+class Vault:
+    """A session on one vault database.
+
+    The connection is opened once and reused for every operation; schema
+    setup only runs when the vault is created or needs migrating. Use it as a
+    context manager, and call unlock() (or pass a key) before touching entries.
+
+    Entry rows live in the database's entries table unless store, another
+    backends.EntryStore such as a LogEntryStore, is given; it is closed with
+    the vault. Metadata and the change and search logs stay in the database.
+    A store outside it does not take part in the database's transactions,
+    so a write that fails part-way keeps the rows it already stored.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        key: Optional[bytes] = None,
+        workers: int = 1,
+        cache_size: int = 0,
+        cache_ttl: Optional[float] = None,
+        busy_timeout: float = storage.BUSY_TIMEOUT,
+        group_commit: bool = False,
+        store: Optional[EntryStore] = None,
+    ):
+        if group_commit and store is not None:
+            raise ValueError("group_commit needs the vault's own entries table")
+        self.db_path = Path(db_path)
+        # Decrypted entries kept for repeated get_entry() calls; off by default.
+        self.cache = EntryCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self.conn = storage.open_connection(self.db_path, busy_timeout)
+        # Every entry row is read and written through this store.
+        self.entries = (
+            store if store is not None else storage.SqliteEntryStore(self.conn)
+        )
+        self.key = key
+        # Threads used to decrypt list/export batches; 1 means serial.
+        self.workers = workers
+        self._executor = None
+        # With group_commit, add_entry() goes through a writer shared by every
+        # session on this vault in the process, which batches commits.
+        self._writer = (
+            storage.acquire_writer(self.db_path, busy_timeout) if group_commit else None
+        )
+
+    @property
+    def key(self) -> Optional[bytes]:
+        return self._key
+
+    @key.setter
+    def key(self, key: Optional[bytes]) -> None:
+        # One AES-GCM context serves every encrypt/decrypt in the session.
+        self._key = key
+        self._cipher = crypto.new_cipher(key) if key is not None else None
+        self._index_key = (
+            crypto.derive_subkey(key, b"blind-index") if key is not None else None
+        )
+        self._blind_index_complete = False
+        self._record_format = None
+        # The decrypted search index, loaded by the first search(), and the
+        # log sequence numbers it is current to and was last stored at.
+        self._search = None
+        self._search_seq = self._search_base = 0
+        # Entries of an interrupted rekey are split between two keys; only
+        # rekey() may touch them until it has been run to completion. The
+        # key-check blob lets writes notice a rekey by another session.
+        self._key_check, self._rekey_pending = (
+            storage.fetch_key_state(self.conn) if key is not None else (None, False)
+        )
+        if self.cache is not None:
+            self.cache.clear()
+
+    @classmethod
+    def create(
+        cls,
+        db_path: Path,
+        master_password: str,
+        kdf: Optional[KdfParams] = None,
+        record_format: int = DEFAULT_RECORD_FORMAT,
+    ) -> "Vault":
+        """Initialize a new vault and return an unlocked session on it."""
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f"Unknown record format {record_format}")
+        kdf = kdf or crypto.DEFAULT_KDF_PARAMS
+        salt = os.urandom(16)
+        key = crypto.derive_key(master_password, salt, params=kdf)
+        vault = cls(db_path, key)
+        storage.insert_metadata(
+            vault.conn,
+            salt,
+            crypto.make_key_check(key),
+            kdf,
+            record_format=record_format,
+        )
+        vault.key = key
+        return vault
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._writer is not None:
+            storage.release_writer(self._writer)
+            self._writer = None
+        self.entries.close()
+        self.conn.close()
+
+    def __enter__(self) -> "Vault":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def unlocked(self) -> bool:
+        return self.key is not None
+
+    def unlock(self, master_password: str) -> bool:
+        """Derive the vault key and check it against the stored key-check blob.
+
+        Runs Argon2 once. Vaults created before the key-check format are
+        verified against their legacy PHC hash and upgraded on first unlock.
+        """
+        meta = storage.fetch_metadata(self.conn)
+        if not meta:
+            raise RuntimeError("Vault not initialized")
+        if meta.key_check is None:
+            if not crypto.verify_master_password(meta.master_hash, master_password):
+                return False
+            key = crypto.derive_key(master_password, meta.salt)
+            storage.update_key_check(self.conn, crypto.make_key_check(key))
+        else:
+            key = crypto.derive_key(master_password, meta.salt, params=meta.kdf)
+            if not crypto.verify_key_check(key, meta.key_check):
+                return False
+        self.key = key
+        return True
+
+    def unlock_with_key(self, key: bytes) -> bool:
+        """Unlock with an already-derived key (e.g. from the agent); no KDF runs."""
+        meta = storage.fetch_metadata(self.conn)
+        if not meta:
+            raise RuntimeError("Vault not initialized")
+        if meta.key_check is None or not crypto.verify_key_check(key, meta.key_check):
+            return False
+        self.key = key
+        return True
+
+    def kdf_params(self) -> KdfParams:
+        meta = storage.fetch_metadata(self.conn)
+        if not meta:
+            raise RuntimeError("Vault not initialized")
+        return meta.kdf
+
+    @property
+    def record_format(self) -> int:
+        """The layout new and rewritten entries are stored in."""
+        if self._record_format is None:
+            meta = storage.fetch_metadata(self.conn)
+            if not meta:
+                raise RuntimeError("Vault not initialized")
+            self._record_format = meta.record_format
+        return self._record_format
+
+    def rekey(
+        self,
+        new_master_password: str,
+        kdf: Optional[KdfParams] = None,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        record_format: Optional[int] = None,
+    ) -> int:
+        """Re-encrypt every entry under a new password and/or KDF settings.
+
+        A fresh salt is drawn and the new key derived with kdf (default: the
+        vault's current settings). Entries are rewritten in record_format
+        (default: the vault's current one), batch_size rows at a time in
+        ascending id order. Each batch commits together with a checkpoint, so
+        only one batch is held in memory and an interrupted rekey loses at
+        most that batch; the vault switches keys when the last one commits.
+
+        If a previous rekey was interrupted, this resumes it: the session must
+        be unlocked with the old key, new_master_password must be the one the
+        rekey was started with, and kdf and record_format are taken from the
+        checkpoint. Returns the number of entries re-encrypted by this call.
+        """
+        if self._cipher is None:
+            raise RuntimeError("Vault is locked")
+        old_cipher = self._cipher
+        progress = storage.fetch_rekey_progress(self.conn)
+        if progress is None:
+            kdf = kdf or self.kdf_params()
+            record_format = record_format or self.record_format
+            if record_format not in RECORD_FORMATS:
+                raise ValueError(f"Unknown record format {record_format}")
+            salt = os.urandom(16)
+            new_key = crypto.derive_key(new_master_password, salt, params=kdf)
+            progress = RekeyProgress(
+                salt, crypto.make_key_check(new_key), kdf, record_format
+            )
+            with storage.write_transaction(self.conn):
+                self._check_key(self.conn)
+                storage.start_rekey(self.conn, progress)
+            self._rekey_pending = True
+        else:
+            new_key = crypto.derive_key(
+                new_master_password, progress.salt, params=progress.kdf
+            )
+            if not crypto.verify_key_check(new_key, progress.key_check):
+                raise ValueError(
+                    "New master password does not match the interrupted rekey"
+                )
+        new_cipher = crypto.new_cipher(new_key)
+        new_index_key = crypto.derive_subkey(new_key, b"blind-index")
+
+        count = 0
+        last_id = progress.last_id
+        while True:
+            with storage.write_transaction(self.conn):
+                rows = self.entries.after(last_id, batch_size)
+                if not rows:
+                    storage.finish_rekey(self.conn, progress)
+                    break
+                with trace.span("aead"):
+                    rekeyed = [
+                        _reencrypt_row(
+                            row,
+                            old_cipher,
+                            new_cipher,
+                            new_index_key,
+                            progress.record_format,
+                        )
+                        for row in rows
+                    ]
+                self.entries.put_many(rekeyed)
+                last_id = rows[-1][0]
+                storage.advance_rekey(self.conn, last_id)
+            count += len(rows)
+        self.key = new_key
+        return count
+
+    @property
+    def rekey_pending(self) -> bool:
+        """Whether an interrupted rekey must be resumed before entries are used."""
+        return self._rekey_pending
+
+    def _require_cipher(self):
+        if self._cipher is None:
+            raise RuntimeError("Vault is locked")
+        if self._rekey_pending:
+            raise RuntimeError(_REKEY_PENDING)
+        return self._cipher
+
+    def _check_key(self, conn) -> None:
+        """Refuse a write unless the vault is still under this session's key.
+
+        Runs inside each write transaction, once begin_write() holds the
+        lock: a rekey another session started, or finished, after this one
+        was unlocked would otherwise get rows sealed with the old key.
+        """
+        key_check, rekey_pending = storage.fetch_key_state(conn)
+        if rekey_pending:
+            raise RuntimeError(_REKEY_PENDING)
+        if key_check != self._key_check:
+            raise RuntimeError(
+                "The vault was rekeyed by another session; unlock it again"
+            )
+
+    def _encrypt_entry(
+        self,
+        service: str,
+        username: str,
+        password: str,
+        notes: Optional[str],
+        created_at: Union[str, int, None] = None,
+        updated_at: Union[str, int, None] = None,
+    ) -> tuple:
+        """Build an entry row (new id, encrypted fields) for the entry store.
+
+        Timestamps are ISO 8601 strings or epoch microseconds; both default
+        to now, and updated_at to created_at when only that is given.
+        """
+        cipher = self._require_cipher()
+        now = storage.now_micros()
+        created = storage.to_micros(created_at) if created_at else now
+        updated = storage.to_micros(updated_at) if updated_at else created
+        entry_id = str(uuid.uuid4())
+        fields = [
+            service.encode("utf-8"),
+            username.encode("utf-8"),
+            password.encode("utf-8"),
+            notes.encode("utf-8") if notes else None,
+        ]
+        record_format = self.record_format
+        with trace.span("aead"):
+            sealed = _seal_fields(cipher, entry_id, fields, record_format)
+            service_idx = crypto.blind_index(self._index_key, "service", service)
+            username_idx = crypto.blind_index(self._index_key, "username", username)
+        return (entry_id, *sealed, created, updated, service_idx, username_idx)
+
+    def _search_change(self, *change) -> tuple:
+        """Encrypt a search index change as a statement for the search log."""
+        blob = crypto.encrypt_with(
+            self._cipher, json.dumps(change).encode("utf-8"), _SEARCH_LOG_AAD
+        )
+        return storage.LOG_SEARCH_CHANGE_SQL, (blob,)
+
+    def _encrypt_new_entry(
+        self, service: str, username: str, password: str, notes: Optional[str]
+    ) -> tuple:
+        """Build the row and search log change for add_entry()."""
+        row = self._encrypt_entry(service, username, password, notes)
+        return row, self._search_change("put", row[0], service, username, notes)
+
+    def _decrypt_entry(self, row: tuple) -> Entry:
+        """Decrypt an entry row as returned by the entry store."""
+        id_, *blobs, record, created_at, updated_at = row[:8]
+        with trace.span("aead"):
+            service, username, password, notes = _open_fields(
+                self._require_cipher(), id_, tuple(blobs), record
+            )
+        return Entry(
+            id=id_,
+            service=service.decode("utf-8"),
+            username=username.decode("utf-8"),
+            password=bytearray(password),
+            notes=bytearray(notes) if notes else None,
+            created_at=storage.micros_to_iso(created_at),
+            updated_at=storage.micros_to_iso(updated_at),
+        )
+
+    def add_entry(
+        self,
+        service: str,
+        username: str,
+        password: str,
+        notes: Optional[str],
+    ) -> str:
+        row, search_change = self._encrypt_new_entry(service, username, password, notes)
+        self._insert_row(row, search_change)
+        return row[0]
+
+    def _insert_row(self, row: tuple, search_change: tuple) -> None:
+        """Store one row and its search log change from _encrypt_new_entry()."""
+        statements = [search_change, _log_change(row[0], "put")]
+        if self._writer is not None:
+            self._writer.execute_group(
+                [self._check_key, (_INSERT_ENTRY_SQL, row), *statements]
+            )
+        else:
+            with storage.write_transaction(self.conn):
+                self._check_key(self.conn)
+                self.entries.put(row)
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+
+    def get_entry(self, entry_id: str):
+        self._require_cipher()
+        if self.cache is not None:
+            cached = self.cache.get(entry_id)
+            if cached is not None:
+                return cached.to_dict()
+        row = self._fetch_row(entry_id)
+        if not row:
+            return None
+        entry = self._decrypt_entry(row)
+        result = entry.to_dict()
+        if self.cache is not None:
+            self.cache.put(entry)
+        else:
+            entry.wipe()
+        return result
+
+    def _fetch_row(self, entry_id: str) -> Optional[tuple]:
+        """Read an entry's encrypted row for _decrypt_entry()."""
+        return self.entries.get(entry_id)
+
+    def invalidate(self, entry_id: str) -> None:
+        """Drop entry_id from the decrypted-entry cache after it changes."""
+        if self.cache is not None:
+            self.cache.invalidate(entry_id)
+
+    def update_entry(
+        self,
+        entry_id: str,
+        service: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> bool:
+        """Change the given fields of an entry; return False if it does not exist.
+
+        Fields left as None keep their value; notes="" clears the notes, but
+        service, username and password cannot be empty. In record format 1
+        only the changed columns (and, for service or username, their blind
+        index) are re-encrypted; a format 2 row has a single record, which is
+        opened and resealed. The row keeps its layout either way, updated_at
+        is set to now, and the row is stored back in place of the old one.
+        """
+        cipher = self._require_cipher()
+        for name, value in (
+            ("service", service),
+            ("username", username),
+            ("password", password),
+        ):
+            if value == "":
+                raise ValueError(f"The {name} cannot be empty")
+        changes = {
+            name: value
+            for name, value in (
+                ("service", service),
+                ("username", username),
+                ("password", password),
+                ("notes", notes),
+            )
+            if value is not None
+        }
+        if not changes:
+            raise ValueError("update_entry needs at least one field to change")
+        names = ("service", "username", "password", "notes")
+        with storage.write_transaction(self.conn):
+            self._check_key(self.conn)
+            row = self.entries.get(entry_id)
+            if row is None:
+                return False
+            row = list(row)
+            if row[5] is None:
+                for column, name in enumerate(names, 1):
+                    if name in changes:
+                        value = changes[name]
+                        row[column] = (
+                            crypto.encrypt_with(cipher, value.encode("utf-8"))
+                            if value
+                            else None
+                        )
+            else:
+                fields = crypto.decrypt_record(cipher, entry_id, row[5])
+                for i, name in enumerate(names):
+                    if name in changes:
+                        fields[i] = changes[name].encode("utf-8")
+                if not fields[3]:
+                    fields[3] = None
+                row[5] = crypto.encrypt_record(cipher, entry_id, fields)
+            for column, name in ((8, "service"), (9, "username")):
+                if name in changes:
+                    row[column] = crypto.blind_index(
+                        self._index_key, name, changes[name]
+                    )
+            row[7] = storage.now_micros()
+            self.entries.put(tuple(row))
+            searchable = {
+                name: changes[name]
+                for name in ("service", "username", "notes")
+                if name in changes
+            }
+            if searchable:
+                self.conn.execute(*self._search_change("patch", entry_id, searchable))
+            self.conn.execute(*_log_change(entry_id, "put"))
+        self.invalidate(entry_id)
+        return True
+
+    def rotate_entry(self, entry_id: str, policy=None) -> Optional[str]:
+        """Store a newly generated password for an entry and return it.
+
+        policy is a generator.PasswordPolicy or PassphrasePolicy (default:
+        20 characters of letters and digits). Returns None if the entry does
+        not exist.
+        """
+        self._require_cipher()
+        password = (policy or generator.PasswordPolicy()).compile().generate()
+        if not self.update_entry(entry_id, password=password):
+            return None
+        return password
+
+    def delete_entry(self, entry_id: str) -> bool:
+        """Remove an entry; return False if it did not exist."""
+        self._require_cipher()
+        with storage.write_transaction(self.conn):
+            self._check_key(self.conn)
+            deleted = self.entries.delete(entry_id)
+            if deleted:
+                self.conn.execute(*self._search_change("del", entry_id))
+                self.conn.execute(*_log_change(entry_id, "del"))
+        self.invalidate(entry_id)
+        return deleted
+
+    def import_entries(
+        self, entries: Iterable[dict], batch_size: int = IMPORT_BATCH_SIZE
+    ) -> int:
+        """Encrypt and insert entries in a single transaction; return the count.
+
+        entries is consumed lazily and stored batch_size rows at a time, so
+        memory stays bounded however many rows are imported.
+        Each entry needs service, username and password; notes, created_at and
+        updated_at are optional. Entries always get a fresh id. Nothing is
+        stored if any row fails, unless the vault's store is outside the
+        database.
+        """
+        self._require_cipher()
+        count = 0
+        with storage.write_transaction(self.conn):
+            self._check_key(self.conn)
+            indexed = storage.search_index_seq(self.conn) is not None
+            for batch in itertools.batched(entries, batch_size):
+                rows = [
+                    self._encrypt_entry(
+                        e["service"],
+                        e["username"],
+                        e["password"],
+                        e.get("notes") or None,
+                        e.get("created_at") or None,
+                        e.get("updated_at") or None,
+                    )
+                    for e in batch
+                ]
+                self.entries.put_many(rows)
+                self.conn.executemany(
+                    storage.LOG_CHANGE_SQL,
+                    [_log_change(row[0], "put")[1] for row in rows],
+                )
+                if indexed:
+                    self.conn.executemany(
+                        storage.LOG_SEARCH_CHANGE_SQL,
+                        [
+                            self._search_change(
+                                "put",
+                                row[0],
+                                e["service"],
+                                e["username"],
+                                e.get("notes") or None,
+                            )[1]
+                            for row, e in zip(rows, batch)
+                        ],
+                    )
+                count += len(rows)
+        return count
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[dict]:
+        """Rank entries whose service, username or notes resemble query.
+
+        Returns up to limit dicts with id, service, username and score, best
+        first (see search.SearchIndex.search()). The index is stored
+        encrypted in the vault: the first search of a session decrypts it,
+        or builds it from every entry if there is none yet, and later
+        searches only apply the changes logged since.
+        """
+        self._require_cipher()
+        with trace.span("search.load"):
+            index = self._search_index()
+        with trace.span("search.query"):
+            return index.search(query, limit)
+
+    def _search_index(self) -> SearchIndex:
+        cipher = self._cipher
+        while True:
+            with storage.read_snapshot(self.conn):
+                base = storage.search_index_seq(self.conn)
+                if base is not None:
+                    if self._search is None or base > self._search_seq:
+                        _seq, blob = storage.fetch_search_index(self.conn)
+                        self._search = SearchIndex.from_bytes(
+                            crypto.decrypt_with(cipher, blob, _SEARCH_INDEX_AAD)
+                        )
+                        self._search_seq = self._search_base = base
+                    log = storage.fetch_search_log(self.conn, self._search_seq)
+            if base is not None:
+                break
+            if self._build_search_index():
+                return self._search
+        for seq, blob in log:
+            change = json.loads(crypto.decrypt_with(cipher, blob, _SEARCH_LOG_AAD))
+            _apply_search_change(self._search, change)
+            self._search_seq = seq
+        if (
+            self._search_seq - self._search_base >= SEARCH_LOG_LIMIT
+            or self._search.needs_compaction
+        ):
+            with storage.write_transaction(self.conn):
+                self._check_key(self.conn)
+                self._store_search_index()
+        return self._search
+
+    def _build_search_index(self) -> bool:
+        """Index every entry and store the result; False if one appeared meanwhile."""
+        with storage.write_transaction(self.conn):
+            self._check_key(self.conn)
+            if storage.search_index_seq(self.conn) is not None:
+                return False
+            self._search = SearchIndex.build(
+                (e["id"], e["service"], e["username"], e["notes"])
+                for e in self.export_entries()
+            )
+            self._search_seq = storage.last_search_seq(self.conn)
+            self._store_search_index()
+        return True
+
+    def _store_search_index(self) -> None:
+        """Write the session's index back to the vault. Does not commit."""
+        if self._search.needs_compaction:
+            self._search = self._search.compacted()
+        blob = crypto.encrypt_with(
+            self._cipher, self._search.to_bytes(), _SEARCH_INDEX_AAD
+        )
+        storage.store_search_index(self.conn, self._search_seq, blob)
+        self._search_base = self._search_seq
+
+    def _decrypt_rows(
+        self, rows: List[tuple], skip_errors: bool = False
+    ) -> List[Optional[List[Optional[bytes]]]]:
+        """Decrypt a batch of (id, field blobs, record) rows to plaintext fields.
+
+        Format 1 rows yield one plaintext per field blob; format 2 rows open
+        their record and yield as many leading fields. Runs across the worker
+        threads when workers > 1. With skip_errors, a row whose fields fail to
+        authenticate comes back as None.
+        """
+        cipher = self._require_cipher()
+        if self.workers > 1 and self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers)
+        blobs, aads = [], []
+        for id_, fields, record in rows:
+            if record is None:
+                blobs.extend(fields)
+                aads.extend([None] * len(fields))
+            else:
+                blobs.append(record)
+                aads.append(id_.encode())
+        with trace.span("aead"):
+            plain = crypto.decrypt_many(
+                cipher,
+                blobs,
+                self._executor,
+                skip_errors=skip_errors,
+                associated_data=aads,
+            )
+        result = []
+        pos = 0
+        for _id, fields, record in rows:
+            if record is None:
+                values = plain[pos : pos + len(fields)]
+                pos += len(fields)
+                # Service and username are never absent, so None means failure.
+                if values[0] is None or values[1] is None:
+                    values = None
+            else:
+                opened = plain[pos]
+                pos += 1
+                values = None
+                if opened is not None:
+                    values = crypto.unpack_fields(opened)[: len(fields)]
+            result.append(values)
+        return result
+
+    def export_entries(self, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[dict]:
+        """Yield every entry fully decrypted, oldest first.
+
+        Rows are read and decrypted batch_size at a time, so memory does not
+        grow with the vault.
+        """
+        self._require_cipher()
+        for rows in itertools.batched(self.entries.scan(), batch_size):
+            plain = self._decrypt_rows([(r[0], r[1:5], r[5]) for r in rows])
+            for r, fields in zip(rows, plain):
+                yield _entry_dict(r, fields)
+
+    def get_entries(
+        self, entry_ids: Iterable[str], batch_size: int = LIST_PAGE_SIZE
+    ) -> Iterator[Optional[dict]]:
+        """Yield the entry for each id in entry_ids, or None where there is none.
+
+        Ids are looked up batch_size at a time with one IN query per batch,
+        and each batch is decrypted together (across the worker threads when
+        workers > 1), so many entries cost far less than a get_entry() call
+        each. Results follow the order of entry_ids; the cache is bypassed.
+        """
+        self._require_cipher()
+        for batch in itertools.batched(entry_ids, batch_size):
+            unique = [*dict.fromkeys(batch)]
+            rows = self.entries.get_many(unique)
+            plain = self._decrypt_rows([(r[0], r[1:5], r[5]) for r in rows])
+            found = {r[0]: _entry_dict(r, fields) for r, fields in zip(rows, plain)}
+            for entry_id in batch:
+                yield found.get(entry_id)
+
+    def _backfill_blind_index(self, batch_size: int = IMPORT_BATCH_SIZE) -> None:
+        """Fill in blind-index columns for rows written before they existed."""
+        if self._blind_index_complete:
+            return
+        self._require_cipher()
+        # Check before taking the write lock; nearly every vault is complete.
+        if not self.entries.unindexed(1):
+            self._blind_index_complete = True
+            return
+        with storage.write_transaction(self.conn):
+            self._check_key(self.conn)
+            while True:
+                rows = self.entries.unindexed(batch_size)
+                if not rows:
+                    break
+                plain = self._decrypt_rows([(r[0], r[1:3], r[5]) for r in rows])
+                self.entries.put_many(
+                    (
+                        *r[:8],
+                        crypto.blind_index(
+                            self._index_key, "service", service.decode("utf-8")
+                        ),
+                        crypto.blind_index(
+                            self._index_key, "username", username.decode("utf-8")
+                        ),
+                    )
+                    for r, (service, username) in zip(rows, plain)
+                )
+        self._blind_index_complete = True
+
+    def find_entries(
+        self, service: Optional[str] = None, username: Optional[str] = None
+    ) -> List[dict]:
+        """Return entries whose service and/or username match exactly.
+
+        Resolved with an index seek on the blind-index columns; only the
+        matching rows are decrypted.
+        """
+        if service is None and username is None:
+            raise ValueError("find_entries needs a service or a username")
+        self._require_cipher()
+        self._backfill_blind_index()
+
+        rows = self.entries.find(
+            (
+                crypto.blind_index(self._index_key, "service", service)
+                if service is not None
+                else None
+            ),
+            (
+                crypto.blind_index(self._index_key, "username", username)
+                if username is not None
+                else None
+            ),
+        )
+        plain = self._decrypt_rows([(r[0], r[1:3], r[5]) for r in rows])
+        result = []
+        for r, (row_service, row_username) in zip(rows, plain):
+            row_service = row_service.decode("utf-8")
+            row_username = row_username.decode("utf-8")
+            # Guard against (astronomically unlikely) HMAC collisions.
+            if service is not None and row_service != service:
+                continue
+            if username is not None and row_username != username:
+                continue
+            result.append(
+                {
+                    "id": r[0],
+                    "service": row_service,
+                    "username": row_username,
+                    "created_at": storage.micros_to_iso(r[6]),
+                    "updated_at": storage.micros_to_iso(r[7]),
+                }
+            )
+        return result
+
+    def _iter_list_pages(
+        self,
+        limit: Optional[int],
+        after: Optional[str],
+        page_size: int,
+        since: Optional[storage.Timestamp] = None,
+        modified_since: Optional[storage.Timestamp] = None,
+    ) -> Iterator[List[tuple]]:
+        """Yield pages of entry rows, newest first, resuming after entry id after."""
+        if after is not None:
+            row = self.entries.get(after)
+            if not row:
+                raise ValueError(f"Unknown entry id {after!r}")
+            cursor = (row[6], after)
+        else:
+            cursor = None
+        since, modified_since = (
+            storage.to_micros(t) if t is not None else None
+            for t in (since, modified_since)
+        )
+        remaining = limit
+        while remaining is None or remaining > 0:
+            n = page_size if remaining is None else min(page_size, remaining)
+            rows = self.entries.page(n, cursor, since, modified_since)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < n:
+                return
+            cursor = (rows[-1][6], rows[-1][0])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def iter_entries_preview(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        page_size: int = LIST_PAGE_SIZE,
+        since: Optional[storage.Timestamp] = None,
+        modified_since: Optional[storage.Timestamp] = None,
+    ) -> Iterator[dict]:
+        """Yield entries newest first with encrypted service/username (no decryption).
+
+        At most limit entries are produced, starting after the entry whose id
+        is after; pass the last id seen to fetch the next page. Entries in
+        record format 2 have no separate service/username blobs and carry the
+        whole record instead.
+
+        since and modified_since (ISO 8601 strings, naive meaning UTC, or
+        epoch microseconds) keep only entries created, or last changed, at or
+        after that time. Both are range seeks on an index; pass the time of
+        the previous run as modified_since to fetch only what changed.
+        """
+        for rows in self._iter_list_pages(
+            limit, after, page_size, since, modified_since
+        ):
+            for r in rows:
+                yield {
+                    "id": r[0],
+                    "service": r[1].hex() if r[1] else None,
+                    "username": r[2].hex() if r[2] else None,
+                    "record": r[5].hex() if r[5] else None,
+                    "created_at": storage.micros_to_iso(r[6]),
+                    "updated_at": storage.micros_to_iso(r[7]),
+                    "encrypted": True,
+                }
+
+    def iter_entries_decrypted(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        page_size: int = LIST_PAGE_SIZE,
+        since: Optional[storage.Timestamp] = None,
+        modified_since: Optional[storage.Timestamp] = None,
+    ) -> Iterator[dict]:
+        """Yield entries newest first with decrypted service/username.
+
+        Pages of page_size rows are fetched by keyset and decrypted as they
+        are consumed, so the first entry is available without reading the
+        whole table. limit, after, since and modified_since work as in
+        iter_entries_preview(). Entries that fail to decrypt are skipped.
+        """
+        self._require_cipher()
+        for rows in self._iter_list_pages(
+            limit, after, page_size, since, modified_since
+        ):
+            plain = self._decrypt_rows(
+                [(r[0], r[1:3], r[5]) for r in rows], skip_errors=True
+            )
+            for r, fields in zip(rows, plain):
+                if fields is None:
+                    # Decryption failed, skip
+                    continue
+                service, username = fields
+                yield {
+                    "id": r[0],
+                    "service": service.decode("utf-8"),
+                    "username": username.decode("utf-8"),
+                    "created_at": storage.micros_to_iso(r[6]),
+                    "updated_at": storage.micros_to_iso(r[7]),
+                }
+
+    def list_entries_preview(self) -> List[dict]:
+        """List entries with encrypted service/username (preview mode, no decryption)."""
+        return list(self.iter_entries_preview())
+
+    def list_entries_decrypted(self) -> List[dict]:
+        """List entries with decrypted service/username (requires master password key)."""
+        return list(self.iter_entries_decrypted())
+
+
+# One-shot helpers that open a Vault for a single call. Prefer holding a Vault
+# when doing more than one operation.
+
+
+def init_vault(
+    db_path: Path, master_password: str, kdf: Optional[KdfParams] = None
+) -> None:
+    Vault.create(db_path, master_password, kdf).close()
 
 
 def unlock_vault(db_path: Path, master_password: str) -> Optional[bytes]:
-    meta = storage.read_metadata(db_path)
-    if not meta:
-        raise RuntimeError("Vault not initialized")
-    salt, master_hash = meta
-    if not crypto.verify_master_password(master_hash, master_password):
-        return None
-    key = crypto.derive_key(master_password, salt)
-    return key
+    with Vault(db_path) as vault:
+        return vault.key if vault.unlock(master_password) else None
 
 
 def add_entry(
@@ -33,101 +1004,70 @@ def add_entry(
     password: str,
     notes: Optional[str],
 ) -> str:
-    conn = storage.open_connection(db_path)
-    cur = conn.cursor()
-    entry_id = str(uuid.uuid4())
-    now = datetime.utcnow().isoformat()
-    enc_service = crypto.encrypt(key, service.encode("utf-8"))
-    enc_username = crypto.encrypt(key, username.encode("utf-8"))
-    enc_password = crypto.encrypt(key, password.encode("utf-8"))
-    enc_notes = crypto.encrypt(key, notes.encode("utf-8")) if notes else None
-    cur.execute(
-        "INSERT INTO entries(id, service, username, password, notes, created_at, updated_at) VALUES(?,?,?,?,?,?,?)",
-        (entry_id, enc_service, enc_username, enc_password, enc_notes, now, now),
-    )
-    conn.commit()
-    conn.close()
-    return entry_id
+    with Vault(db_path, key) as vault:
+        return vault.add_entry(service, username, password, notes)
 
 
 def get_entry(db_path: Path, key: bytes, entry_id: str):
-    conn = storage.open_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, service, username, password, notes, created_at, updated_at FROM entries WHERE id=?",
-        (entry_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return None
-    id_, enc_service, enc_username, enc_password, enc_notes, created_at, updated_at = (
-        row
-    )
-    service = crypto.decrypt(key, enc_service).decode("utf-8")
-    username = crypto.decrypt(key, enc_username).decode("utf-8")
-    password = crypto.decrypt(key, enc_password).decode("utf-8")
-    notes = crypto.decrypt(key, enc_notes).decode("utf-8") if enc_notes else None
-    return {
-        "id": id_,
-        "service": service,
-        "username": username,
-        "password": password,
-        "notes": notes,
-        "created_at": created_at,
-        "updated_at": updated_at,
-    }
+    with Vault(db_path, key) as vault:
+        return vault.get_entry(entry_id)
+
+
+def update_entry(
+    db_path: Path,
+    key: bytes,
+    entry_id: str,
+    service: Optional[str] = None,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    notes: Optional[str] = None,
+) -> bool:
+    with Vault(db_path, key) as vault:
+        return vault.update_entry(entry_id, service, username, password, notes)
+
+
+def rotate_entry(db_path: Path, key: bytes, entry_id: str, policy=None):
+    with Vault(db_path, key) as vault:
+        return vault.rotate_entry(entry_id, policy)
+
+
+def delete_entry(db_path: Path, key: bytes, entry_id: str) -> bool:
+    with Vault(db_path, key) as vault:
+        return vault.delete_entry(entry_id)
+
+
+def get_entries(
+    db_path: Path, key: bytes, entry_ids: Iterable[str], workers: int = 1
+) -> List[Optional[dict]]:
+    with Vault(db_path, key, workers=workers) as vault:
+        return list(vault.get_entries(entry_ids))
+
+
+def search_entries(
+    db_path: Path, key: bytes, query: str, limit: int = SEARCH_LIMIT
+) -> List[dict]:
+    with Vault(db_path, key) as vault:
+        return vault.search(query, limit)
 
 
 def list_entries_preview(db_path: Path) -> List[dict]:
     """List entries with encrypted service/username (preview mode, no decryption)."""
-    conn = storage.open_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, service, username, created_at, updated_at FROM entries ORDER BY created_at DESC"
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    return [
-        {
-            "id": r[0],
-            "service": r[1].hex() if r[1] else None,
-            "username": r[2].hex() if r[2] else None,
-            "created_at": r[3],
-            "updated_at": r[4],
-            "encrypted": True,
-        }
-        for r in rows
-    ]
+    with Vault(db_path) as vault:
+        return vault.list_entries_preview()
 
 
-def list_entries_decrypted(db_path: Path, key: bytes) -> List[dict]:
+def list_entries_decrypted(db_path: Path, key: bytes, workers: int = 1) -> List[dict]:
     """List entries with decrypted service/username (requires master password key)."""
-    conn = storage.open_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, service, username, created_at, updated_at FROM entries ORDER BY created_at DESC"
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    result = []
-    for r in rows:
-        try:
-            service = crypto.decrypt(key, r[1]).decode("utf-8")
-            username = crypto.decrypt(key, r[2]).decode("utf-8")
-        except Exception:
-            # Decryption failed, skip
-            continue
-        result.append(
-            {
-                "id": r[0],
-                "service": service,
-                "username": username,
-                "created_at": r[3],
-                "updated_at": r[4],
-            }
-        )
+    with Vault(db_path, key, workers=workers) as vault:
+        return vault.list_entries_decrypted()
 
-    return result
+
+def find_entries(
+    db_path: Path,
+    key: bytes,
+    service: Optional[str] = None,
+    username: Optional[str] = None,
+) -> List[dict]:
+    """Look up entries by exact service and/or username via the blind index."""
+    with Vault(db_path, key) as vault:
+        return vault.find_entries(service, username)
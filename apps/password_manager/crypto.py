@@ -1,105 +1,289 @@
+import hashlib
+import hmac
 import os
-import string
-import secrets
-from typing import Tuple
+import struct
+import time
+from concurrent.futures import Executor
+from typing import List, Optional, Sequence, Tuple
 from argon2 import PasswordHasher
 from argon2.low_level import hash_secret_raw, Type
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from . import trace
+from .models import KdfParams
 
+# Password generation lives in a module with no crypto dependencies so the
+# CLI can generate passwords without loading argon2 or cryptography.
+from .generator import (  # noqa: F401
+    _DIGITS,
+    _LOWERCASE,
+    _SYMBOLS,
+    _UPPERCASE,
+    generate_strong_password,
+)
+
+# Only used to unlock vaults created before the key-check format (schema v1).
 PH = PasswordHasher()
 
+# Fixed plaintext sealed under the vault key; authenticating it proves the key.
+KEY_CHECK_PLAINTEXT = b"brahmand5-key-check"
+
+# Cost settings for new vaults unless calibrated or given explicitly. Vaults
+# created before KDF settings were stored used exactly these.
+DEFAULT_KDF_PARAMS = KdfParams()
+
 
-def derive_key(master_password: str, salt: bytes, length: int = 32) -> bytes:
+def derive_key(
+    master_password: str,
+    salt: bytes,
+    length: int = 32,
+    params: KdfParams = DEFAULT_KDF_PARAMS,
+) -> bytes:
     """Derive a symmetric key from the master password and salt using Argon2id.
 
-    Returns raw bytes of .
+    Returns length raw bytes.
     """
     if isinstance(master_password, str):
         master_bytes = master_password.encode("utf-8")
     else:
         master_bytes = master_password
-    key = hash_secret_raw(
-        secret=master_bytes,
-        salt=salt,
-        time_cost=2,
-        memory_cost=65536,
-        parallelism=1,
-        hash_len=length,
-        type=Type.ID,
-    )
+    with trace.span("kdf"):
+        key = hash_secret_raw(
+            secret=master_bytes,
+            salt=salt,
+            time_cost=params.time_cost,
+            memory_cost=params.memory_cost,
+            parallelism=params.parallelism,
+            hash_len=length,
+            type=Type.ID,
+        )
     return key
 
 
+def calibrate_kdf(
+    target_seconds: float = 0.5,
+    memory_cost: int = DEFAULT_KDF_PARAMS.memory_cost,
+    parallelism: Optional[int] = None,
+) -> KdfParams:
+    """Pick Argon2id settings that take about target_seconds on this host.
+
+    Memory is fixed (KiB) and parallelism defaults to the number of CPUs, so
+    the lanes run concurrently; time_cost is then scaled from one timed pass.
+    """
+    parallelism = parallelism or os.cpu_count() or 1
+    salt = os.urandom(16)
+
+    def timed(time_cost: int) -> float:
+        params = KdfParams(time_cost, memory_cost, parallelism)
+        start = time.perf_counter()
+        derive_key("calibration", salt, params=params)
+        return time.perf_counter() - start
+
+    per_pass = timed(1)
+    time_cost = max(1, int(target_seconds / per_pass))
+    if time_cost > 1:
+        # A single pass includes fixed setup cost; rescale from a real run.
+        elapsed = timed(time_cost)
+        time_cost = max(1, round(time_cost * target_seconds / elapsed))
+    return KdfParams(time_cost, memory_cost, parallelism)
+
+
 def hash_master_password(master_password: str) -> str:
-    return PH.hash(master_password)
+    with trace.span("kdf"):
+        return PH.hash(master_password)
 
 
 def verify_master_password(hash_str: str, master_password: str) -> bool:
     try:
-        return PH.verify(hash_str, master_password)
+        with trace.span("kdf"):
+            return PH.verify(hash_str, master_password)
     except Exception:
         return False
 
 
-def encrypt(key: bytes, plaintext: bytes) -> bytes:
-    aesgcm = AESGCM(key)
+def make_key_check(key: bytes) -> bytes:
+    """Seal KEY_CHECK_PLAINTEXT under key for storage in the vault metadata."""
+    return encrypt(key, KEY_CHECK_PLAINTEXT)
+
+
+def verify_key_check(key: bytes, key_check: bytes) -> bool:
+    """Return True if key authenticates the stored key-check blob."""
+    try:
+        return decrypt(key, key_check) == KEY_CHECK_PLAINTEXT
+    except InvalidTag:
+        return False
+
+
+def derive_subkey(key: bytes, label: bytes) -> bytes:
+    """Derive an independent 32-byte key for label from the vault key (HMAC-SHA256)."""
+    return hmac.new(key, label, hashlib.sha256).digest()
+
+
+def blind_index(index_key: bytes, field: str, value: str) -> bytes:
+    """Keyed HMAC of a field value, stored alongside the ciphertext for lookups.
+
+    Equal values give equal digests under the same key, so exact-match
+    queries can use a SQLite index without decrypting; the field name is
+    mixed in so a service and a username with the same text do not collide.
+    """
+    msg = field.encode("utf-8") + b"\0" + value.encode("utf-8")
+    return hmac.new(index_key, msg, hashlib.sha256).digest()
+
+
+def _count_aead(ops: int, nbytes: int) -> None:
+    # Callers check trace.recorder first, which keeps AEAD calls free of
+    # any tracing cost while it is off.
+    trace.recorder.count("aead.ops", ops)
+    trace.recorder.count("aead.bytes", nbytes)
+
+
+def new_cipher(key: bytes) -> AESGCM:
+    """Build an AES-GCM context that can be reused for many encrypt/decrypt calls."""
+    return AESGCM(key)
+
+
+def encrypt_with(
+    aesgcm: AESGCM, plaintext: bytes, associated_data: Optional[bytes] = None
+) -> bytes:
+    if trace.recorder is not None:
+        _count_aead(1, len(plaintext))
     nonce = os.urandom(12)
-    ct = aesgcm.encrypt(nonce, plaintext, None)
+    ct = aesgcm.encrypt(nonce, plaintext, associated_data)
     return nonce + ct
 
 
-def decrypt(key: bytes, blob: bytes) -> bytes:
-    aesgcm = AESGCM(key)
+def decrypt_with(
+    aesgcm: AESGCM, blob: bytes, associated_data: Optional[bytes] = None
+) -> bytes:
+    if trace.recorder is not None:
+        _count_aead(1, len(blob))
     nonce = blob[:12]
     ct = blob[12:]
-    return aesgcm.decrypt(nonce, ct, None)
+    return aesgcm.decrypt(nonce, ct, associated_data)
 
 
-# Character sets for password generation, excluding ambiguous characters
-_LOWERCASE = "abcdefghijkmnpqrstuvwxyz"  # Excludes l, o
-_UPPERCASE = "ABCDEFGHJKLMNPQRSTUVWXYZ"  # Excludes I, O
-_DIGITS = "23456789"  # Excludes 0, 1
-_SYMBOLS = "@#$%"  # Restricted symbol set
+# Record (v2) plaintext: each field as a 4-byte big-endian length followed by
+# its bytes, with _ABSENT as the length of a missing optional field.
+_FIELD_LENGTH = struct.Struct(">I")
+_ABSENT = 0xFFFFFFFF
 
 
-def generate_strong_password(length: int = 20, include_symbols: bool = False) -> str:
-    """
-    Generates a cryptographically strong password.
+def pack_fields(fields: Sequence[Optional[bytes]]) -> bytes:
+    parts = []
+    for field in fields:
+        if field is None:
+            parts.append(_FIELD_LENGTH.pack(_ABSENT))
+        else:
+            parts.append(_FIELD_LENGTH.pack(len(field)))
+            parts.append(field)
+    return b"".join(parts)
+
 
-    Excludes ambiguous characters (l, I, 0, O, 1, o) by default.
-    Ensures at least one character from each included type (lowercase, uppercase, digit,
-    and symbol if include_symbols is True).
+def unpack_fields(data: bytes) -> List[Optional[bytes]]:
+    fields = []
+    pos = 0
+    while pos < len(data):
+        (length,) = _FIELD_LENGTH.unpack_from(data, pos)
+        pos += _FIELD_LENGTH.size
+        if length == _ABSENT:
+            fields.append(None)
+            continue
+        if pos + length > len(data):
+            raise ValueError("Truncated record")
+        fields.append(data[pos : pos + length])
+        pos += length
+    return fields
 
-    Args:
-        length (int): The desired length of the password. Defaults to 20.
-        include_symbols (bool): Whether to include symbols (@#$%) in the password.
-                                Defaults to False.
 
-    Returns:
-        str: The generated strong password.
+def encrypt_record(
+    aesgcm: AESGCM, record_id: str, fields: Sequence[Optional[bytes]]
+) -> bytes:
+    """Seal all fields of a row in one AES-GCM blob bound to its id.
+
+    The id is authenticated as associated data, so a record copied onto
+    another row fails to decrypt.
     """
-    if length < 4:
-        raise ValueError("Password length must be at least 4 to ensure complexity.")
+    plaintext = pack_fields(fields)
+    if trace.recorder is not None:
+        _count_aead(1, len(plaintext))
+    nonce = os.urandom(12)
+    return nonce + aesgcm.encrypt(nonce, plaintext, record_id.encode())
 
-    char_pool = [_LOWERCASE, _UPPERCASE, _DIGITS]
-    password_chars = []
 
-    # Ensure at least one from each required character type
-    password_chars.append(secrets.choice(_LOWERCASE))
-    password_chars.append(secrets.choice(_UPPERCASE))
-    password_chars.append(secrets.choice(_DIGITS))
+def decrypt_record(
+    aesgcm: AESGCM, record_id: str, blob: bytes
+) -> List[Optional[bytes]]:
+    if trace.recorder is not None:
+        _count_aead(1, len(blob))
+    return unpack_fields(aesgcm.decrypt(blob[:12], blob[12:], record_id.encode()))
 
-    if include_symbols:
-        char_pool.append(_SYMBOLS)
-        password_chars.append(secrets.choice(_SYMBOLS))
 
-    # Fill the rest of the password length
-    all_chars = "".join(char_pool)
-    for _ in range(length - len(password_chars)):
-        password_chars.append(secrets.choice(all_chars))
+def encrypt(key: bytes, plaintext: bytes) -> bytes:
+    return encrypt_with(AESGCM(key), plaintext)
+
+
+def decrypt(key: bytes, blob: bytes) -> bytes:
+    return decrypt_with(AESGCM(key), blob)
+
 
-    # Shuffle the list to randomize the position of forced characters
-    secrets.SystemRandom().shuffle(password_chars)
+# Blobs handed to one worker at a time by decrypt_many().
+DECRYPT_CHUNK_SIZE = 512
 
-    return "".join(password_chars)
+
+def _decrypt_chunk(
+    aesgcm: AESGCM,
+    blobs: Sequence[Optional[bytes]],
+    skip_errors: bool,
+    associated_data: Optional[Sequence[Optional[bytes]]] = None,
+) -> List[Optional[bytes]]:
+    if trace.recorder is not None:
+        present = [b for b in blobs if b is not None]
+        _count_aead(len(present), sum(map(len, present)))
+    out = []
+    for i, blob in enumerate(blobs):
+        if blob is None:
+            out.append(None)
+            continue
+        aad = associated_data[i] if associated_data is not None else None
+        try:
+            out.append(aesgcm.decrypt(blob[:12], blob[12:], aad))
+        except InvalidTag:
+            if not skip_errors:
+                raise
+            out.append(None)
+    return out
+
+
+def decrypt_many(
+    aesgcm: AESGCM,
+    blobs: Sequence[Optional[bytes]],
+    executor: Optional[Executor] = None,
+    chunk_size: Optional[int] = None,
+    skip_errors: bool = False,
+    associated_data: Optional[Sequence[Optional[bytes]]] = None,
+) -> List[Optional[bytes]]:
+    """Decrypt a batch of blobs with one cipher context, in input order.
+
+    None entries (absent optional fields) stay None, as do blobs that fail to
+    authenticate when skip_errors is set. associated_data, if given, holds
+    the AAD for each blob. Given a thread pool, the batch is split into
+    chunk_size (default DECRYPT_CHUNK_SIZE) slices decrypted concurrently;
+    AES-GCM runs in native code, so threads can overlap on multi-core hosts.
+    """
+    chunk_size = chunk_size or DECRYPT_CHUNK_SIZE
+    if executor is None or len(blobs) <= chunk_size:
+        return _decrypt_chunk(aesgcm, blobs, skip_errors, associated_data)
+    starts = range(0, len(blobs), chunk_size)
+    out = []
+    for part in executor.map(
+        lambda i: _decrypt_chunk(
+            aesgcm,
+            blobs[i : i + chunk_size],
+            skip_errors,
+            associated_data[i : i + chunk_size] if associated_data else None,
+        ),
+        starts,
+    ):
+        out.extend(part)
+    return out
@@ -0,0 +1,369 @@
+"""Random password generation; depends only on the standard library."""
+
+import functools
+import itertools
+import json
+import math
+import secrets
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+# Character sets for password generation, excluding ambiguous characters
+_LOWERCASE = "abcdefghijkmnpqrstuvwxyz"  # Excludes l, o
+_UPPERCASE = "ABCDEFGHJKLMNPQRSTUVWXYZ"  # Excludes I, O
+_DIGITS = "23456789"  # Excludes 0, 1
+_SYMBOLS = "@#$%"  # Restricted symbol set
+
+# Names a policy can use instead of spelling out an alphabet.
+ALPHABETS = {
+    "lower": _LOWERCASE,
+    "upper": _UPPERCASE,
+    "digits": _DIGITS,
+    "symbols": _SYMBOLS,
+}
+
+# Upper bound on the random bytes fetched from the OS in one call.
+RANDOM_BUFFER_SIZE = 64 * 1024
+
+# Below this share of valid candidates, sampling whole candidates and
+# rejecting the invalid ones wastes more randomness than it saves.
+_MIN_ACCEPTANCE = 0.125
+
+
+@dataclass(frozen=True)
+class CharClass:
+    """An alphabet and how many of its characters a password must contain."""
+
+    alphabet: str
+    min_count: int = 1
+
+
+@dataclass(frozen=True)
+class PasswordPolicy:
+    """Rules for a random password over one or more character classes.
+
+    Characters are drawn from the union of the class alphabets minus
+    exclude; every password holds at least min_count characters of each
+    class and is uniformly distributed over all passwords that do.
+    """
+
+    length: int = 20
+    classes: Tuple[CharClass, ...] = (
+        CharClass(_LOWERCASE),
+        CharClass(_UPPERCASE),
+        CharClass(_DIGITS),
+    )
+    exclude: str = ""
+
+    @classmethod
+    def default(
+        cls, length: int = 20, include_symbols: bool = False
+    ) -> "PasswordPolicy":
+        """The policy behind generate_strong_password()."""
+        if length < 4:
+            raise ValueError("Password length must be at least 4 to ensure complexity.")
+        names = ("lower", "upper", "digits") + (("symbols",) if include_symbols else ())
+        return cls(length, tuple(CharClass(ALPHABETS[n]) for n in names))
+
+    def compile(self) -> "CompiledPolicy":
+        return _compile_password_policy(self)
+
+
+@dataclass(frozen=True)
+class PassphrasePolicy:
+    """Rules for a passphrase of words drawn from a wordlist file.
+
+    The file holds one word per line; a leading dice-roll column as in
+    diceware lists is ignored. Duplicate words are counted once.
+    """
+
+    wordlist: str
+    words: int = 6
+    separator: str = "-"
+
+    def compile(self) -> "CompiledPassphrasePolicy":
+        text = Path(self.wordlist).expanduser().read_text(encoding="utf-8")
+        words = tuple(
+            dict.fromkeys(
+                line.split()[-1] for line in text.splitlines() if line.split()
+            )
+        )
+        return CompiledPassphrasePolicy(self, words)
+
+
+class CompiledPolicy:
+    """A password policy turned into lookup tables, ready to generate from.
+
+    Compiling validates the policy, builds the byte-to-character tables and
+    counts the passwords it allows, which gives entropy_bits exactly.
+    """
+
+    def __init__(self, policy: PasswordPolicy):
+        if policy.length < 1:
+            raise ValueError("Password length must be at least 1")
+        alphabets = []
+        for cls in policy.classes:
+            alphabet = "".join(
+                dict.fromkeys(c for c in cls.alphabet if c not in policy.exclude)
+            )
+            if cls.min_count < 0:
+                raise ValueError("Minimum counts cannot be negative")
+            if not alphabet:
+                raise ValueError(f"No characters left in class {cls.alphabet!r}")
+            if not alphabet.isascii() or not alphabet.isprintable():
+                raise ValueError(f"Class {cls.alphabet!r} is not printable ASCII")
+            alphabets.append(alphabet)
+        pool = "".join(alphabets)
+        if not alphabets or len(set(pool)) != len(pool):
+            raise ValueError("Character classes must be non-empty and disjoint")
+        required = sum(cls.min_count for cls in policy.classes)
+        if required > policy.length:
+            raise ValueError(
+                f"Password length {policy.length} is shorter than the "
+                f"{required} characters the policy requires"
+            )
+        self.policy = policy
+        self.length = policy.length
+        self._alphabets = alphabets
+        self._mins = [cls.min_count for cls in policy.classes]
+
+        # Byte b maps to pool[b % len(pool)] unless it lies above the largest
+        # multiple of len(pool) that fits in a byte; those are rejected so
+        # every character is equally likely.
+        raw = pool.encode("ascii")
+        limit = 256 - 256 % len(raw)
+        self._charset = bytes(raw[b % len(raw)] if b < limit else 0 for b in range(256))
+        self._rejected = bytes(range(limit, 256))
+        class_of = bytearray(256)
+        for tag, alphabet in enumerate(alphabets, start=1):
+            for c in alphabet.encode("ascii"):
+                class_of[c] = tag
+        self._class_of = bytes(class_of)
+        self._required = [
+            (bytes([tag]), m) for tag, m in enumerate(self._mins, start=1) if m
+        ]
+        # The common "at least one of each" rule is a single set test.
+        self._required_tags = None
+        if all(m == 1 for _tag, m in self._required):
+            self._required_tags = frozenset(tag[0] for tag, _m in self._required)
+
+        self._ways = None
+        valid = _count_valid(policy.length, [len(a) for a in alphabets], self._mins)
+        self.entropy_bits = math.log2(valid)
+        self._bulk = valid / len(pool) ** policy.length >= _MIN_ACCEPTANCE
+
+    def generate(self) -> str:
+        return next(self.generate_many(1))
+
+    def generate_many(self, count: Optional[int] = None) -> Iterator[str]:
+        """Yield count passwords (without end if count is None)."""
+        if not self._bulk:
+            produced = 0
+            while count is None or produced < count:
+                yield self._sample_exact()
+                produced += 1
+            return
+        produced = 0
+        pending = b""
+        while count is None or produced < count:
+            # Ask for about what the remaining passwords need, with headroom
+            # for rejected bytes and candidates; the leftover tail carries over.
+            if count is None:
+                wanted = RANDOM_BUFFER_SIZE
+            else:
+                wanted = (count - produced) * self.length
+            size = min(RANDOM_BUFFER_SIZE, max(64, 2 * wanted))
+            chars = pending + secrets.token_bytes(size).translate(
+                self._charset, self._rejected
+            )
+            usable = len(chars) - len(chars) % self.length
+            for start in range(0, usable, self.length):
+                candidate = chars[start : start + self.length]
+                tags = candidate.translate(self._class_of)
+                if self._required_tags is not None:
+                    if not self._required_tags.issubset(tags):
+                        continue
+                elif any(tags.count(tag) < m for tag, m in self._required):
+                    continue
+                yield candidate.decode("ascii")
+                produced += 1
+                if produced == count:
+                    return
+            pending = chars[usable:]
+
+    def _split_table(self) -> list:
+        # table[i][n]: strings of length n over classes i.. that meet their
+        # minimums. Quadratic in the length, so only built when needed.
+        if self._ways is None:
+            n_max = self.length
+            ways = [[1] + [0] * n_max]
+            for alphabet, minimum in zip(
+                reversed(self._alphabets), reversed(self._mins)
+            ):
+                after, size = ways[0], len(alphabet)
+                row = [
+                    sum(
+                        math.comb(n, c) * size**c * after[n - c]
+                        for c in range(minimum, n + 1)
+                    )
+                    for n in range(n_max + 1)
+                ]
+                ways.insert(0, row)
+            self._ways = ways
+        return self._ways
+
+    def _sample_exact(self) -> str:
+        # Pick how many characters each class gets with probability
+        # proportional to the passwords having that split, then fill the
+        # classes uniformly and shuffle positions.
+        ways = self._split_table()
+        remaining = self.length
+        chars = []
+        for i, alphabet in enumerate(self._alphabets):
+            r = secrets.randbelow(ways[i][remaining])
+            size = len(alphabet)
+            for c in range(self._mins[i], remaining + 1):
+                weight = math.comb(remaining, c) * size**c
+                weight *= ways[i + 1][remaining - c]
+                if r < weight:
+                    break
+                r -= weight
+            chars.extend(secrets.choice(alphabet) for _ in range(c))
+            remaining -= c
+        secrets.SystemRandom().shuffle(chars)
+        return "".join(chars)
+
+
+class CompiledPassphrasePolicy:
+    """A passphrase policy with its wordlist loaded."""
+
+    def __init__(self, policy: PassphrasePolicy, words: Tuple[str, ...]):
+        if policy.words < 1:
+            raise ValueError("A passphrase needs at least one word")
+        if len(words) < 2:
+            raise ValueError(f"Wordlist {policy.wordlist} has fewer than two words")
+        self.policy = policy
+        self.words = words
+        self.entropy_bits = policy.words * math.log2(len(words))
+
+    def generate(self) -> str:
+        return self.policy.separator.join(
+            secrets.choice(self.words) for _ in range(self.policy.words)
+        )
+
+    def generate_many(self, count: Optional[int] = None) -> Iterator[str]:
+        produced = 0
+        while count is None or produced < count:
+            yield self.generate()
+            produced += 1
+
+
+def _count_valid(length: int, sizes: list, mins: list) -> int:
+    """Count strings of length over disjoint alphabets of the given sizes that
+    hold at least mins[i] characters from alphabet i.
+
+    Inclusion-exclusion over the classes that fall short: for each set of
+    classes and each choice of too-small counts for them, the rest of the
+    string comes from the other alphabets. The work depends on the minimums,
+    not on the length.
+    """
+    total = 0
+    pool = sum(sizes)
+    short = [i for i, m in enumerate(mins) if m]
+    for subset in itertools.chain.from_iterable(
+        itertools.combinations(short, r) for r in range(len(short) + 1)
+    ):
+        rest = pool - sum(sizes[i] for i in subset)
+        for counts in itertools.product(*(range(mins[i]) for i in subset)):
+            used = sum(counts)
+            if used > length:
+                continue
+            ways = math.factorial(length) // math.factorial(length - used)
+            for i, c in zip(subset, counts):
+                ways = ways // math.factorial(c) * sizes[i] ** c
+            total += (-1) ** len(subset) * ways * rest ** (length - used)
+    return total
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_password_policy(policy: PasswordPolicy) -> CompiledPolicy:
+    return CompiledPolicy(policy)
+
+
+def parse_policy(spec: str) -> Union[PasswordPolicy, PassphrasePolicy]:
+    """Build a policy from a JSON object, given inline or as a file path.
+
+    Password policies look like {"length": 24, "exclude": "%",
+    "classes": [{"alphabet": "lower", "min": 2}, {"alphabet": "-_.", "min": 0}]},
+    where an alphabet is either one of the ALPHABETS names or the characters
+    themselves. {"wordlist": "words.txt", "words": 6, "separator": " "}
+    describes a passphrase.
+    """
+    text = spec if spec.lstrip().startswith("{") else Path(spec).read_text("utf-8")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid policy JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("A policy must be a JSON object")
+    if "wordlist" in data:
+        return PassphrasePolicy(
+            wordlist=data["wordlist"],
+            words=int(data.get("words", 6)),
+            separator=data.get("separator", "-"),
+        )
+    default = PasswordPolicy()
+    classes = default.classes
+    if "classes" in data:
+        classes = tuple(
+            CharClass(ALPHABETS.get(c["alphabet"], c["alphabet"]), int(c.get("min", 1)))
+            for c in data["classes"]
+        )
+    return PasswordPolicy(
+        length=int(data.get("length", default.length)),
+        classes=classes,
+        exclude=data.get("exclude", ""),
+    )
+
+
+def generate_many(
+    count: Optional[int] = None, length: int = 20, include_symbols: bool = False
+) -> Iterator[str]:
+    """
+    Yields count passwords (without end if count is None) as they are made.
+
+    Randomness is read in large buffers and mapped onto the character pool
+    with rejection sampling, so every character is uniformly distributed.
+    Candidates missing a lowercase letter, uppercase letter, digit (or symbol
+    when include_symbols is True) are discarded, which makes each password
+    uniform over all passwords that satisfy those rules.
+
+    Args:
+        count (Optional[int]): How many passwords to yield. Defaults to None.
+        length (int): The length of each password. Defaults to 20.
+        include_symbols (bool): Whether to include symbols (@#$%).
+                                Defaults to False.
+    """
+    return (
+        PasswordPolicy.default(length, include_symbols).compile().generate_many(count)
+    )
+
+
+def generate_strong_password(length: int = 20, include_symbols: bool = False) -> str:
+    """
+    Generates a cryptographically strong password.
+
+    Excludes ambiguous characters (l, I, 0, O, 1, o) by default.
+    Ensures at least one character from each included type (lowercase, uppercase, digit,
+    and symbol if include_symbols is True).
+
+    Args:
+        length (int): The desired length of the password. Defaults to 20.
+        include_symbols (bool): Whether to include symbols (@#$%) in the password.
+                                Defaults to False.
+
+    Returns:
+        str: The generated strong password.
+    """
+    return next(generate_many(1, length, include_symbols))
@@ -1,14 +1,93 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 
 @dataclass
 class Entry:
+    """A decrypted entry. Secrets live in bytearrays so they can be wiped."""
+
     id: str
     service: str
     username: str
-    password: bytes  # encrypted blob
-    notes: Optional[bytes]
-    created_at: datetime
-    updated_at: datetime
+    password: bytearray
+    notes: Optional[bytearray]
+    created_at: str
+    updated_at: str
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "service": self.service,
+            "username": self.username,
+            "password": self.password.decode("utf-8"),
+            "notes": self.notes.decode("utf-8") if self.notes is not None else None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def wipe(self) -> None:
+        """Overwrite the secret buffers in place (best effort: copies handed
+        out by to_dict() are immutable str objects and cannot be cleared)."""
+        for buf in (self.password, self.notes):
+            if buf is not None:
+                buf[:] = bytes(len(buf))
+
+
+@dataclass(frozen=True)
+class KdfParams:
+    """Argon2id cost settings used to derive a vault key."""
+
+    time_cost: int = 2
+    memory_cost: int = 65536  # KiB
+    parallelism: int = 1
+
+
+@dataclass
+class VaultMetadata:
+    salt: bytes
+    key_check: Optional[bytes]  # None until a legacy vault is first unlocked
+    master_hash: Optional[str]  # legacy (v1) PHC hash, cleared after migration
+    kdf: KdfParams = KdfParams()
+    record_format: int = 1  # 1: a blob per field, 2: one blob per entry
+
+
+@dataclass
+class RekeyProgress:
+    """An unfinished rekey: the new key's salt, check and settings, and how
+    far through the entries (ordered by id) re-encryption has got."""
+
+    salt: bytes
+    key_check: bytes
+    kdf: KdfParams
+    record_format: int
+    last_id: str = ""
+
+
+@dataclass
+class MaintenanceReport:
+    """What storage.maintain() did and the state of the file afterwards."""
+
+    page_size: int
+    page_count: int
+    free_pages: int
+    wal_bytes: int
+    auto_vacuum: str  # "none", "full" or "incremental"
+    pages_vacuumed: int
+    checkpoint_busy: bool  # a reader kept the WAL from being fully reset
+    integrity: List[str]  # ["ok"] when the database is sound
+    row_counts: Dict[str, int] = field(default_factory=dict)
+    changes_pruned: int = 0  # superseded sync change log rows dropped
+
+    @property
+    def ok(self) -> bool:
+        return self.integrity == ["ok"]
+
+
+@dataclass
+class SyncReport:
+    """The changes one side of a sync received and sent."""
+
+    received: int = 0  # changes pulled from the peer
+    applied: int = 0  # of those, the ones newer than what this vault had
+    sent: int = 0  # changes pushed to the peer
+    peer_applied: int = 0  # of those, the ones the peer took (0 if unknown)
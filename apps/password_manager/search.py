@@ -0,0 +1,214 @@
+"""Trigram index for fuzzy search over entry service, username and notes.
+
+Text is case-folded and split into words, and each word padded as
+"  word " contributes its three-character slices, as in PostgreSQL's
+pg_trgm; short or misspelled queries still share most trigrams with the
+entries they are meant to find. The index holds plaintext, so the vault
+only ever stores it encrypted (see core.Vault.search()).
+"""
+
+import array
+import heapq
+import json
+import re
+import struct
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+# Characters of notes that are indexed; the rest is not searchable.
+NOTES_INDEX_LIMIT = 1024
+
+# Posting-list entries counted per query. The rarest trigram's postings are
+# always counted in full, so every entry that has it is a candidate; the
+# next rarest follow until this is reached, and the most common trigrams
+# ("com", "mai") are skipped after that.
+SCAN_BUDGET = 2_000
+
+# Results scoring below this are dropped.
+MIN_SCORE = 0.3
+
+_FORMAT_VERSION = 1
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def trigrams(text: str) -> set:
+    grams = set()
+    for word in _WORD_RE.findall(text.casefold()):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _little_endian(posting: array.array) -> bytes:
+    if sys.byteorder == "little":
+        return posting.tobytes()
+    swapped = array.array("I", posting)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class SearchIndex:
+    """An in-memory trigram index from text to entry ids.
+
+    Each entry is a document with a number; postings map a trigram to the
+    numbers of the documents containing it. Removing or replacing an entry
+    only marks its old document dead, which search() skips, so every change
+    costs the new entry's trigrams and nothing more. compacted() drops dead
+    documents once they pile up.
+    """
+
+    def __init__(self):
+        # Document number -> (entry id, service, username, notes), or None
+        # once the entry has been removed or replaced.
+        self._docs: List[Optional[Tuple[str, str, str, str]]] = []
+        self._doc_of: Dict[str, int] = {}
+        self._postings: Dict[str, array.array] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_of)
+
+    @property
+    def needs_compaction(self) -> bool:
+        """Whether dead documents make up more than a fifth of the index."""
+        return (len(self._docs) - len(self._doc_of)) * 4 > len(self._doc_of)
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[str, str, str, Optional[str]]]):
+        """Index (id, service, username, notes) tuples."""
+        index = cls()
+        for entry in entries:
+            index.put(*entry)
+        return index
+
+    def compacted(self) -> "SearchIndex":
+        return SearchIndex.build(doc for doc in self._docs if doc is not None)
+
+    def put(
+        self, entry_id: str, service: str, username: str, notes: Optional[str]
+    ) -> None:
+        """Index an entry, replacing what was indexed for it before."""
+        self.remove(entry_id)
+        notes = (notes or "")[:NOTES_INDEX_LIMIT]
+        doc = len(self._docs)
+        self._docs.append((entry_id, service, username, notes))
+        self._doc_of[entry_id] = doc
+        postings = self._postings
+        for gram in trigrams(f"{service} {username} {notes}"):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array.array("I")
+            posting.append(doc)
+
+    def patch(self, entry_id: str, fields: dict) -> None:
+        """Change some of service, username and notes of an indexed entry."""
+        doc = self._doc_of.get(entry_id)
+        if doc is None:
+            return
+        _id, service, username, notes = self._docs[doc]
+        self.put(
+            entry_id,
+            fields.get("service", service),
+            fields.get("username", username),
+            fields.get("notes", notes),
+        )
+
+    def remove(self, entry_id: str) -> None:
+        doc = self._doc_of.pop(entry_id, None)
+        if doc is not None:
+            self._docs[doc] = None
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        """Return up to limit entries matching query, best first.
+
+        The score is the share of the query's trigrams an entry contains,
+        plus a bonus when the query appears verbatim in the service (most
+        if it is a prefix) or in the username or notes.
+        """
+        grams = trigrams(query)
+        postings = sorted(
+            (p for p in map(self._postings.get, grams) if p is not None), key=len
+        )
+        if not postings:
+            return []
+        counts = Counter(postings[0])
+        scanned, used = len(postings[0]), 1
+        for posting in postings[1:]:
+            if scanned + len(posting) > SCAN_BUDGET:
+                break
+            counts.update(posting)
+            scanned += len(posting)
+            used += 1
+        # Skipped common trigrams lower every score alike, so they are left
+        # out; trigrams no entry has count against all of them.
+        total = used + len(grams) - len(postings)
+        needle = " ".join(_WORD_RE.findall(query.casefold()))
+
+        # Dead documents are dropped before ranking so they take no places;
+        # among equal counts the newest documents win.
+        docs = self._docs
+        live = [(count, doc) for doc, count in counts.items() if docs[doc] is not None]
+        results = []
+        for count, doc in heapq.nlargest(limit * 2 + 8, live):
+            entry_id, service, username, notes = docs[doc]
+            score = count / total
+            folded = service.casefold()
+            if needle and needle in folded:
+                score += 1.0 if folded.startswith(needle) else 0.75
+            elif needle and (
+                needle in username.casefold() or needle in notes.casefold()
+            ):
+                score += 0.5
+            if score >= MIN_SCORE:
+                results.append((score, entry_id, service, username))
+        results.sort(key=lambda r: (-r[0], len(r[2]), r[2]))
+        return [
+            {
+                "id": entry_id,
+                "service": service,
+                "username": username,
+                "score": round(score, 3),
+            }
+            for score, entry_id, service, username in results[:limit]
+        ]
+
+    def to_bytes(self) -> bytes:
+        """Serialize the index: a JSON header, then little-endian postings."""
+        header = json.dumps(
+            {
+                "version": _FORMAT_VERSION,
+                "docs": self._docs,
+                "grams": [*self._postings],
+                "sizes": [len(p) for p in self._postings.values()],
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return b"".join(
+            [
+                _HEADER_LENGTH.pack(len(header)),
+                header,
+                *map(_little_endian, self._postings.values()),
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SearchIndex":
+        (length,) = _HEADER_LENGTH.unpack_from(data)
+        pos = _HEADER_LENGTH.size + length
+        header = json.loads(data[_HEADER_LENGTH.size : pos])
+        if header.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unknown search index version {header.get('version')}")
+        index = cls()
+        index._docs = [tuple(d) if d is not None else None for d in header["docs"]]
+        index._doc_of = {d[0]: n for n, d in enumerate(index._docs) if d is not None}
+        view = memoryview(data)
+        for gram, size in zip(header["grams"], header["sizes"]):
+            posting = array.array("I")
+            posting.frombytes(view[pos : pos + 4 * size])
+            if sys.byteorder != "little":
+                posting.byteswap()
+            index._postings[gram] = posting
+            pos += 4 * size
+        return index
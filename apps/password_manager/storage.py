@@ -1,28 +1,172 @@
+import contextlib
 import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple, Union
 
+from . import trace
+from .backends import EntryStore
+from .models import KdfParams, MaintenanceReport, RekeyProgress, VaultMetadata
+
+# Bumped whenever the on-disk layout changes; stored in PRAGMA user_version.
+# Vaults created before versioning report user_version 0 and are treated as v1.
+SCHEMA_VERSION = 10
+
+# Seconds a statement waits on another connection's lock before failing with
+# "database is locked".
+BUSY_TIMEOUT = 5.0
+
+# Further attempts begin_write() makes once a busy timeout has expired, with
+# exponential backoff (and jitter) starting at RETRY_BASE_DELAY seconds.
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS metadata (
     id INTEGER PRIMARY KEY CHECK (id = 1),
     salt BLOB NOT NULL,
-    master_hash TEXT NOT NULL
+    key_check BLOB,
+    master_hash TEXT,
+    kdf_time_cost INTEGER NOT NULL DEFAULT 2,
+    kdf_memory_cost INTEGER NOT NULL DEFAULT 65536,
+    kdf_parallelism INTEGER NOT NULL DEFAULT 1,
+    record_format INTEGER NOT NULL DEFAULT 1
 );
 
+-- Format 1 entries encrypt service, username, password and notes into their
+-- own columns. Format 2 entries seal all four into record instead.
+-- Timestamps are UTC microseconds since the Unix epoch.
 CREATE TABLE IF NOT EXISTS entries (
     id TEXT PRIMARY KEY,
-    service BLOB NOT NULL,
-    username BLOB NOT NULL,
-    password BLOB NOT NULL,
+    service BLOB,
+    username BLOB,
+    password BLOB,
     notes BLOB,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    service_idx BLOB,
+    username_idx BLOB,
+    record BLOB,
+    CHECK (
+        record IS NOT NULL
+        OR (service IS NOT NULL AND username IS NOT NULL AND password IS NOT NULL)
+    )
+);
+
+CREATE INDEX IF NOT EXISTS entries_service_idx ON entries(service_idx);
+CREATE INDEX IF NOT EXISTS entries_username_idx ON entries(username_idx);
+CREATE INDEX IF NOT EXISTS entries_created_idx ON entries(created_at, id);
+CREATE INDEX IF NOT EXISTS entries_updated_idx ON entries(updated_at, id);
+
+-- The new key and layout of an unfinished rekey, and the last entry id
+-- re-encrypted under them. Holds at most one row.
+CREATE TABLE IF NOT EXISTS rekey_progress (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    salt BLOB NOT NULL,
+    key_check BLOB NOT NULL,
+    kdf_time_cost INTEGER NOT NULL,
+    kdf_memory_cost INTEGER NOT NULL,
+    kdf_parallelism INTEGER NOT NULL,
+    record_format INTEGER NOT NULL,
+    last_id TEXT NOT NULL DEFAULT ''
+);
+
+-- The encrypted search index as of log sequence number seq, and the
+-- encrypted changes made since. Writes only log while an index exists.
+CREATE TABLE IF NOT EXISTS search_index (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL,
+    blob BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS search_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    blob BLOB NOT NULL
+);
+
+-- Every write to entries, in commit order, for sync. hlc is a hybrid logical
+-- clock reading in epoch microseconds and origin the replica that made the
+-- change. The row with the highest seq for an entry holds its latest change.
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id TEXT NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('put', 'del')),
+    hlc INTEGER NOT NULL,
+    origin TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS changes_entry_idx ON changes(entry_id, seq);
+CREATE INDEX IF NOT EXISTS changes_hlc_idx ON changes(hlc);
+
+-- This vault's identity as a sync replica, and for each peer the last seq
+-- of its change log that has been pulled from it.
+CREATE TABLE IF NOT EXISTS replica (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    replica_id TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO replica(id, replica_id) VALUES(1, lower(hex(randomblob(16))));
+
+CREATE TABLE IF NOT EXISTS sync_peers (
+    replica_id TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL
 );
 """
 
 
+_EPOCH = datetime(1970, 1, 1)
+
+# What to_micros() accepts.
+Timestamp = Union[int, str, datetime]
+
+
+def now_micros() -> int:
+    """The current UTC time in epoch microseconds."""
+    return time.time_ns() // 1000
+
+
+def to_micros(value: Timestamp) -> int:
+    """Convert an ISO 8601 string or datetime (naive means UTC) to epoch µs.
+
+    Integers are taken to be epoch microseconds already. Raises ValueError
+    for strings that are not ISO 8601, for other types, and for integers
+    outside the years 1 to 9999 that micros_to_iso() can format.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        if not _MIN_MICROS <= value <= _MAX_MICROS:
+            raise ValueError(f"Timestamp {value} is out of range")
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        raise ValueError(f"Unsupported timestamp {value!r}")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+_MIN_MICROS = (datetime.min - _EPOCH) // timedelta(microseconds=1)
+_MAX_MICROS = (datetime.max - _EPOCH) // timedelta(microseconds=1)
+
+
+def micros_to_iso(micros: int) -> str:
+    """Format epoch microseconds as a naive UTC ISO 8601 string."""
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+def _iso_to_micros_or_zero(value) -> int:
+    try:
+        return to_micros(value)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
 def resolve_db_path(cli_db: Optional[str]) -> Path:
     if cli_db:
         return Path(cli_db).expanduser().resolve()
@@ -48,32 +192,981 @@ def set_file_permissions(path: Path) -> None:
         pass
 
 
-def open_connection(path: Path) -> sqlite3.Connection:
+def _execute_script(conn: sqlite3.Connection, script: str) -> None:
+    # executescript() would COMMIT the surrounding transaction, so run the
+    # statements one by one to keep schema changes atomic.
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    cur = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+    )
+    return cur.fetchone() is not None
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version of the open vault (0 for an empty database)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and _table_exists(conn, "metadata"):
+        return 1
+    return version
+
+
+def _migrate_v1_to_v2(conn: sqlite3.Connection) -> None:
+    # v1 required a PHC master_hash; v2 verifies the password with key_check.
+    # The key_check can only be computed once the password is known, so it is
+    # filled in (and master_hash cleared) on the first successful unlock.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE metadata_v2 (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            salt BLOB NOT NULL,
+            key_check BLOB,
+            master_hash TEXT
+        );
+        INSERT INTO metadata_v2(id, salt, master_hash)
+            SELECT id, salt, master_hash FROM metadata;
+        DROP TABLE metadata;
+        ALTER TABLE metadata_v2 RENAME TO metadata;
+        """,
+    )
+
+
+def _migrate_v2_to_v3(conn: sqlite3.Connection) -> None:
+    # Blind-index columns for exact-match lookups. Existing rows keep NULLs
+    # until a session holding the vault key backfills them.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE entries ADD COLUMN service_idx BLOB;
+        ALTER TABLE entries ADD COLUMN username_idx BLOB;
+        CREATE INDEX entries_service_idx ON entries(service_idx);
+        CREATE INDEX entries_username_idx ON entries(username_idx);
+        """,
+    )
+
+
+def _migrate_v3_to_v4(conn: sqlite3.Connection) -> None:
+    # Argon2 settings become per-vault; the defaults are the values that were
+    # hardcoded when every existing vault was created.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE metadata ADD COLUMN kdf_time_cost INTEGER NOT NULL DEFAULT 2;
+        ALTER TABLE metadata ADD COLUMN kdf_memory_cost INTEGER NOT NULL DEFAULT 65536;
+        ALTER TABLE metadata ADD COLUMN kdf_parallelism INTEGER NOT NULL DEFAULT 1;
+        """,
+    )
+
+
+def _migrate_v4_to_v5(conn: sqlite3.Connection) -> None:
+    # Supports newest-first listing and keyset pagination on (created_at, id).
+    conn.execute("CREATE INDEX entries_created_idx ON entries(created_at, id)")
+
+
+def _migrate_v5_to_v6(conn: sqlite3.Connection) -> None:
+    # Single-blob records (format 2). SQLite cannot relax NOT NULL in place,
+    # so entries is rebuilt; existing rows stay in format 1 until rekeyed.
+    _execute_script(
+        conn,
+        """
+        ALTER TABLE metadata ADD COLUMN record_format INTEGER NOT NULL DEFAULT 1;
+        CREATE TABLE entries_v6 (
+            id TEXT PRIMARY KEY,
+            service BLOB,
+            username BLOB,
+            password BLOB,
+            notes BLOB,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            service_idx BLOB,
+            username_idx BLOB,
+            record BLOB,
+            CHECK (
+                record IS NOT NULL
+                OR (service IS NOT NULL AND username IS NOT NULL AND password IS NOT NULL)
+            )
+        );
+        INSERT INTO entries_v6(id, service, username, password, notes, created_at, updated_at, service_idx, username_idx)
+            SELECT id, service, username, password, notes, created_at, updated_at, service_idx, username_idx FROM entries;
+        DROP TABLE entries;
+        ALTER TABLE entries_v6 RENAME TO entries;
+        CREATE INDEX entries_service_idx ON entries(service_idx);
+        CREATE INDEX entries_username_idx ON entries(username_idx);
+        CREATE INDEX entries_created_idx ON entries(created_at, id);
+        """,
+    )
+
+
+def _migrate_v6_to_v7(conn: sqlite3.Connection) -> None:
+    # Checkpoints for rekeys that run in many short transactions.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE rekey_progress (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            salt BLOB NOT NULL,
+            key_check BLOB NOT NULL,
+            kdf_time_cost INTEGER NOT NULL,
+            kdf_memory_cost INTEGER NOT NULL,
+            kdf_parallelism INTEGER NOT NULL,
+            record_format INTEGER NOT NULL,
+            last_id TEXT NOT NULL DEFAULT ''
+        );
+        """,
+    )
+
+
+def _migrate_v7_to_v8(conn: sqlite3.Connection) -> None:
+    # ISO 8601 TEXT timestamps become INTEGER epoch microseconds. Column
+    # affinity cannot change in place, so entries is rebuilt. Strings that do
+    # not parse (only possible from old imports) become 0.
+    conn.create_function("iso_to_micros", 1, _iso_to_micros_or_zero)
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE entries_v8 (
+            id TEXT PRIMARY KEY,
+            service BLOB,
+            username BLOB,
+            password BLOB,
+            notes BLOB,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            service_idx BLOB,
+            username_idx BLOB,
+            record BLOB,
+            CHECK (
+                record IS NOT NULL
+                OR (service IS NOT NULL AND username IS NOT NULL AND password IS NOT NULL)
+            )
+        );
+        INSERT INTO entries_v8(id, service, username, password, notes, created_at, updated_at, service_idx, username_idx, record)
+            SELECT id, service, username, password, notes, iso_to_micros(created_at), iso_to_micros(updated_at), service_idx, username_idx, record FROM entries;
+        DROP TABLE entries;
+        ALTER TABLE entries_v8 RENAME TO entries;
+        CREATE INDEX entries_service_idx ON entries(service_idx);
+        CREATE INDEX entries_username_idx ON entries(username_idx);
+        CREATE INDEX entries_created_idx ON entries(created_at, id);
+        CREATE INDEX entries_updated_idx ON entries(updated_at, id);
+        """,
+    )
+
+
+def _migrate_v8_to_v9(conn: sqlite3.Connection) -> None:
+    # The encrypted search index is built on first use, so it starts empty.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE search_index (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL,
+            blob BLOB NOT NULL
+        );
+        CREATE TABLE search_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            blob BLOB NOT NULL
+        );
+        """,
+    )
+
+
+def _migrate_v9_to_v10(conn: sqlite3.Connection) -> None:
+    # Change log for sync. Existing entries are logged as stored at their
+    # updated_at, so the first sync with a peer sends all of them.
+    _execute_script(
+        conn,
+        """
+        CREATE TABLE changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('put', 'del')),
+            hlc INTEGER NOT NULL,
+            origin TEXT NOT NULL
+        );
+        CREATE INDEX changes_entry_idx ON changes(entry_id, seq);
+        CREATE INDEX changes_hlc_idx ON changes(hlc);
+        CREATE TABLE replica (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            replica_id TEXT NOT NULL
+        );
+        INSERT INTO replica(id, replica_id) VALUES(1, lower(hex(randomblob(16))));
+        CREATE TABLE sync_peers (
+            replica_id TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL
+        );
+        INSERT INTO changes(entry_id, op, hlc, origin)
+            SELECT id, 'put', updated_at, (SELECT replica_id FROM replica)
+            FROM entries ORDER BY updated_at, id;
+        """,
+    )
+
+
+# Maps a schema version to the function that upgrades it to the next one.
+MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+    4: _migrate_v4_to_v5,
+    5: _migrate_v5_to_v6,
+    6: _migrate_v6_to_v7,
+    7: _migrate_v7_to_v8,
+    8: _migrate_v8_to_v9,
+    9: _migrate_v9_to_v10,
+}
+
+
+def _is_busy(exc: sqlite3.OperationalError) -> bool:
+    message = str(exc)
+    return "locked" in message or "busy" in message
+
+
+def begin_write(
+    conn: sqlite3.Connection,
+    attempts: int = RETRY_ATTEMPTS,
+    base_delay: float = RETRY_BASE_DELAY,
+) -> None:
+    """Start a write transaction, queueing behind other writers.
+
+    BEGIN IMMEDIATE takes the write lock up front, so the statements that
+    follow cannot hit "database is locked" halfway through; in WAL mode
+    readers never block it. Each attempt waits up to the connection's busy
+    timeout, and failed attempts are retried with exponential backoff.
+    """
+    for attempt in range(attempts + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == attempts:
+                raise
+            time.sleep(base_delay * 2**attempt * (0.5 + random.random()))
+
+
+@contextlib.contextmanager
+def write_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """begin_write(), then commit on success or roll back on error."""
+    begin_write(conn)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+@contextlib.contextmanager
+def read_snapshot(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run several reads against one consistent view of the database."""
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create the schema on an empty database or migrate an older vault."""
+    if schema_version(conn) == SCHEMA_VERSION:
+        return
+    begin_write(conn)
+    try:
+        # Re-read under the write lock in case another process migrated first.
+        version = schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Vault schema version {version} is newer than supported "
+                f"version {SCHEMA_VERSION}"
+            )
+        if version == 0:
+            _execute_script(conn, SCHEMA)
+        else:
+            for v in range(version, SCHEMA_VERSION):
+                MIGRATIONS[v](conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class _TracedCursor(sqlite3.Cursor):
+    """A cursor that times statements and fetches and counts rows."""
+
+    def execute(self, sql, parameters=()):
+        with trace.span("sql.execute"):
+            super().execute(sql, parameters)
+        self._count_statement()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        with trace.span("sql.execute"):
+            super().executemany(sql, seq_of_parameters)
+        self._count_statement()
+        return self
+
+    def executescript(self, sql_script):
+        with trace.span("sql.execute"):
+            super().executescript(sql_script)
+        trace.count("sql.statements")
+        return self
+
+    def _count_statement(self) -> None:
+        trace.count("sql.statements")
+        if self.rowcount > 0:
+            trace.count("sql.rows_written", self.rowcount)
+
+    def fetchone(self):
+        with trace.span("sql.fetch"):
+            row = super().fetchone()
+        if row is not None:
+            trace.count("sql.rows_read")
+        return row
+
+    def fetchmany(self, size=None):
+        with trace.span("sql.fetch"):
+            rows = super().fetchmany(self.arraysize if size is None else size)
+        trace.count("sql.rows_read", len(rows))
+        return rows
+
+    def fetchall(self):
+        with trace.span("sql.fetch"):
+            rows = super().fetchall()
+        trace.count("sql.rows_read", len(rows))
+        return rows
+
+    def __next__(self):
+        with trace.span("sql.fetch"):
+            row = super().__next__()
+        trace.count("sql.rows_read")
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """The connection open_connection() returns while tracing is on.
+
+    Statements are timed under "sql.execute", fetches under "sql.fetch" and
+    commits under "sql.commit", and sql.statements, sql.rows_read and
+    sql.rows_written are counted.
+    """
+
+    def cursor(self, factory=_TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        with trace.span("sql.commit"):
+            super().commit()
+
+
+def open_connection(
+    path: Path, busy_timeout: float = BUSY_TIMEOUT
+) -> sqlite3.Connection:
+    """Open a vault database, creating or migrating the schema only if needed.
+
+    An up-to-date vault costs a single PRAGMA read here; WAL mode is persisted
+    in the file when it is created and file permissions are only set then.
+    Statements wait up to busy_timeout seconds for other writers.
+    """
     ensure_parent_dir(path)
-    conn = sqlite3.connect(str(path))
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA foreign_keys=ON;")
-    conn.executescript(SCHEMA)
-    conn.commit()
-    set_file_permissions(path)
+    created = not path.exists()
+    factory = sqlite3.Connection if trace.recorder is None else TracedConnection
+    with trace.span("sql.connect"):
+        conn = sqlite3.connect(str(path), timeout=busy_timeout, factory=factory)
+        conn.execute("PRAGMA foreign_keys=ON;")
+        if created:
+            # Only takes effect before the first table exists; lets maintain()
+            # return free pages to the OS without rewriting the whole file.
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        if schema_version(conn) != SCHEMA_VERSION:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            with trace.span("sql.schema"):
+                ensure_schema(conn)
+    if created:
+        set_file_permissions(path)
     return conn
 
 
-def initialize_db(path: Path, salt: bytes, master_hash: str) -> None:
-    conn = open_connection(path)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO metadata(id, salt, master_hash) VALUES(1, ?, ?)",
-        (salt, master_hash),
+_ENTRY_COLUMNS = "id, service, username, password, notes, record, created_at, updated_at, service_idx, username_idx"
+_GET_ENTRY_SQL = f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE id=?"
+_GET_ENTRIES_SQL = f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE id IN ({{}})"
+_SCAN_ENTRIES_SQL = f"SELECT {_ENTRY_COLUMNS} FROM entries ORDER BY created_at"
+_DELETE_ENTRY_SQL = "DELETE FROM entries WHERE id=?"
+# Newest first, paged by keyset on (created_at, id) using entries_created_idx;
+# _page_sql() fills in the index hint and the WHERE clause.
+_PAGE_ENTRIES_SQL = f"SELECT {_ENTRY_COLUMNS} FROM entries{{}} WHERE {{}} ORDER BY created_at DESC, id DESC LIMIT ?"
+_FIND_ENTRIES_SQL = (
+    f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE {{}} ORDER BY created_at DESC"
+)
+_ENTRIES_AFTER_SQL = (
+    f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE id > ? ORDER BY id LIMIT ?"
+)
+_UNINDEXED_ENTRIES_SQL = f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE service_idx IS NULL OR username_idx IS NULL LIMIT ?"
+_PUT_ENTRY_SQL = (
+    f"INSERT OR REPLACE INTO entries({_ENTRY_COLUMNS}) VALUES(?,?,?,?,?,?,?,?,?,?)"
+)
+
+# Ids bound per IN query; SQLite builds before 3.32 allow 999 parameters.
+_GET_ENTRIES_BATCH = 500
+
+
+def _page_sql(before: bool, since: bool, modified_since: bool) -> str:
+    clauses = []
+    if before:
+        clauses.append("(created_at, id) < (?, ?)")
+    if since:
+        clauses.append("created_at >= ?")
+    if modified_since:
+        clauses.append("updated_at >= ?")
+    # Changes since a sync point are usually a small slice of the vault, so
+    # seek them on entries_updated_idx and sort only those rows.
+    index = " INDEXED BY entries_updated_idx" if modified_since else ""
+    return _PAGE_ENTRIES_SQL.format(index, " AND ".join(clauses) or "1")
+
+
+class SqliteEntryStore(EntryStore):
+    """The entries table of a vault, as an EntryStore.
+
+    Statements run on conn without committing, so writes join the caller's
+    transaction (see write_transaction()) together with the change and
+    search logs. The connection belongs to the caller, unless the store was
+    made by open().
+    """
+
+    def __init__(self, conn: sqlite3.Connection, scan_batch_size: int = 1000):
+        self.conn = conn
+        self.scan_batch_size = scan_batch_size
+        self._owns_conn = False
+
+    @classmethod
+    def open(cls, path: Path, busy_timeout: float = BUSY_TIMEOUT) -> "SqliteEntryStore":
+        """Open the vault at path as a store that closes its own connection."""
+        store = cls(open_connection(path, busy_timeout))
+        store._owns_conn = True
+        return store
+
+    def close(self) -> None:
+        if self._owns_conn:
+            self.conn.close()
+
+    def get(self, entry_id: str) -> Optional[tuple]:
+        return self.conn.execute(_GET_ENTRY_SQL, (entry_id,)).fetchone()
+
+    def get_many(self, entry_ids: List[str]) -> List[tuple]:
+        rows = []
+        for start in range(0, len(entry_ids), _GET_ENTRIES_BATCH):
+            batch = entry_ids[start : start + _GET_ENTRIES_BATCH]
+            sql = _GET_ENTRIES_SQL.format(",".join("?" * len(batch)))
+            rows += self.conn.execute(sql, batch).fetchall()
+        return rows
+
+    def scan(self) -> Iterator[tuple]:
+        cur = self.conn.execute(_SCAN_ENTRIES_SQL)
+        while rows := cur.fetchmany(self.scan_batch_size):
+            yield from rows
+
+    def put_many(self, rows) -> None:
+        self.conn.executemany(_PUT_ENTRY_SQL, rows)
+
+    def delete(self, entry_id: str) -> bool:
+        return self.conn.execute(_DELETE_ENTRY_SQL, (entry_id,)).rowcount > 0
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    def page(
+        self,
+        limit: int,
+        before: Optional[Tuple[int, str]] = None,
+        since: Optional[int] = None,
+        modified_since: Optional[int] = None,
+    ) -> List[tuple]:
+        sql = _page_sql(
+            before is not None, since is not None, modified_since is not None
+        )
+        params = [
+            *(before or ()),
+            *(t for t in (since, modified_since) if t is not None),
+        ]
+        return self.conn.execute(sql, (*params, limit)).fetchall()
+
+    def find(
+        self, service_idx: Optional[bytes] = None, username_idx: Optional[bytes] = None
+    ) -> List[tuple]:
+        clauses, params = [], []
+        if service_idx is not None:
+            clauses.append("service_idx=?")
+            params.append(service_idx)
+        if username_idx is not None:
+            clauses.append("username_idx=?")
+            params.append(username_idx)
+        sql = _FIND_ENTRIES_SQL.format(" AND ".join(clauses))
+        return self.conn.execute(sql, params).fetchall()
+
+    def after(self, entry_id: str, limit: int) -> List[tuple]:
+        return self.conn.execute(_ENTRIES_AFTER_SQL, (entry_id, limit)).fetchall()
+
+    def unindexed(self, limit: int) -> List[tuple]:
+        return self.conn.execute(_UNINDEXED_ENTRIES_SQL, (limit,)).fetchall()
+
+
+def insert_metadata(
+    conn: sqlite3.Connection,
+    salt: bytes,
+    key_check: bytes,
+    kdf: KdfParams = KdfParams(),
+    commit: bool = True,
+    record_format: int = 1,
+) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO metadata(id, salt, key_check, master_hash, kdf_time_cost, kdf_memory_cost, kdf_parallelism, record_format) VALUES(1, ?, ?, NULL, ?, ?, ?, ?)",
+        (
+            salt,
+            key_check,
+            kdf.time_cost,
+            kdf.memory_cost,
+            kdf.parallelism,
+            record_format,
+        ),
     )
-    conn.commit()
+    if commit:
+        conn.commit()
+
+
+def fetch_metadata(conn: sqlite3.Connection) -> Optional[VaultMetadata]:
+    cur = conn.execute(
+        "SELECT salt, key_check, master_hash, kdf_time_cost, kdf_memory_cost, kdf_parallelism, record_format FROM metadata WHERE id=1"
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    salt, key_check, master_hash, time_cost, memory_cost, parallelism, fmt = row
+    return VaultMetadata(
+        salt=salt,
+        key_check=key_check,
+        master_hash=master_hash,
+        kdf=KdfParams(time_cost, memory_cost, parallelism),
+        record_format=fmt,
+    )
+
+
+def update_key_check(conn: sqlite3.Connection, key_check: bytes) -> None:
+    """Store the key-check blob and drop the legacy PHC hash."""
+    with write_transaction(conn):
+        conn.execute(
+            "UPDATE metadata SET key_check=?, master_hash=NULL WHERE id=1",
+            (key_check,),
+        )
+
+
+def fetch_rekey_progress(conn: sqlite3.Connection) -> Optional[RekeyProgress]:
+    row = conn.execute(
+        "SELECT salt, key_check, kdf_time_cost, kdf_memory_cost, kdf_parallelism, record_format, last_id FROM rekey_progress WHERE id=1"
+    ).fetchone()
+    if not row:
+        return None
+    salt, key_check, time_cost, memory_cost, parallelism, fmt, last_id = row
+    return RekeyProgress(
+        salt=salt,
+        key_check=key_check,
+        kdf=KdfParams(time_cost, memory_cost, parallelism),
+        record_format=fmt,
+        last_id=last_id,
+    )
+
+
+def fetch_key_state(conn: sqlite3.Connection) -> Tuple[Optional[bytes], bool]:
+    """The vault's current key-check blob, and whether a rekey is in progress."""
+    row = conn.execute(
+        "SELECT key_check, EXISTS(SELECT 1 FROM rekey_progress) FROM metadata WHERE id=1"
+    ).fetchone()
+    return (row[0], bool(row[1])) if row else (None, False)
+
+
+def start_rekey(conn: sqlite3.Connection, progress: RekeyProgress) -> None:
+    """Record a new rekey; fails if one is already pending. Does not commit."""
+    conn.execute(
+        "INSERT INTO rekey_progress(id, salt, key_check, kdf_time_cost, kdf_memory_cost, kdf_parallelism, record_format, last_id) VALUES(1, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            progress.salt,
+            progress.key_check,
+            progress.kdf.time_cost,
+            progress.kdf.memory_cost,
+            progress.kdf.parallelism,
+            progress.record_format,
+            progress.last_id,
+        ),
+    )
+
+
+def advance_rekey(conn: sqlite3.Connection, last_id: str) -> None:
+    """Checkpoint the rekey after last_id. Does not commit."""
+    conn.execute("UPDATE rekey_progress SET last_id=? WHERE id=1", (last_id,))
+
+
+def finish_rekey(conn: sqlite3.Connection, progress: RekeyProgress) -> None:
+    """Switch the vault to the rekey's key and layout. Does not commit."""
+    insert_metadata(
+        conn,
+        progress.salt,
+        progress.key_check,
+        progress.kdf,
+        commit=False,
+        record_format=progress.record_format,
+    )
+    conn.execute("DELETE FROM rekey_progress")
+    clear_search_index(conn)
+
+
+# Logs a search index change, but only while there is an index to change.
+LOG_SEARCH_CHANGE_SQL = (
+    "INSERT INTO search_log(blob) SELECT ? WHERE EXISTS (SELECT 1 FROM search_index)"
+)
+
+
+def search_index_seq(conn: sqlite3.Connection) -> Optional[int]:
+    """The log sequence number the stored search index is current to."""
+    row = conn.execute("SELECT seq FROM search_index WHERE id=1").fetchone()
+    return row[0] if row else None
+
+
+def fetch_search_index(conn: sqlite3.Connection) -> Optional[Tuple[int, bytes]]:
+    return conn.execute("SELECT seq, blob FROM search_index WHERE id=1").fetchone()
+
+
+def fetch_search_log(conn: sqlite3.Connection, after: int) -> List[Tuple[int, bytes]]:
+    return conn.execute(
+        "SELECT seq, blob FROM search_log WHERE seq > ? ORDER BY seq", (after,)
+    ).fetchall()
+
+
+def last_search_seq(conn: sqlite3.Connection) -> int:
+    """The sequence number of the newest search log row ever written."""
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name='search_log'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def store_search_index(conn: sqlite3.Connection, seq: int, blob: bytes) -> bool:
+    """Replace the search index with one current to seq and drop older log rows.
+
+    Does nothing and returns False if the stored index is already newer.
+    Does not commit.
+    """
+    current = search_index_seq(conn)
+    if current is not None and current > seq:
+        return False
+    conn.execute(
+        "INSERT OR REPLACE INTO search_index(id, seq, blob) VALUES(1, ?, ?)",
+        (seq, blob),
+    )
+    conn.execute("DELETE FROM search_log WHERE seq <= ?", (seq,))
+    return True
+
+
+# Logs a local change to an entry: parameters are the entry id, "put" or
+# "del", and the current time in epoch microseconds. The clock reading is
+# bumped past every change already logged (including ones synced in from
+# other replicas), so later writes always order after what they have seen.
+LOG_CHANGE_SQL = (
+    "INSERT INTO changes(entry_id, op, hlc, origin) "
+    "SELECT ?, ?, max(?, coalesce(max(hlc), 0) + 1), "
+    "(SELECT replica_id FROM replica) FROM changes"
+)
+
+
+def replica_id(conn: sqlite3.Connection) -> str:
+    return conn.execute("SELECT replica_id FROM replica WHERE id=1").fetchone()[0]
+
+
+def new_replica_id(conn: sqlite3.Connection) -> str:
+    """Give this vault a fresh replica id, e.g. after it was copied. Does not commit."""
+    new_id = os.urandom(16).hex()
+    conn.execute("UPDATE replica SET replica_id=? WHERE id=1", (new_id,))
+    return new_id
+
+
+def last_change_seq(conn: sqlite3.Connection) -> int:
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name='changes'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def latest_change(conn: sqlite3.Connection, entry_id: str) -> Optional[Tuple[int, str]]:
+    """The (hlc, origin) of the latest change logged for entry_id."""
+    return conn.execute(
+        "SELECT hlc, origin FROM changes WHERE entry_id=? ORDER BY seq DESC LIMIT 1",
+        (entry_id,),
+    ).fetchone()
+
+
+def sync_cursor(conn: sqlite3.Connection, peer: str) -> int:
+    """The last seq of peer's change log that has been pulled from it."""
+    row = conn.execute(
+        "SELECT last_seq FROM sync_peers WHERE replica_id=?", (peer,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def set_sync_cursor(conn: sqlite3.Connection, peer: str, last_seq: int) -> None:
+    """Record that peer's changes up to last_seq have been pulled. Does not commit."""
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_peers(replica_id, last_seq) VALUES(?, ?)",
+        (peer, last_seq),
+    )
+
+
+def prune_changes(conn: sqlite3.Connection) -> int:
+    """Drop change log rows superseded by a later change to the same entry.
+
+    Sync only ever sends an entry's latest change, so this loses nothing.
+    Does not commit.
+    """
+    return conn.execute(
+        "DELETE FROM changes WHERE seq < "
+        "(SELECT max(seq) FROM changes AS later WHERE later.entry_id = changes.entry_id)"
+    ).rowcount
+
+
+def clear_search_index(conn: sqlite3.Connection) -> None:
+    """Drop the search index and its log so the next search rebuilds it.
+
+    Does not commit.
+    """
+    conn.execute("DELETE FROM search_index")
+    conn.execute("DELETE FROM search_log")
+
+
+def initialize_db(
+    path: Path, salt: bytes, key_check: bytes, kdf: KdfParams = KdfParams()
+) -> None:
+    conn = open_connection(path)
+    insert_metadata(conn, salt, key_check, kdf)
     conn.close()
 
 
-def read_metadata(path: Path):
+def read_metadata(path: Path) -> Optional[VaultMetadata]:
     conn = open_connection(path)
-    cur = conn.cursor()
-    cur.execute("SELECT salt, master_hash FROM metadata WHERE id=1")
-    row = cur.fetchone()
+    meta = fetch_metadata(conn)
+    conn.close()
+    return meta
+
+
+def write_key_check(path: Path, key_check: bytes) -> None:
+    conn = open_connection(path)
+    update_key_check(conn, key_check)
     conn.close()
-    return row if row else None
+
+
+_AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def maintain(conn: sqlite3.Connection, full: bool = False) -> MaintenanceReport:
+    """Reclaim space, reset the WAL and refresh planner statistics.
+
+    First drops superseded rows from the sync change log. Then runs an
+    incremental vacuum, a truncating WAL checkpoint, ANALYZE and
+    integrity_check, each in its own short transaction, so concurrent
+    readers keep working; a reader holding an old snapshot only stops the
+    checkpoint from resetting the WAL, which is reported as checkpoint_busy.
+    full=True instead rewrites the file with VACUUM, switching vaults
+    created before auto_vacuum was enabled to incremental mode; that blocks
+    writers for the duration and needs free disk space for a copy.
+    """
+    with write_transaction(conn):
+        changes_pruned = prune_changes(conn)
+    pages_before = _pragma(conn, "page_count")
+    if full:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    elif _pragma(conn, "auto_vacuum") == 2:
+        # Frees one page per step, so it must be stepped to completion.
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+    conn.execute("ANALYZE")
+    conn.commit()
+    busy, _log, _done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    integrity = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+
+    tables = [
+        r[0]
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    row_counts = {
+        t: conn.execute(f'SELECT count(*) FROM "{t}"').fetchone()[0] for t in tables
+    }
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    wal = Path(db_file + "-wal") if db_file else None
+    page_count = _pragma(conn, "page_count")
+    return MaintenanceReport(
+        page_size=_pragma(conn, "page_size"),
+        page_count=page_count,
+        free_pages=_pragma(conn, "freelist_count"),
+        wal_bytes=wal.stat().st_size if wal is not None and wal.exists() else 0,
+        auto_vacuum=_AUTO_VACUUM_MODES.get(_pragma(conn, "auto_vacuum"), "unknown"),
+        pages_vacuumed=max(pages_before - page_count, 0),
+        checkpoint_busy=bool(busy),
+        integrity=integrity,
+        row_counts=row_counts,
+        changes_pruned=changes_pruned,
+    )
+
+
+def run_maintenance(path: Path, full: bool = False) -> MaintenanceReport:
+    conn = open_connection(path)
+    try:
+        return maintain(conn, full)
+    finally:
+        conn.close()
+
+
+# Writes merged into one transaction at most by GroupCommitWriter.
+GROUP_COMMIT_MAX_BATCH = 1000
+
+
+class GroupCommitWriter:
+    """A thread that merges writes from many callers into shared transactions.
+
+    submit() queues a statement, or submit_group() several that must commit
+    together, and returns a Future. The writer takes everything queued since
+    its last commit (up to max_batch submissions), runs it in one write
+    transaction and resolves the futures, so a burst of concurrent inserts
+    costs one lock acquisition and one fsync instead of one each. If the
+    shared transaction fails, its submissions are retried one per
+    transaction so only the offending ones fail.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        busy_timeout: float = BUSY_TIMEOUT,
+    ):
+        self.path = Path(path)
+        self.max_batch = max_batch
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, args=(busy_timeout,), name="group-commit", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, sql: str, params: tuple) -> Future:
+        return self.submit_group([(sql, params)])
+
+    def submit_group(self, statements: List[Tuple[str, tuple]]) -> Future:
+        """Queue (sql, params) pairs that commit together or not at all.
+
+        A statement may also be a callable, run with the writer's connection
+        inside the transaction; if it raises, the group is not committed.
+        """
+        future = Future()
+        self._queue.put((statements, future))
+        return future
+
+    def execute(self, sql: str, params: tuple) -> None:
+        """Queue a statement and wait until it has been committed."""
+        self.submit(sql, params).result()
+
+    def execute_group(self, statements: List[Tuple[str, tuple]]) -> None:
+        """Queue statements and wait until they have been committed."""
+        self.submit_group(statements).result()
+
+    def close(self) -> None:
+        """Commit whatever is queued, then stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self, busy_timeout: float) -> None:
+        conn = open_connection(self.path, busy_timeout)
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[tuple]) -> None:
+        try:
+            with write_transaction(conn):
+                for statements, _future in batch:
+                    for statement in statements:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(*statement)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    self._commit(conn, [item])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        self.commits += 1
+        for _statements, future in batch:
+            future.set_result(None)
+
+
+_writers = {}  # resolved vault path -> [GroupCommitWriter, users]
+_writers_lock = threading.Lock()
+
+
+def acquire_writer(path: Path, busy_timeout: float = BUSY_TIMEOUT) -> GroupCommitWriter:
+    """Return the process-wide group-commit writer for path, starting it if needed.
+
+    Every session on the same vault shares one writer so their inserts can be
+    merged; pair each call with release_writer().
+    """
+    key = Path(path).resolve()
+    with _writers_lock:
+        entry = _writers.get(key)
+        if entry is None:
+            entry = _writers[key] = [
+                GroupCommitWriter(key, busy_timeout=busy_timeout),
+                0,
+            ]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_writer(writer: GroupCommitWriter) -> None:
+    """Drop one use of writer; the last user stops its thread."""
+    with _writers_lock:
+        entry = _writers[writer.path]
+        entry[1] -= 1
+        if entry[1]:
+            return
+        del _writers[writer.path]
+    writer.close()
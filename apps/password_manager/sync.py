@@ -0,0 +1,268 @@
+"""Incremental sync between replicas of one vault.
+
+Every write to entries also appends to the vault's change log: the entry
+id, whether it was stored ("put") or deleted ("del"), a hybrid logical
+clock reading and the replica that made the change (see
+storage.LOG_CHANGE_SQL). A sync pulls each replica's changes since the last
+sync into the other, only the newest change per entry, and keeps whichever
+change has the greater (hlc, origin). Its cost follows the number of
+changes, not the size of the vault.
+
+Rows travel as stored, still encrypted, so both replicas must use the same
+key. In other words they are copies of one vault, not vaults rekeyed
+separately. The peer is either another vault file (sync_vaults()) or a
+process running serve() at the other end of a pipe (sync_stream()).
+"""
+
+import base64
+import json
+from typing import IO, Iterator, List, Tuple
+
+from . import core, crypto, storage
+from .models import SyncReport
+
+# Changes read, sent and applied per batch; each batch commits on its own.
+SYNC_BATCH_SIZE = 500
+
+# The latest change of each entry in a range of seqs. The stored rows of the
+# "put"s come from the vault's entry store, which need not be this database.
+_CHANGES_SQL = (
+    "SELECT c.seq, c.entry_id, c.op, c.hlc, c.origin FROM changes AS c "
+    "WHERE c.seq > ? AND c.seq <= ? "
+    "AND c.seq = (SELECT max(seq) FROM changes WHERE entry_id = c.entry_id) "
+    "ORDER BY c.seq LIMIT ?"
+)
+_APPLY_CHANGE_SQL = "INSERT INTO changes(entry_id, op, hlc, origin) VALUES(?, ?, ?, ?)"
+
+# Positions of the BLOB columns in a change's row (all but the timestamps).
+_BLOB_COLUMNS = frozenset({0, 1, 2, 3, 4, 7, 8})
+
+# A change is (entry_id, op, hlc, origin, row): row holds the entry's
+# stored columns after the id for a "put", None for "del".
+Change = Tuple[str, str, int, str, tuple]
+
+
+def read_changes(
+    vault: core.Vault, after: int, upto: int, batch_size: int = SYNC_BATCH_SIZE
+) -> Iterator[Tuple[List[Change], int]]:
+    """Yield (changes, last seq) batches of the changes logged in (after, upto]."""
+    while True:
+        rows = vault.conn.execute(_CHANGES_SQL, (after, upto, batch_size)).fetchall()
+        if not rows:
+            return
+        after = rows[-1][0]
+        stored = {
+            r[0]: r[1:]
+            for r in vault.entries.get_many([r[1] for r in rows if r[2] == "put"])
+        }
+        # A put whose row has gone since was followed by a delete, which has
+        # a later seq and is sent in its place.
+        yield [
+            (*r[1:5], stored[r[1]] if r[2] == "put" else None)
+            for r in rows
+            if r[2] != "put" or r[1] in stored
+        ], after
+
+
+def apply_changes(
+    vault: core.Vault, changes: List[Change], peer: str, last_seq: int
+) -> int:
+    """Merge a batch of peer's changes; return how many were newer than ours.
+
+    The batch commits together with the cursor recording that peer's log has
+    been pulled up to last_seq, so an interrupted sync picks up after the
+    last batch it applied.
+    """
+    cipher = vault._require_cipher()
+    conn = vault.conn
+    applied = 0
+    with storage.write_transaction(conn):
+        vault._check_key(conn)
+        indexed = storage.search_index_seq(conn) is not None
+        for entry_id, op, hlc, origin, row in changes:
+            ours = storage.latest_change(conn, entry_id)
+            if ours is not None and tuple(ours) >= (hlc, origin):
+                continue
+            if op == "put":
+                vault.entries.put((entry_id, *row))
+            else:
+                vault.entries.delete(entry_id)
+            conn.execute(_APPLY_CHANGE_SQL, (entry_id, op, hlc, origin))
+            if indexed:
+                if op == "put":
+                    service, username, _password, notes = core._open_fields(
+                        cipher, entry_id, row[:4], row[4]
+                    )
+                    search_change = vault._search_change(
+                        "put",
+                        entry_id,
+                        service.decode("utf-8"),
+                        username.decode("utf-8"),
+                        notes.decode("utf-8") if notes else None,
+                    )
+                else:
+                    search_change = vault._search_change("del", entry_id)
+                conn.execute(*search_change)
+            vault.invalidate(entry_id)
+            applied += 1
+        storage.set_sync_cursor(conn, peer, last_seq)
+    return applied
+
+
+def _check_same_key(vault: core.Vault, key_check: bytes) -> None:
+    vault._require_cipher()
+    if not crypto.verify_key_check(vault.key, key_check):
+        raise ValueError(
+            "The vaults do not share a key; only copies of one vault can be synced"
+        )
+
+
+def _start_seq(vault: core.Vault, after: int) -> Tuple[int, int]:
+    """The range of our changes to send a peer that has pulled up to after."""
+    upto = storage.last_change_seq(vault.conn)
+    # A cursor past the end means this log was replaced (e.g. by restoring
+    # an older copy of the file), so the peer gets all of it again.
+    return (after if after <= upto else 0), upto
+
+
+def _pull(dst: core.Vault, src: core.Vault) -> Tuple[int, int]:
+    peer = storage.replica_id(src.conn)
+    after, upto = _start_seq(src, storage.sync_cursor(dst.conn, peer))
+    received = applied = 0
+    for changes, last_seq in read_changes(src, after, upto):
+        received += len(changes)
+        applied += apply_changes(dst, changes, peer, last_seq)
+    with storage.write_transaction(dst.conn):
+        storage.set_sync_cursor(dst.conn, peer, upto)
+    return received, applied
+
+
+def sync_vaults(local: core.Vault, peer: core.Vault) -> SyncReport:
+    """Bring two unlocked replicas up to date with each other.
+
+    If peer turns out to be a plain copy of local (same replica id), it is
+    given a new replica id first.
+    """
+    _check_same_key(local, storage.fetch_metadata(peer.conn).key_check)
+    if storage.replica_id(local.conn) == storage.replica_id(peer.conn):
+        with storage.write_transaction(peer.conn):
+            storage.new_replica_id(peer.conn)
+    received, applied = _pull(local, peer)
+    sent, peer_applied = _pull(peer, local)
+    return SyncReport(received, applied, sent, peer_applied)
+
+
+# Over a pipe, each side writes one JSON object per line. The client sends
+# {"replica", "key_check"}; the server answers {"replica", "since"}, where
+# since is how far it has pulled the client's log. The client then sends
+# {"changes", "seq"} batches and {"done": last seq, "since"}, and the
+# server answers with its own batches and {"done", "applied"}. Either side
+# may send {"error"} instead and stop.
+
+
+def _send(stream: IO[str], message: dict) -> None:
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+def _receive(stream: IO[str]) -> dict:
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("The sync peer closed the connection")
+    message = json.loads(line)
+    if "error" in message:
+        raise RuntimeError(f"Sync peer: {message['error']}")
+    return message
+
+
+def _encode_change(change: Change) -> list:
+    *head, row = change
+    if row is not None:
+        row = [
+            base64.b64encode(v).decode("ascii") if isinstance(v, bytes) else v
+            for v in row
+        ]
+    return [*head, row]
+
+
+def _decode_change(change: list) -> Change:
+    *head, row = change
+    if row is not None:
+        row = tuple(
+            base64.b64decode(v) if i in _BLOB_COLUMNS and v is not None else v
+            for i, v in enumerate(row)
+        )
+    return (*head, row)
+
+
+def _send_changes(vault: core.Vault, stream: IO[str], after: int) -> Tuple[int, int]:
+    """Stream our changes after seq after; return (count, last seq sent)."""
+    after, upto = _start_seq(vault, after)
+    sent = 0
+    for changes, last_seq in read_changes(vault, after, upto):
+        _send(
+            stream,
+            {"changes": [_encode_change(c) for c in changes], "seq": last_seq},
+        )
+        sent += len(changes)
+    return sent, upto
+
+
+def _receive_changes(
+    vault: core.Vault, stream: IO[str], peer: str
+) -> Tuple[int, int, dict]:
+    """Apply batches until "done"; return (received, applied, done message)."""
+    received = applied = 0
+    while True:
+        message = _receive(stream)
+        if "done" in message:
+            with storage.write_transaction(vault.conn):
+                storage.set_sync_cursor(vault.conn, peer, message["done"])
+            return received, applied, message
+        changes = [_decode_change(c) for c in message["changes"]]
+        received += len(changes)
+        applied += apply_changes(vault, changes, peer, message["seq"])
+
+
+def sync_stream(vault: core.Vault, instream: IO[str], outstream: IO[str]) -> SyncReport:
+    """Sync with a serve() process reading outstream and writing instream."""
+    vault._require_cipher()
+    key_check = storage.fetch_metadata(vault.conn).key_check
+    _send(
+        outstream,
+        {
+            "replica": storage.replica_id(vault.conn),
+            "key_check": base64.b64encode(key_check).decode("ascii"),
+        },
+    )
+    hello = _receive(instream)
+    peer = hello["replica"]
+    sent, upto = _send_changes(vault, outstream, hello["since"])
+    _send(outstream, {"done": upto, "since": storage.sync_cursor(vault.conn, peer)})
+    received, applied, done = _receive_changes(vault, instream, peer)
+    return SyncReport(received, applied, sent, done["applied"])
+
+
+def serve(vault: core.Vault, instream: IO[str], outstream: IO[str]) -> SyncReport:
+    """Answer one sync_stream() client; the peer's changes are applied first."""
+    hello = _receive(instream)
+    peer = hello["replica"]
+    try:
+        _check_same_key(vault, base64.b64decode(hello["key_check"]))
+    except ValueError as e:
+        _send(outstream, {"error": str(e)})
+        raise
+    if peer == storage.replica_id(vault.conn):
+        with storage.write_transaction(vault.conn):
+            storage.new_replica_id(vault.conn)
+    _send(
+        outstream,
+        {
+            "replica": storage.replica_id(vault.conn),
+            "since": storage.sync_cursor(vault.conn, peer),
+        },
+    )
+    received, applied, done = _receive_changes(vault, instream, peer)
+    sent, upto = _send_changes(vault, outstream, done["since"])
+    _send(outstream, {"done": upto, "applied": applied})
+    return SyncReport(received, applied, sent)
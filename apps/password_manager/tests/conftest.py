@@ -0,0 +1,29 @@
+import pytest
+
+from apps.password_manager import core
+from apps.password_manager.models import KdfParams
+
+
+@pytest.fixture
+def fast_kdf():
+    """Argon2 settings cheap enough to derive many keys in one test."""
+    return KdfParams(time_cost=1, memory_cost=8192, parallelism=1)
+
+
+@pytest.fixture
+def make_vault(tmp_path, fast_kdf):
+    """Create vaults under tmp_path with the master password "master-pass".
+
+    The factory adds entries ("svc0", "user0", "pw0") and so on, and returns
+    the vault's path and key. kdf defaults to fast_kdf; other options go to
+    core.Vault.create().
+    """
+
+    def make(name="vault.db", entries=0, kdf=None, **options):
+        db = tmp_path / name
+        with core.Vault.create(db, "master-pass", kdf or fast_kdf, **options) as vault:
+            for i in range(entries):
+                vault.add_entry(f"svc{i}", f"user{i}", f"pw{i}", None)
+            return db, vault.key
+
+    return make
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+from typer.testing import CliRunner
+
+from apps.password_manager import agent, core, main
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def running_agent(tmp_path, monkeypatch):
+    sock = tmp_path / "run" / "brahmand5" / "agent.sock"
+    monkeypatch.setenv(agent.SOCKET_ENV, str(sock))
+    key_agent = agent.KeyAgent(sock, idle_timeout=60)
+    thread = threading.Thread(
+        target=key_agent.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield key_agent
+    key_agent.shutdown()
+    thread.join(timeout=5)
+
+
+def test_socket_is_private(running_agent):
+    assert running_agent.sock_path.stat().st_mode & 0o777 == 0o600
+    assert running_agent.sock_path.parent.stat().st_mode & 0o777 == 0o700
+
+
+def test_add_get_and_lock(running_agent, tmp_path):
+    db = tmp_path / "vault.db"
+    assert agent.get_key(db) is None
+    agent.add_key(db, b"k" * 32)
+    assert agent.get_key(db) == b"k" * 32
+    agent.lock(db)
+    assert agent.get_key(db) is None
+
+
+def test_idle_timeout_forgets_keys(running_agent, tmp_path):
+    running_agent.idle_timeout = 0.1
+    db = tmp_path / "vault.db"
+    agent.add_key(db, b"k" * 32)
+    time.sleep(0.3)
+    assert running_agent.vault_count() == 0
+    assert agent.get_key(db) is None
+
+
+def test_stop_removes_socket(running_agent):
+    agent.stop()
+    for _ in range(50):
+        if not running_agent.sock_path.exists():
+            break
+        time.sleep(0.05)
+    assert not agent.is_running()
+    assert not running_agent.sock_path.exists()
+
+
+def test_no_agent_returns_none(tmp_path):
+    assert agent.get_key(tmp_path / "vault.db", tmp_path / "missing.sock") is None
+    assert not agent.is_running(tmp_path / "missing.sock")
+
+
+def test_cli_uses_agent_key(running_agent, tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "test")
+    key = core.unlock_vault(db, "test")
+    entry_id = core.add_entry(db, key, "GitHub", "alice", "secret", None)
+
+    result = runner.invoke(
+        main.app, ["agent", "unlock", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+
+    # No password on stdin: the key must come from the agent.
+    result = runner.invoke(main.app, ["get", entry_id, "--db", str(db)], input="")
+    assert result.exit_code == 0
+    assert "secret" in result.stdout
+
+    result = runner.invoke(main.app, ["agent", "lock"])
+    assert result.exit_code == 0
+    result = runner.invoke(
+        main.app, ["get", entry_id, "--db", str(db)], input="wrong\n"
+    )
+    assert result.exit_code == 1
+
+
+def test_cli_ignores_stale_agent_key(running_agent, tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "test")
+    agent.add_key(db.resolve(), b"\0" * 32)
+
+    result = runner.invoke(main.app, ["list", "--db", str(db)], input="test\n")
+    assert result.exit_code == 0
+    assert "Master password" in result.stdout
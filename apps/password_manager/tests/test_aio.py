@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from apps.password_manager import aio, core
+from apps.password_manager.models import KdfParams
+
+
+def test_async_round_trip(make_vault):
+    db, _key = make_vault(entries=5)
+
+    async def main():
+        async with await aio.AsyncVault.open(db) as vault:
+            assert not await vault.unlock("wrong")
+            with pytest.raises(RuntimeError):
+                await vault.get_entry("x")
+            assert await vault.unlock("master-pass")
+            ids = await asyncio.gather(
+                *(vault.add_entry(f"new{i}", "bob", f"np{i}") for i in range(20))
+            )
+            got = await asyncio.gather(*(vault.get_entry(i) for i in ids))
+            assert [g["password"] for g in got] == [f"np{i}" for i in range(20)]
+            assert await vault.get_entry("missing") is None
+            listed = [e async for e in vault.iter_entries(page_size=4)]
+            return vault.key, listed
+
+    key, listed = asyncio.run(main())
+    with core.Vault(db, key) as vault:
+        assert listed == vault.list_entries_decrypted()
+    assert len(listed) == 25
+
+
+def test_unlock_does_not_block_the_loop(make_vault):
+    db, _key = make_vault(kdf=KdfParams(time_cost=3, memory_cost=65536, parallelism=1))
+
+    async def main():
+        async with await aio.AsyncVault.open(db) as vault:
+            ticks = 0
+            unlock = asyncio.ensure_future(vault.unlock("master-pass"))
+            start = time.perf_counter()
+            while not unlock.done():
+                await asyncio.sleep(0.005)
+                ticks += 1
+            assert await unlock
+            return ticks, time.perf_counter() - start
+
+    ticks, elapsed = asyncio.run(main())
+    # The loop kept running for most of the Argon2 derivation.
+    assert ticks >= 5
+    assert ticks >= elapsed / 0.005 / 4
+
+
+def _gate_encrypt(monkeypatch):
+    """Make every add block in _encrypt_entry until the gate opens."""
+    gate = threading.Event()
+    entered = []
+    real_encrypt = core.Vault._encrypt_entry
+
+    def gated_encrypt(self, *args):
+        entered.append(args[0])
+        gate.wait(5)
+        return real_encrypt(self, *args)
+
+    monkeypatch.setattr(core.Vault, "_encrypt_entry", gated_encrypt)
+    return gate, entered
+
+
+def test_max_pending_applies_backpressure(make_vault, monkeypatch):
+    db, _key = make_vault()
+    gate, entered = _gate_encrypt(monkeypatch)
+
+    async def main():
+        async with await aio.AsyncVault.open(
+            db, crypto_workers=4, max_pending=2
+        ) as vault:
+            await vault.unlock("master-pass")
+            adds = [
+                asyncio.ensure_future(vault.add_entry(f"s{i}", "u", "p"))
+                for i in range(6)
+            ]
+            await asyncio.sleep(0.1)
+            assert len(entered) == 2
+            gate.set()
+            await asyncio.gather(*adds)
+            return len(await vault.list_entries())
+
+    assert asyncio.run(main()) == 6
+
+
+def test_cancelled_call_never_runs(make_vault, monkeypatch):
+    db, _key = make_vault()
+    gate, entered = _gate_encrypt(monkeypatch)
+
+    async def main():
+        async with await aio.AsyncVault.open(db, crypto_workers=1) as vault:
+            await vault.unlock("master-pass")
+            first = asyncio.ensure_future(vault.add_entry("first", "u", "p"))
+            second = asyncio.ensure_future(vault.add_entry("second", "u", "p"))
+            await asyncio.sleep(0.05)
+            second.cancel()
+            # Let the cancellation reach the queued executor job.
+            await asyncio.sleep(0.01)
+            gate.set()
+            await first
+            with pytest.raises(asyncio.CancelledError):
+                await second
+            return [e["service"] for e in await vault.list_entries()]
+
+    assert asyncio.run(main()) == ["first"]
+    assert entered == ["first"]
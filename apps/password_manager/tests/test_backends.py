@@ -0,0 +1,203 @@
+import pytest
+
+from apps.password_manager import core, storage
+from apps.password_manager.backends import LogEntryStore
+
+
+class _Sqlite:
+    def __init__(self, tmp_path):
+        self.path = tmp_path / "vault.db"
+
+    def open(self):
+        store = storage.SqliteEntryStore.open(self.path)
+        store.scan_batch_size = 2
+        return store
+
+    def write(self, store, fn, *args):
+        with storage.write_transaction(store.conn):
+            return fn(*args)
+
+
+class _Log:
+    def __init__(self, tmp_path):
+        self.path = tmp_path / "entries.log"
+
+    def open(self):
+        return LogEntryStore(self.path)
+
+    def write(self, store, fn, *args):
+        return fn(*args)
+
+
+@pytest.fixture(params=[_Sqlite, _Log], ids=["sqlite", "log"])
+def backend(request, tmp_path):
+    return request.param(tmp_path)
+
+
+def _row(n, created_at=None, notes=True):
+    blob = f"cipher-{n}".encode()
+    return (
+        f"id-{n}",
+        blob + b"-s",
+        blob + b"-u",
+        blob + b"-p",
+        blob + b"-n" if notes else None,
+        None,
+        created_at if created_at is not None else 1_000 + n,
+        2_000 + n,
+        blob + b"-i",
+        None,
+    )
+
+
+def test_put_get_replace_delete(backend):
+    with backend.open() as store:
+        assert store.get("id-1") is None and len(store) == 0
+        backend.write(store, store.put_many, [_row(n) for n in range(5)])
+        assert store.get("id-3") == _row(3)
+        assert len(store) == 5
+
+        replaced = _row(3, notes=False)
+        backend.write(store, store.put, replaced)
+        assert store.get("id-3") == replaced and len(store) == 5
+        assert backend.write(store, store.delete, "id-3") is True
+        assert backend.write(store, store.delete, "id-3") is False
+        assert store.get("id-3") is None and len(store) == 4
+
+        rows = store.get_many(["id-4", "nope", "id-0"])
+        assert sorted(r[0] for r in rows) == ["id-0", "id-4"]
+
+
+def test_scan_is_oldest_first(backend):
+    with backend.open() as store:
+        rows = [_row(n, created_at=100 - n) for n in range(7)]
+        backend.write(store, store.put_many, rows)
+        assert list(store.scan()) == rows[::-1]
+
+
+def test_reopen_keeps_rows(backend):
+    rows = [_row(n) for n in range(20)]
+    with backend.open() as store:
+        backend.write(store, store.put_many, rows)
+        backend.write(store, store.delete, "id-7")
+        backend.write(store, store.put, _row(8, notes=False))
+    with backend.open() as store:
+        assert len(store) == 19
+        assert store.get("id-7") is None
+        assert store.get("id-8") == _row(8, notes=False)
+        assert [r[0] for r in store.scan()] == [r[0] for r in rows if r[0] != "id-7"]
+
+
+def test_log_replays_writes_after_the_index(tmp_path):
+    path = tmp_path / "entries.log"
+    with LogEntryStore(path) as store:
+        store.put_many([_row(n) for n in range(10)])
+    store = LogEntryStore(path)
+    store.put(_row(10))
+    store.delete("id-0")
+    # Not closed, as after a crash: the saved index predates the last writes.
+    store._file.close()
+    with LogEntryStore(path) as store:
+        assert len(store) == 10
+        assert store.get("id-0") is None and store.get("id-10") == _row(10)
+
+    path.with_name("entries.log.idx").unlink()
+    with LogEntryStore(path) as store:
+        assert len(store) == 10 and store.get("id-10") == _row(10)
+
+
+def test_log_cuts_off_torn_record(tmp_path):
+    path = tmp_path / "entries.log"
+    with LogEntryStore(path) as store:
+        store.put_many([_row(n) for n in range(3)])
+    size = path.stat().st_size
+    with LogEntryStore(path) as store:
+        store.put(_row(3))
+        store._save_index = lambda: None
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 5)
+    with LogEntryStore(path) as store:
+        assert len(store) == 3 and store.get("id-3") is None
+        assert path.stat().st_size == size
+        store.put(_row(4))
+    with LogEntryStore(path) as store:
+        assert store.get("id-4") == _row(4)
+
+
+def test_log_compaction(tmp_path):
+    path = tmp_path / "entries.log"
+    with LogEntryStore(path, durable=False) as store:
+        store.put_many([_row(n) for n in range(10)])
+        for n in range(8):
+            store.put(_row(n, notes=False))
+        for n in range(0, 10, 2):
+            store.delete(f"id-{n}")
+        assert store.needs_compaction
+        before = path.stat().st_size
+        expected = list(store.scan())
+        store.compact()
+        assert not store.needs_compaction
+        assert path.stat().st_size < before / 2
+        assert list(store.scan()) == expected
+        store.put(_row(20))
+    with LogEntryStore(path) as store:
+        assert list(store.scan()) == expected + [_row(20)]
+
+
+def test_log_rejects_other_files(tmp_path):
+    path = tmp_path / "vault.db"
+    path.write_bytes(b"SQLite format 3\x00")
+    with pytest.raises(ValueError, match="not an entry log"):
+        LogEntryStore(path)
+
+
+def test_queries(backend):
+    rows = [(*_row(n, 1_000 + n // 2)[:9], b"u-%d" % n) for n in range(9)]
+    rows[4] = (*rows[4][:8], None, None)
+    with backend.open() as store:
+        backend.write(store, store.put_many, rows)
+        newest = sorted(rows, key=lambda r: (r[6], r[0]), reverse=True)
+        assert store.page(4) == newest[:4]
+        before = (newest[3][6], newest[3][0])
+        assert store.page(4, before) == newest[4:8]
+        assert store.page(10, since=1_003) == newest[:3]
+        assert [r[0] for r in store.page(10, modified_since=2_007)] == ["id-8", "id-7"]
+
+        assert store.find(service_idx=rows[2][8]) == [rows[2]]
+        assert store.find(rows[2][8], rows[3][9]) == []
+        assert store.after("id-2", 3) == rows[3:6]
+        assert store.after("id-8", 3) == []
+        assert store.unindexed(5) == [rows[4]]
+
+
+def test_vault_on_a_log_store(tmp_path, make_vault):
+    db, key = make_vault()
+    log = tmp_path / "entries.log"
+    with core.Vault(db, key, store=LogEntryStore(log)) as vault:
+        github = vault.add_entry("GitHub", "alice", "pw", "work")
+        vault.import_entries(
+            {"service": f"svc{i}", "username": "bob", "password": f"pw{i}"}
+            for i in range(5)
+        )
+        assert vault.update_entry(github, password="new")
+        assert vault.delete_entry(vault.find_entries(service="svc0")[0]["id"])
+        page = list(vault.iter_entries_decrypted(limit=2))
+        assert len(page) == 2
+        rest = list(vault.iter_entries_decrypted(after=page[-1]["id"]))
+        assert [e["service"] for e in page + rest][-1] == "GitHub"
+        assert len(page + rest) == 5
+        assert [r["id"] for r in vault.search("github")] == [github]
+        assert vault.conn.execute("SELECT count(*) FROM entries").fetchone() == (0,)
+        vault.rekey("new-pass", record_format=2)
+        key = vault.key
+
+    with core.Vault(db, key, store=LogEntryStore(log)) as vault:
+        assert vault.get_entry(github)["password"] == "new"
+        assert len(vault.find_entries(username="bob")) == 4
+        assert sorted(e["password"] for e in vault.export_entries()) == [
+            "new",
+            "pw1",
+            "pw2",
+            "pw3",
+            "pw4",
+        ]
@@ -0,0 +1,31 @@
+from apps.password_manager.benchmarks import suite
+
+
+def test_suite_smoke():
+    results = suite.run_suite(
+        sizes=(5,),
+        ops=["get_entry", "list_entries_decrypted", "generate_strong_password"],
+        isolate=False,
+        log=lambda *_: None,
+    )
+    by_op = {r["op"]: r for r in results}
+    assert set(by_op) == {
+        "get_entry",
+        "list_entries_decrypted",
+        "generate_strong_password",
+    }
+    assert by_op["get_entry"]["size"] == 5
+    assert by_op["generate_strong_password"]["size"] is None
+    for r in results:
+        assert r["samples"] >= suite.MIN_SAMPLES
+        assert r["min_us"] <= r["p50_us"] <= r["p99_us"] <= r["max_us"]
+        assert r["peak_rss_kb"] > 0
+
+
+def test_compare_flags_regressions():
+    def report(p50):
+        return {"results": [{"op": "get_entry", "size": 10, "p50_us": p50}]}
+
+    assert suite.compare(report(10.0), report(11.0), threshold=1.2) == []
+    (line,) = suite.compare(report(10.0), report(15.0), threshold=1.2)
+    assert "get_entry" in line and "1.50x" in line
@@ -0,0 +1,66 @@
+import pytest
+
+from apps.password_manager.cache import EntryCache
+from apps.password_manager.models import Entry
+
+
+def _entry(id_, password="secret", notes=None):
+    return Entry(
+        id=id_,
+        service="svc",
+        username="user",
+        password=bytearray(password.encode()),
+        notes=bytearray(notes.encode()) if notes is not None else None,
+        created_at="2024-01-01T00:00:00",
+        updated_at="2024-01-01T00:00:00",
+    )
+
+
+def test_lru_eviction_wipes_evicted_entry():
+    cache = EntryCache(max_size=2)
+    a, b, c = _entry("a", notes="n"), _entry("b"), _entry("c")
+    cache.put(a)
+    cache.put(b)
+    assert cache.get("a") is a  # "b" is now least recently used
+    cache.put(c)
+    assert cache.get("b") is None
+    assert b.password == bytearray(len("secret"))
+    assert cache.get("a") is a and cache.get("c") is c
+    assert a.password == bytearray(b"secret") and a.notes == bytearray(b"n")
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_ttl_expiry_uses_clock():
+    now = [100.0]
+    cache = EntryCache(max_size=4, ttl=30, clock=lambda: now[0])
+    entry = _entry("a")
+    cache.put(entry)
+    now[0] += 30
+    assert cache.get("a") is entry
+    now[0] += 1
+    assert cache.get("a") is None
+    assert entry.password == bytearray(len("secret"))
+
+    cache.put(_entry("b"))
+    now[0] += 31
+    cache.purge_expired()
+    assert len(cache) == 0
+
+
+def test_invalidate_and_clear_wipe_entries():
+    cache = EntryCache(max_size=4)
+    a, b = _entry("a"), _entry("b", notes="note")
+    cache.put(a)
+    cache.put(b)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert a.password == bytearray(len("secret"))
+    cache.clear()
+    assert len(cache) == 0
+    assert b.notes == bytearray(len("note"))
+
+
+def test_max_size_must_be_positive():
+    with pytest.raises(ValueError):
+        EntryCache(max_size=0)
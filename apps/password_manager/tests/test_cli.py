@@ -1,6 +1,9 @@
 from typer.testing import CliRunner
 from apps.password_manager import main
+import json
+import os
 import re
+import shutil
 
 runner = CliRunner()
 
@@ -96,3 +99,461 @@ def test_get_requires_auth(tmp_path):
     assert result.exit_code == 0
     assert "GitHub" in result.stdout
     assert "alice" in result.stdout
+
+
+def test_import_and_export(tmp_path):
+    db = tmp_path / "vault.db"
+    result = runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    assert result.exit_code == 0
+
+    src = tmp_path / "creds.csv"
+    src.write_text(
+        "service,username,password,notes\n"
+        "GitHub,alice,secret1,work\n"
+        "GitLab,bob,secret2,\n"
+    )
+    result = runner.invoke(
+        main.app, ["import", str(src), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert "Imported 2 entries" in result.stderr
+
+    dest = tmp_path / "out.jsonl"
+    result = runner.invoke(
+        main.app, ["export", str(dest), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in dest.read_text().splitlines()]
+    assert {(r["service"], r["username"], r["password"]) for r in records} == {
+        ("GitHub", "alice", "secret1"),
+        ("GitLab", "bob", "secret2"),
+    }
+    assert oct(dest.stat().st_mode & 0o777) == "0o600"
+
+    # JSON to stdout, then re-import it
+    result = runner.invoke(
+        main.app, ["export", "--format", "json", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    payload = result.stdout[result.stdout.index("[") :]
+    assert len(json.loads(payload)) == 2
+
+
+def test_import_rejects_incomplete_records(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+
+    src = tmp_path / "creds.jsonl"
+    src.write_text(
+        '{"service": "GitHub", "username": "alice", "password": "pw"}\n'
+        '{"service": "GitLab", "username": "bob"}\n'
+    )
+    result = runner.invoke(
+        main.app, ["import", str(src), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 2
+    assert "missing password" in result.stderr
+
+    result = runner.invoke(main.app, ["list", "--db", str(db)], input="test\n")
+    assert "GitHub" not in result.stdout
+
+
+def test_import_rejects_malformed_input(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+
+    entry = '{"service": "a", "username": "b", "password": "c"}'
+    cases = [
+        ("json", '{"service": "GitHub"}', "must be an array"),
+        ("json", f"[{entry}, 3]", "Record 2 is not an object"),
+        ("jsonl", f'{entry}\n["x"]\n', "Record 2 is not an object"),
+        ("jsonl", entry.replace('"c"', "7"), "Record 1 has non-text password"),
+        ("jsonl", '{"service": "a",\n', "Import failed"),
+        ("jsonl", entry[:-1] + ', "created_at": 1.5}', "Unsupported timestamp"),
+        ("jsonl", entry[:-1] + f', "updated_at": {2**63}}}', "out of range"),
+    ]
+    for fmt, content, error in cases:
+        src = tmp_path / f"creds.{fmt}"
+        src.write_text(content)
+        result = runner.invoke(
+            main.app, ["import", str(src), "--db", str(db)], input="test\n"
+        )
+        assert result.exit_code == 2, content
+        assert error in result.stderr, content
+
+
+def test_find_by_service(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    result = runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\nsecret\n"
+    )
+    entry_id = _extract_uuid(result.stdout)
+    runner.invoke(
+        main.app, ["add", "GitLab", "bob", "--db", str(db)], input="test\nsecret\n"
+    )
+
+    result = runner.invoke(
+        main.app, ["find", "--service", "GitHub", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert entry_id in result.stdout
+    assert "GitLab" not in result.stdout
+
+    result = runner.invoke(
+        main.app, ["find", "-s", "Bitbucket", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 2
+
+
+def test_init_with_kdf_options_and_rekey(tmp_path):
+    db = tmp_path / "vault.db"
+    result = runner.invoke(
+        main.app,
+        ["init", "--db", str(db), "--time-cost", "1", "--memory-mib", "8"],
+        input="test\ntest\n",
+    )
+    assert result.exit_code == 0
+    result = runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\nsecret\n"
+    )
+    entry_id = _extract_uuid(result.stdout)
+
+    result = runner.invoke(
+        main.app,
+        ["rekey", "--db", str(db), "--parallelism", "2"],
+        input="test\nnew\nnew\n",
+    )
+    assert result.exit_code == 0
+    assert "Re-encrypted 1 entries" in result.stdout
+    assert "time_cost=1 memory=8MiB parallelism=2" in result.stdout
+
+    result = runner.invoke(main.app, ["get", entry_id, "--db", str(db)], input="test\n")
+    assert result.exit_code == 1
+    result = runner.invoke(main.app, ["get", entry_id, "--db", str(db)], input="new\n")
+    assert result.exit_code == 0
+    assert "secret" in result.stdout
+
+
+def test_calibrate_command():
+    result = runner.invoke(
+        main.app, ["calibrate", "--target-ms", "20", "--memory-mib", "8"]
+    )
+    assert result.exit_code == 0
+    assert "--memory-mib 8" in result.stdout
+
+
+def test_list_limit_and_after(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    for service in ("one", "two", "three"):
+        runner.invoke(
+            main.app, ["add", service, "alice", "--db", str(db)], input="test\npw\n"
+        )
+
+    result = runner.invoke(
+        main.app, ["list", "--limit", "2", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert "three" in result.stdout and "two" in result.stdout
+    assert "one" not in result.stdout
+    after = result.stderr.split("--after ")[1].strip()
+
+    result = runner.invoke(
+        main.app, ["list", "--after", after, "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert "one" in result.stdout
+    assert "two" not in result.stdout
+
+
+def test_maintain_reports_without_unlocking(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\npw\n"
+    )
+
+    result = runner.invoke(main.app, ["maintain", "--db", str(db)])
+    assert result.exit_code == 0
+    assert "Rows in entries: 1" in result.stdout
+    assert "WAL: 0 bytes" in result.stdout
+    assert "Integrity: ok" in result.stdout
+
+    result = runner.invoke(main.app, ["maintain", "--db", str(tmp_path / "none.db")])
+    assert result.exit_code == 2
+
+
+def test_update_rotate_and_delete(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    result = runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\npw\n"
+    )
+    entry_id = _extract_uuid(result.stdout)
+
+    result = runner.invoke(main.app, ["update", entry_id, "--db", str(db)])
+    assert result.exit_code == 2
+    result = runner.invoke(
+        main.app,
+        ["update", entry_id, "--username", "bob", "--password", "--db", str(db)],
+        input="test\nnewpw\n",
+    )
+    assert result.exit_code == 0
+    result = runner.invoke(
+        main.app,
+        ["update", entry_id, "--service", "", "--db", str(db)],
+        input="test\n",
+    )
+    assert result.exit_code == 2 and "cannot be empty" in result.stderr
+    result = runner.invoke(main.app, ["get", entry_id, "--db", str(db)], input="test\n")
+    assert "'bob'" in result.stdout and "'newpw'" in result.stdout
+
+    result = runner.invoke(
+        main.app,
+        ["rotate", entry_id, "--length", "32", "--db", str(db)],
+        input="test\n",
+    )
+    assert result.exit_code == 0
+    rotated = result.stdout.split("New password: ")[1].strip()
+    assert len(rotated) == 32
+    result = runner.invoke(main.app, ["get", entry_id, "--db", str(db)], input="test\n")
+    assert rotated in result.stdout
+
+    result = runner.invoke(
+        main.app, ["delete", entry_id, "--db", str(db)], input="test\nn\n"
+    )
+    assert result.exit_code == 1
+    result = runner.invoke(
+        main.app, ["delete", entry_id, "--yes", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    result = runner.invoke(
+        main.app, ["delete", entry_id, "--yes", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 2
+
+
+def test_machine_output_and_password_sources(tmp_path, monkeypatch):
+    db = tmp_path / "vault.db"
+    pw_file = tmp_path / "master"
+    pw_file.write_text("test\n")
+    result = runner.invoke(
+        main.app, ["--password-file", str(pw_file), "init", "--db", str(db)]
+    )
+    assert result.exit_code == 0
+    monkeypatch.setenv("BRAHMAND5_PASSWORD_FILE", str(pw_file))
+    ids = []
+    for service in ("GitHub", "GitLab\tCE"):
+        result = runner.invoke(
+            main.app, ["add", service, "alice", "--db", str(db)], input="pw\n"
+        )
+        ids.append(_extract_uuid(result.stdout))
+
+    # One unlock for many ids; unknown ids are reported and fail the run.
+    result = runner.invoke(
+        main.app, ["get", *ids, "missing", "--format", "json", "--db", str(db)]
+    )
+    assert result.exit_code == 2
+    assert [e["service"] for e in json.loads(result.stdout)] == ["GitHub", "GitLab\tCE"]
+    assert "Not found: missing" in result.stderr
+    monkeypatch.delenv("BRAHMAND5_PASSWORD_FILE")
+
+    result = runner.invoke(
+        main.app,
+        ["--password-stdin", "get", "--ids-from", "-", "-f", "jsonl", "--db", str(db)],
+        input="test\n" + "\n".join(ids) + "\n",
+    )
+    assert result.exit_code == 0
+    assert [json.loads(line)["id"] for line in result.stdout.splitlines()] == ids
+
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"test\n")
+    os.close(write_fd)
+    try:
+        result = runner.invoke(
+            main.app,
+            ["--password-fd", str(read_fd), "list", "--format", "tsv", "--db", str(db)],
+        )
+    finally:
+        os.close(read_fd)
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert lines[0] == "id\tservice\tusername\tcreated_at\tupdated_at"
+    assert sorted(line.split("\t")[1] for line in lines[1:]) == [
+        "GitHub",
+        "GitLab\\tCE",
+    ]
+
+    result = runner.invoke(
+        main.app,
+        ["--password-stdin", "find", "-s", "nope", "-f", "json", "--db", str(db)],
+        input="test\n",
+    )
+    assert result.exit_code == 2
+    assert json.loads(result.stdout) == []
+
+    result = runner.invoke(
+        main.app, ["--password-stdin", "--password-file", str(pw_file), "list"]
+    )
+    assert result.exit_code == 2
+    result = runner.invoke(main.app, ["list", "--format", "xml", "--db", str(db)])
+    assert result.exit_code == 2
+
+
+def test_password_sources_answer_later_prompts(tmp_path):
+    db = tmp_path / "vault.db"
+    pw_file = tmp_path / "master"
+    pw_file.write_text("test\n")
+    runner.invoke(main.app, ["--password-file", str(pw_file), "init", "--db", str(db)])
+    result = runner.invoke(
+        main.app,
+        ["--password-stdin", "add", "GitHub", "alice", "--db", str(db)],
+        input="test\npw\n",
+    )
+    assert result.exit_code == 0
+    entry_id = _extract_uuid(result.stdout)
+    result = runner.invoke(
+        main.app,
+        ["--password-stdin", "update", entry_id, "--password", "--db", str(db)],
+        input="test\npw2\n",
+    )
+    assert result.exit_code == 0
+
+    pw_file.write_text("test\nnew\n")
+    result = runner.invoke(
+        main.app, ["--password-file", str(pw_file), "rekey", "--db", str(db)]
+    )
+    assert result.exit_code == 0
+    pw_file.write_text("new\n")
+    args = ["--password-file", str(pw_file), "get", entry_id, "-f", "json"]
+    result = runner.invoke(main.app, [*args, "--db", str(db)])
+    assert result.exit_code == 0
+    assert json.loads(result.stdout)[0]["password"] == "pw2"
+
+
+def test_export_and_import_tsv(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    runner.invoke(
+        main.app,
+        ["add", "GitHub", "alice", "--notes", "line1\nline2\t\\x", "--db", str(db)],
+        input="test\npw\n",
+    )
+    out = tmp_path / "dump.tsv"
+    result = runner.invoke(
+        main.app, ["export", str(out), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+
+    other = tmp_path / "other.db"
+    runner.invoke(main.app, ["init", "--db", str(other)], input="test\ntest\n")
+    result = runner.invoke(
+        main.app, ["import", str(out), "--db", str(other)], input="test\n"
+    )
+    assert result.exit_code == 0
+    back = tmp_path / "back.json"
+    result = runner.invoke(
+        main.app, ["export", str(back), "--db", str(other)], input="test\n"
+    )
+    assert json.loads(back.read_text())[0]["notes"] == "line1\nline2\t\\x"
+
+
+def test_list_since_filters(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\npw\n"
+    )
+    result = runner.invoke(
+        main.app, ["list", "--since", "2000-01-01", "--db", str(db)], input="test\n"
+    )
+    assert "GitHub" in result.stdout
+    result = runner.invoke(
+        main.app,
+        ["list", "--modified-since", "2999-01-01T00:00:00+00:00", "--db", str(db)],
+        input="test\n",
+    )
+    assert result.exit_code == 0
+    assert "GitHub" not in result.stdout
+    result = runner.invoke(main.app, ["list", "--since", "yesterday", "--db", str(db)])
+    assert result.exit_code == 2
+
+
+def test_search(tmp_path):
+    db = tmp_path / "vault.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    for service in ("GitHub", "GitLab", "Bank"):
+        runner.invoke(
+            main.app, ["add", service, "alice", "--db", str(db)], input="test\npw\n"
+        )
+    result = runner.invoke(
+        main.app, ["search", "githb", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert "GitHub  alice" in result.stdout and "Bank" not in result.stdout
+    result = runner.invoke(
+        main.app,
+        ["search", "bank", "--format", "json", "--db", str(db)],
+        input="test\n",
+    )
+    (row,) = json.loads(result.stdout[result.stdout.index("[") :])
+    assert row["service"] == "Bank" and row["score"] > 1
+    result = runner.invoke(
+        main.app, ["search", "zzzz", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 2
+
+
+def test_profile_reports_phases(tmp_path):
+    db = tmp_path / "vault.db"
+    spans = tmp_path / "spans.jsonl"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    result = runner.invoke(
+        main.app,
+        ["--profile", "--profile-export", str(spans), "list", "--db", str(db)],
+        input="test\n",
+    )
+    assert result.exit_code == 0
+    assert "kdf" in result.stderr and "sql.statements" in result.stderr
+    *records, totals = [json.loads(line) for line in spans.read_text().splitlines()]
+    assert "kdf" in {r["name"] for r in records}
+    assert totals["counters"]["sql.statements"] > 0
+
+
+def test_sync_copies(tmp_path):
+    db, copy = tmp_path / "vault.db", tmp_path / "copy.db"
+    runner.invoke(main.app, ["init", "--db", str(db)], input="test\ntest\n")
+    runner.invoke(main.app, ["init", "--db", str(copy)], input="other\nother\n")
+    runner.invoke(
+        main.app, ["add", "GitHub", "alice", "--db", str(db)], input="test\npw\n"
+    )
+    result = runner.invoke(main.app, ["sync", "--db", str(db)], input="test\n")
+    assert result.exit_code == 2
+    result = runner.invoke(
+        main.app, ["sync", str(copy), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 1 and "share a key" in result.stderr
+
+    copy.unlink()
+    shutil.copy(db, copy)
+    runner.invoke(
+        main.app, ["add", "Bank", "bob", "--db", str(copy)], input="test\npw\n"
+    )
+    result = runner.invoke(
+        main.app, ["sync", str(copy), "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 0
+    assert "Received 2 changes (1 applied)" in result.stderr
+    result = runner.invoke(main.app, ["list", "--db", str(db)], input="test\n")
+    assert "Bank" in result.stdout
+
+    # --serve must not prompt: the prompt would eat the client's messages.
+    result = runner.invoke(
+        main.app, ["sync", "--serve", "--db", str(db)], input="test\n"
+    )
+    assert result.exit_code == 2 and "No master password" in result.stderr
+    result = runner.invoke(
+        main.app, ["--password-stdin", "sync", "--serve", "--db", str(db)]
+    )
+    assert result.exit_code == 2 and "--password-fd" in result.stderr
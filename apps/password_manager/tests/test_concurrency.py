@@ -0,0 +1,105 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from apps.password_manager import core, storage
+
+
+def test_begin_write_waits_for_other_writer(tmp_path):
+    db = tmp_path / "vault.db"
+    storage.open_connection(db).close()
+    locked = threading.Event()
+
+    def hold_lock():
+        holder = storage.open_connection(db)
+        holder.execute("BEGIN IMMEDIATE")
+        locked.set()
+        time.sleep(0.2)
+        holder.commit()
+        holder.close()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    locked.wait()
+    conn = storage.open_connection(db, busy_timeout=0.01)
+    storage.begin_write(conn, attempts=10, base_delay=0.02)
+    conn.rollback()
+    conn.close()
+    thread.join()
+
+
+def test_begin_write_gives_up_eventually(tmp_path):
+    db = tmp_path / "vault.db"
+    holder = storage.open_connection(db)
+    holder.execute("BEGIN IMMEDIATE")
+    conn = storage.open_connection(db, busy_timeout=0.01)
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        storage.begin_write(conn, attempts=2, base_delay=0.01)
+    holder.rollback()
+    conn.close()
+    holder.close()
+
+
+def test_group_commit_merges_concurrent_adds(make_vault):
+    db, key = make_vault()
+    threads, per_thread = 8, 40
+    barrier = threading.Barrier(threads)
+    ids = []
+
+    def worker(n):
+        with core.Vault(db, key, group_commit=True) as vault:
+            barrier.wait()
+            for i in range(per_thread):
+                ids.append(vault.add_entry(f"svc{n}-{i}", "user", "pw", None))
+            writer = vault._writer
+        return writer
+
+    writers = []
+    pool = [
+        threading.Thread(target=lambda n=n: writers.append(worker(n)))
+        for n in range(threads)
+    ]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    assert len({id(w) for w in writers}) == 1  # one writer shared by all sessions
+    assert writers[0].commits < threads * per_thread
+    with core.Vault(db, key) as vault:
+        assert sorted(e["id"] for e in vault.export_entries()) == sorted(ids)
+
+
+def test_group_commit_fails_only_the_bad_statement(tmp_path):
+    db = tmp_path / "vault.db"
+    storage.open_connection(db).close()
+    writer = storage.GroupCommitWriter(db)
+    sql = "INSERT INTO entries(id, record, created_at, updated_at) VALUES(?, x'00', 't', 't')"
+    futures = [writer.submit(sql, (i,)) for i in ("a", "b", "a", "c")]
+    writer.close()
+    assert [f.exception() is None for f in futures] == [True, True, False, True]
+    assert isinstance(futures[2].exception(), sqlite3.IntegrityError)
+
+
+def _hammer(db, key, n, count):
+    with core.Vault(db, key, busy_timeout=10) as vault:
+        for i in range(count):
+            entry_id = vault.add_entry(f"svc{n}-{i}", f"user{n}", f"pw{i}", None)
+            assert vault.get_entry(entry_id)["password"] == f"pw{i}"
+    return count
+
+
+def test_many_processes_add_and_get(make_vault):
+    db, key = make_vault()
+    processes, per_process = 4, 25
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes) as pool:
+        done = pool.starmap(
+            _hammer, [(db, key, n, per_process) for n in range(processes)]
+        )
+    assert sum(done) == processes * per_process
+    with core.Vault(db, key) as vault:
+        assert len(vault.list_entries_decrypted()) == processes * per_process
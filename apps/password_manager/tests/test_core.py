@@ -1,4 +1,18 @@
-from apps.password_manager import core
+import dataclasses
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from apps.password_manager import core, crypto, storage
+
+
+@pytest.fixture
+def fast_kdf(fast_kdf):
+    """Two Argon2 lanes, so stored settings are checked beyond the default."""
+    return dataclasses.replace(fast_kdf, parallelism=2)
 
 
 def test_init_and_unlock(tmp_path):
@@ -10,6 +24,73 @@ def test_init_and_unlock(tmp_path):
     assert bad is None
 
 
+def _make_legacy_vault(db, master_password):
+    """Build a vault the way the pre-key-check format did (PHC hash, no version)."""
+    salt = os.urandom(16)
+    conn = sqlite3.connect(str(db))
+    conn.executescript("""
+        CREATE TABLE metadata (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            salt BLOB NOT NULL,
+            master_hash TEXT NOT NULL
+        );
+        CREATE TABLE entries (
+            id TEXT PRIMARY KEY,
+            service BLOB NOT NULL,
+            username BLOB NOT NULL,
+            password BLOB NOT NULL,
+            notes BLOB,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """)
+    conn.execute(
+        "INSERT INTO metadata(id, salt, master_hash) VALUES(1, ?, ?)",
+        (salt, crypto.hash_master_password(master_password)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_unlock_migrates_legacy_vault(tmp_path):
+    db = tmp_path / "vault.db"
+    _make_legacy_vault(db, "master-pass")
+
+    assert core.unlock_vault(db, "wrong-pass") is None
+    assert storage.read_metadata(db).key_check is None
+
+    key = core.unlock_vault(db, "master-pass")
+    assert key is not None
+    meta = storage.read_metadata(db)
+    assert meta.master_hash is None
+    assert crypto.verify_key_check(key, meta.key_check)
+
+    # Subsequent unlocks use the key check and derive the same key.
+    assert core.unlock_vault(db, "master-pass") == key
+    assert core.unlock_vault(db, "wrong-pass") is None
+
+
+def test_unlock_derives_key_once(tmp_path, monkeypatch):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+
+    calls = []
+    real_derive_key = crypto.derive_key
+
+    def counting_derive_key(*args, **kwargs):
+        calls.append(args)
+        return real_derive_key(*args, **kwargs)
+
+    monkeypatch.setattr(crypto, "derive_key", counting_derive_key)
+    monkeypatch.setattr(
+        crypto,
+        "verify_master_password",
+        lambda *args: pytest.fail("PHC hash should not be checked"),
+    )
+    assert core.unlock_vault(db, "master-pass") is not None
+    assert len(calls) == 1
+
+
 def test_add_and_get_encrypted_fields(tmp_path):
     """Test that service and username fields are encrypted and decrypted correctly."""
     db = tmp_path / "vault.db"
@@ -157,3 +238,676 @@ def test_multiple_entries_isolation(tmp_path):
         entry = core.get_entry(db, key, entry_id)
         assert entry["service"] == expected_service
         assert entry["username"] == expected_username
+
+
+def test_vault_session_reuses_one_connection(tmp_path, monkeypatch):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+
+    opened = []
+    real_open_connection = storage.open_connection
+
+    def counting_open_connection(path, *args):
+        opened.append(path)
+        return real_open_connection(path, *args)
+
+    monkeypatch.setattr(storage, "open_connection", counting_open_connection)
+
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        ids = [
+            vault.add_entry(f"service{i}", f"user{i}", f"pw{i}", None) for i in range(5)
+        ]
+        for i, entry_id in enumerate(ids):
+            assert vault.get_entry(entry_id)["password"] == f"pw{i}"
+        assert len(vault.list_entries_decrypted()) == 5
+        assert len(vault.list_entries_preview()) == 5
+
+    assert len(opened) == 1
+
+
+def test_locked_vault_rejects_entry_access(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+
+    with core.Vault(db) as vault:
+        assert not vault.unlocked
+        with pytest.raises(RuntimeError, match="locked"):
+            vault.add_entry("GitHub", "alice", "secret", None)
+        assert not vault.unlock("wrong-pass")
+        assert not vault.unlocked
+
+
+def test_import_entries_single_transaction(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+
+    def rows():
+        for i in range(25):
+            yield {"service": f"svc{i}", "username": f"user{i}", "password": f"pw{i}"}
+
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        assert vault.import_entries(rows(), batch_size=10) == 25
+        exported = list(vault.export_entries())
+
+    assert len(exported) == 25
+    assert {e["service"] for e in exported} == {f"svc{i}" for i in range(25)}
+    assert all(e["notes"] is None for e in exported)
+
+
+def test_import_entries_rolls_back_on_bad_row(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+
+    rows = [
+        {"service": "GitHub", "username": "alice", "password": "pw"},
+        {"service": "GitLab", "username": "bob"},
+    ]
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        with pytest.raises(KeyError):
+            vault.import_entries(rows, batch_size=1)
+        assert list(vault.export_entries()) == []
+
+
+def test_export_round_trips_all_fields(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    key = core.unlock_vault(db, "master-pass")
+    entry_id = core.add_entry(db, key, "GitHub", "alice", "secret", "Personal")
+
+    with core.Vault(db, key) as vault:
+        (entry,) = vault.export_entries()
+    assert entry == core.get_entry(db, key, entry_id)
+
+
+def test_find_entries_by_blind_index(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    key = core.unlock_vault(db, "master-pass")
+    github_alice = core.add_entry(db, key, "GitHub", "alice", "pw1", None)
+    github_bob = core.add_entry(db, key, "GitHub", "bob", "pw2", None)
+    core.add_entry(db, key, "GitLab", "alice", "pw3", None)
+
+    rows = core.find_entries(db, key, service="GitHub")
+    assert {r["id"] for r in rows} == {github_alice, github_bob}
+
+    rows = core.find_entries(db, key, service="GitHub", username="alice")
+    assert [r["id"] for r in rows] == [github_alice]
+    assert rows[0]["service"] == "GitHub"
+
+    assert len(core.find_entries(db, key, username="alice")) == 2
+    assert core.find_entries(db, key, service="github") == []
+    # The service and username indexes are keyed separately.
+    assert core.find_entries(db, key, service="alice") == []
+
+    with pytest.raises(ValueError):
+        core.find_entries(db, key)
+
+
+def test_find_entries_uses_index_without_full_decrypt(tmp_path, monkeypatch):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        vault.import_entries(
+            {"service": f"svc{i}", "username": f"user{i}", "password": "pw"}
+            for i in range(200)
+        )
+
+        plan = vault.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM entries WHERE service_idx=?", (b"x",)
+        ).fetchall()
+        assert "entries_service_idx" in str(plan)
+
+        decrypted = []
+        real_decrypt_many = crypto.decrypt_many
+
+        def counting_decrypt_many(cipher, blobs, *args, **kwargs):
+            decrypted.extend(blobs)
+            return real_decrypt_many(cipher, blobs, *args, **kwargs)
+
+        monkeypatch.setattr(crypto, "decrypt_many", counting_decrypt_many)
+        rows = vault.find_entries(service="svc42")
+        assert [r["username"] for r in rows] == ["user42"]
+        assert len(decrypted) == 2
+
+
+def test_find_entries_backfills_rows_without_index(tmp_path):
+    """Rows from before the blind index existed are indexed on first lookup."""
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    key = core.unlock_vault(db, "master-pass")
+    entry_id = core.add_entry(db, key, "GitHub", "alice", "pw", None)
+
+    conn = sqlite3.connect(str(db))
+    conn.execute("UPDATE entries SET service_idx=NULL, username_idx=NULL")
+    conn.commit()
+    conn.close()
+
+    rows = core.find_entries(db, key, service="GitHub")
+    assert [r["id"] for r in rows] == [entry_id]
+
+    conn = sqlite3.connect(str(db))
+    missing = conn.execute(
+        "SELECT COUNT(*) FROM entries WHERE service_idx IS NULL"
+    ).fetchone()[0]
+    conn.close()
+    assert missing == 0
+
+
+def test_kdf_params_are_stored_per_vault(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass", fast_kdf)
+    assert storage.read_metadata(db).kdf == fast_kdf
+
+    key = core.unlock_vault(db, "master-pass")
+    salt = storage.read_metadata(db).salt
+    assert key == crypto.derive_key("master-pass", salt, params=fast_kdf)
+    assert key != crypto.derive_key("master-pass", salt)
+
+
+def test_calibrate_kdf_keeps_memory_and_parallelism():
+    kdf = crypto.calibrate_kdf(0.05, memory_cost=8192, parallelism=2)
+    assert kdf.memory_cost == 8192
+    assert kdf.parallelism == 2
+    assert kdf.time_cost >= 1
+
+
+def test_rekey_reencrypts_entries(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "old-pass")
+    with core.Vault(db) as vault:
+        assert vault.unlock("old-pass")
+        vault.import_entries(
+            {"service": f"svc{i}", "username": f"user{i}", "password": f"pw{i}"}
+            for i in range(7)
+        )
+        ids = {e["service"]: e["id"] for e in vault.export_entries()}
+        assert vault.rekey("new-pass", fast_kdf, batch_size=3) == 7
+
+    assert core.unlock_vault(db, "old-pass") is None
+    key = core.unlock_vault(db, "new-pass")
+    assert storage.read_metadata(db).kdf == fast_kdf
+    assert core.get_entry(db, key, ids["svc4"])["password"] == "pw4"
+    assert [r["id"] for r in core.find_entries(db, key, service="svc2")] == [
+        ids["svc2"]
+    ]
+
+
+def test_rekey_keeps_kdf_params_by_default(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "old-pass", fast_kdf)
+    with core.Vault(db) as vault:
+        assert vault.unlock("old-pass")
+        vault.rekey("new-pass")
+    assert storage.read_metadata(db).kdf == fast_kdf
+
+
+def test_decrypt_many_matches_serial_decrypt():
+    key = os.urandom(32)
+    cipher = crypto.new_cipher(key)
+    plaintexts = [f"value-{i}".encode() for i in range(50)]
+    blobs = [crypto.encrypt(key, p) for p in plaintexts]
+    blobs[7] = None
+    bad = crypto.encrypt(os.urandom(32), b"other key")
+
+    expected = [p if b is not None else None for p, b in zip(plaintexts, blobs)]
+    assert crypto.decrypt_many(cipher, blobs) == expected
+    with ThreadPoolExecutor(4) as pool:
+        assert crypto.decrypt_many(cipher, blobs, pool, chunk_size=8) == expected
+        out = crypto.decrypt_many(
+            cipher, blobs + [bad], pool, chunk_size=8, skip_errors=True
+        )
+        assert out[-1] is None
+        with pytest.raises(InvalidTag):
+            crypto.decrypt_many(cipher, blobs + [bad], pool, chunk_size=8)
+
+
+def test_parallel_list_and_export_match_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(crypto, "DECRYPT_CHUNK_SIZE", 16)
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    key = core.unlock_vault(db, "master-pass")
+    with core.Vault(db, key) as vault:
+        vault.import_entries(
+            {
+                "service": f"svc{i}",
+                "username": f"user{i}",
+                "password": f"pw{i}",
+                "notes": f"n{i}" if i % 2 else None,
+            }
+            for i in range(300)
+        )
+        serial_export = list(vault.export_entries(batch_size=64))
+
+    serial = core.list_entries_decrypted(db, key)
+    assert core.list_entries_decrypted(db, key, workers=4) == serial
+    with core.Vault(db, key, workers=4) as vault:
+        assert list(vault.export_entries(batch_size=64)) == serial_export
+    assert len(serial_export) == 300
+
+
+def test_iter_entries_keyset_pagination(tmp_path):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        vault.import_entries(
+            {
+                "service": f"svc{i}",
+                "username": f"user{i}",
+                "password": "pw",
+                "created_at": f"2024-01-01T00:00:{i // 2:02d}",
+            }
+            for i in range(11)
+        )
+        everything = vault.list_entries_decrypted()
+        assert len(everything) == 11
+        keys = [(e["created_at"], e["id"]) for e in everything]
+        assert keys == sorted(keys, reverse=True)
+
+        pages, after = [], None
+        while True:
+            page = list(vault.iter_entries_decrypted(limit=3, after=after, page_size=2))
+            if not page:
+                break
+            assert len(page) <= 3
+            pages.extend(page)
+            after = page[-1]["id"]
+        assert pages == everything
+
+        preview = list(vault.iter_entries_preview(limit=4, after=everything[2]["id"]))
+        assert [p["id"] for p in preview] == [e["id"] for e in everything[3:7]]
+
+        with pytest.raises(ValueError, match="Unknown entry id"):
+            list(vault.iter_entries_decrypted(after="missing"))
+
+
+def test_iter_entries_decrypted_is_lazy(tmp_path, monkeypatch):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass")
+    with core.Vault(db) as vault:
+        assert vault.unlock("master-pass")
+        vault.import_entries(
+            {"service": f"svc{i}", "username": f"user{i}", "password": "pw"}
+            for i in range(100)
+        )
+        decrypted = []
+        real_decrypt_many = crypto.decrypt_many
+
+        def counting_decrypt_many(cipher, blobs, *args, **kwargs):
+            decrypted.extend(blobs)
+            return real_decrypt_many(cipher, blobs, *args, **kwargs)
+
+        monkeypatch.setattr(crypto, "decrypt_many", counting_decrypt_many)
+        first = next(vault.iter_entries_decrypted(page_size=10))
+        assert first["service"]
+        assert len(decrypted) == 20
+
+
+def test_get_entry_cache_skips_decrypt_and_clears_on_rekey(
+    tmp_path, monkeypatch, fast_kdf
+):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "old-pass", fast_kdf)
+    with core.Vault(db, cache_size=8) as vault:
+        assert vault.unlock("old-pass")
+        entry_id = vault.add_entry("svc", "user", "pw", "note")
+        calls = []
+        real_decrypt_with = crypto.decrypt_with
+
+        def counting_decrypt_with(cipher, blob):
+            calls.append(blob)
+            return real_decrypt_with(cipher, blob)
+
+        monkeypatch.setattr(crypto, "decrypt_with", counting_decrypt_with)
+        first = vault.get_entry(entry_id)
+        assert first["password"] == "pw" and first["notes"] == "note"
+        assert len(calls) == 4
+        assert vault.get_entry(entry_id) == first
+        assert len(calls) == 4
+        assert vault.cache.hits == 1
+
+        vault.invalidate(entry_id)
+        assert vault.get_entry(entry_id) == first
+        assert len(calls) == 8
+
+        cached = vault.cache.get(entry_id)
+        vault.rekey("new-pass")
+        assert len(vault.cache) == 0
+        assert cached.password == bytearray(2)
+        assert vault.get_entry(entry_id)["password"] == "pw"
+
+
+def test_pack_fields_round_trip():
+    fields = [b"svc", b"", None, "caf\u00e9".encode()]
+    assert crypto.unpack_fields(crypto.pack_fields(fields)) == fields
+    with pytest.raises(ValueError):
+        crypto.unpack_fields(crypto.pack_fields([b"abc"])[:-1])
+
+
+def test_record_format_2_round_trip(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf, record_format=2) as vault:
+        first = vault.add_entry("GitHub", "alice", "pw1", "note")
+        second = vault.add_entry("GitLab", "bob", "pw2", None)
+        raw = vault.conn.execute(
+            "SELECT service, username, password, notes, record FROM entries WHERE id=?",
+            (first,),
+        ).fetchone()
+        assert raw[:4] == (None, None, None, None)
+        assert raw[4] is not None
+
+        assert vault.get_entry(first)["notes"] == "note"
+        assert vault.get_entry(second)["notes"] is None
+        assert {e["service"] for e in vault.iter_entries_decrypted()} == {
+            "GitHub",
+            "GitLab",
+        }
+        assert [e["password"] for e in vault.export_entries()] == ["pw1", "pw2"]
+        assert [e["id"] for e in vault.find_entries(username="bob")] == [second]
+        preview = list(vault.iter_entries_preview())
+        assert all(p["record"] and p["service"] is None for p in preview)
+
+        # The id is bound as associated data: a record moved to another row
+        # no longer authenticates.
+        vault.conn.execute("UPDATE entries SET record=? WHERE id=?", (raw[4], second))
+        with pytest.raises(InvalidTag):
+            vault.get_entry(second)
+
+
+def test_rekey_converts_record_format(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "old-pass", fast_kdf)
+    with core.Vault(db) as vault:
+        assert vault.unlock("old-pass")
+        old_id = vault.add_entry("svc", "user", "pw", "n")
+        vault.rekey("new-pass", record_format=2)
+        assert vault.record_format == 2
+        new_id = vault.add_entry("svc2", "user2", "pw2", None)
+        rows = vault.conn.execute(
+            "SELECT id, service IS NULL, record IS NOT NULL FROM entries"
+        ).fetchall()
+        assert {r[1:] for r in rows} == {(1, 1)}
+
+    assert storage.read_metadata(db).record_format == 2
+    key = core.unlock_vault(db, "new-pass")
+    assert core.get_entry(db, key, old_id)["notes"] == "n"
+    assert core.get_entry(db, key, new_id)["password"] == "pw2"
+
+
+def test_update_entry_rewrites_only_changed_columns(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass", fast_kdf)
+    with core.Vault(db, cache_size=4) as vault:
+        assert vault.unlock("master-pass")
+        entry_id = vault.add_entry("GitHub", "alice", "pw", "note")
+        assert vault.get_entry(entry_id)["username"] == "alice"
+        select = "SELECT service, username, password, notes, service_idx, username_idx FROM entries"
+        before = vault.conn.execute(select).fetchone()
+
+        assert vault.update_entry(entry_id, username="bob", notes="")
+        after = vault.conn.execute(select).fetchone()
+        assert after[0] == before[0] and after[2] == before[2]
+        assert after[4] == before[4]
+        assert after[1] != before[1] and after[5] != before[5]
+        assert after[3] is None
+
+        # The cached copy was invalidated.
+        entry = vault.get_entry(entry_id)
+        assert (entry["username"], entry["password"], entry["notes"]) == (
+            "bob",
+            "pw",
+            None,
+        )
+        assert entry["updated_at"] >= entry["created_at"]
+        assert [e["id"] for e in vault.find_entries(username="bob")] == [entry_id]
+        assert vault.find_entries(username="alice") == []
+
+        assert not vault.update_entry("missing", password="x")
+        with pytest.raises(ValueError):
+            vault.update_entry(entry_id)
+
+
+def test_update_entry_reseals_format_2_record(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf, record_format=2) as vault:
+        entry_id = vault.add_entry("GitHub", "alice", "pw", None)
+        assert vault.update_entry(entry_id, password="new", notes="n")
+        entry = vault.get_entry(entry_id)
+        assert (entry["service"], entry["password"], entry["notes"]) == (
+            "GitHub",
+            "new",
+            "n",
+        )
+        row = vault.conn.execute("SELECT service, record FROM entries").fetchone()
+        assert row[0] is None and row[1] is not None
+
+
+@pytest.mark.parametrize("record_format", core.RECORD_FORMATS)
+def test_update_entry_rejects_empty_fields(tmp_path, record_format, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf, record_format) as vault:
+        entry_id = vault.add_entry("GitHub", "alice", "pw", "note")
+        for field in ("service", "username", "password"):
+            with pytest.raises(ValueError, match=field):
+                vault.update_entry(entry_id, **{field: ""})
+        assert vault.update_entry(entry_id, notes="")
+        entry = vault.get_entry(entry_id)
+        assert (entry["service"], entry["username"], entry["password"]) == (
+            "GitHub",
+            "alice",
+            "pw",
+        )
+        assert entry["notes"] is None
+        assert [e["service"] for e in vault.iter_entries_decrypted()] == ["GitHub"]
+
+
+def test_rotate_and_delete_entry(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "master-pass", fast_kdf)
+    key = core.unlock_vault(db, "master-pass")
+    entry_id = core.add_entry(db, key, "GitHub", "alice", "old", None)
+
+    new = core.rotate_entry(db, key, entry_id)
+    assert len(new) == 20 and new != "old"
+    assert core.get_entry(db, key, entry_id)["password"] == new
+    assert core.rotate_entry(db, key, "missing") is None
+
+    assert core.delete_entry(db, key, entry_id)
+    assert core.get_entry(db, key, entry_id) is None
+    assert not core.delete_entry(db, key, entry_id)
+
+
+def test_rekey_resumes_after_interruption(tmp_path, monkeypatch, fast_kdf):
+    db = tmp_path / "vault.db"
+    core.init_vault(db, "old-pass", fast_kdf)
+    with core.Vault(db) as vault:
+        assert vault.unlock("old-pass")
+        vault.import_entries(
+            {"service": f"svc{i}", "username": f"user{i}", "password": f"pw{i}"}
+            for i in range(10)
+        )
+
+        real_reencrypt = core._reencrypt_row
+        calls = []
+
+        def failing_reencrypt(*args):
+            calls.append(args)
+            if len(calls) > 6:
+                raise KeyboardInterrupt
+            return real_reencrypt(*args)
+
+        monkeypatch.setattr(core, "_reencrypt_row", failing_reencrypt)
+        with pytest.raises(KeyboardInterrupt):
+            vault.rekey("new-pass", record_format=2, batch_size=3)
+        monkeypatch.setattr(core, "_reencrypt_row", real_reencrypt)
+
+    # Two batches were committed; the vault still opens with the old
+    # password but refuses entry access until the rekey is finished.
+    assert storage.read_metadata(db).record_format == 1
+    with core.Vault(db) as vault:
+        assert vault.unlock("old-pass")
+        assert vault.rekey_pending
+        with pytest.raises(RuntimeError, match="rekey"):
+            vault.list_entries_decrypted()
+        with pytest.raises(ValueError):
+            vault.rekey("other-pass")
+        assert vault.rekey("new-pass", batch_size=3) == 4
+        assert not vault.rekey_pending
+        assert vault.record_format == 2
+
+    assert core.unlock_vault(db, "old-pass") is None
+    key = core.unlock_vault(db, "new-pass")
+    with core.Vault(db, key) as vault:
+        passwords = sorted(e["password"] for e in vault.export_entries())
+        assert passwords == [f"pw{i}" for i in range(10)]
+        assert vault.conn.execute("SELECT * FROM rekey_progress").fetchone() is None
+
+
+def test_sessions_stop_writing_once_another_rekeys(tmp_path, monkeypatch, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "old-pass", fast_kdf) as vault:
+        ids = [vault.add_entry(f"svc{i}", "u", f"pw{i}", None) for i in range(6)]
+        key = vault.key
+
+    stale = core.Vault(db, key)
+    grouped = core.Vault(db, key, group_commit=True)
+    with stale, grouped, core.Vault(db, key) as rekeying:
+        real_reencrypt = core._reencrypt_row
+        calls = []
+
+        def failing_reencrypt(*args):
+            calls.append(args)
+            if len(calls) > 3:
+                raise KeyboardInterrupt
+            return real_reencrypt(*args)
+
+        monkeypatch.setattr(core, "_reencrypt_row", failing_reencrypt)
+        with pytest.raises(KeyboardInterrupt):
+            rekeying.rekey("new-pass", batch_size=3)
+        monkeypatch.setattr(core, "_reencrypt_row", real_reencrypt)
+
+        # Unlocked before the rekey started, so only the write finds out.
+        writes = [
+            lambda: stale.add_entry("late", "u", "pw", None),
+            lambda: grouped.add_entry("late", "u", "pw", None),
+            lambda: stale.update_entry(ids[5], password="late"),
+            lambda: stale.delete_entry(ids[4]),
+            lambda: stale.import_entries(
+                [{"service": "s", "username": "u", "password": "p"}]
+            ),
+        ]
+        for write in writes:
+            with pytest.raises(RuntimeError, match="rekey"):
+                write()
+
+        rekeying.rekey("new-pass", batch_size=3)
+        with pytest.raises(RuntimeError, match="rekeyed by another session"):
+            grouped.add_entry("late", "u", "pw", None)
+
+    key = core.unlock_vault(db, "new-pass")
+    with core.Vault(db, key) as vault:
+        assert [e["password"] for e in vault.export_entries()] == [
+            f"pw{i}" for i in range(6)
+        ]
+
+
+def test_get_entries_batches_in_input_order(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf) as vault:
+        ids = [vault.add_entry(f"svc{i}", "u", f"pw{i}", None) for i in range(7)]
+        wanted = [ids[5], "missing", ids[0], ids[5], *ids[1:4]]
+        got = list(vault.get_entries(wanted, batch_size=3))
+        assert [g and g["password"] for g in got] == [
+            "pw5",
+            None,
+            "pw0",
+            "pw5",
+            "pw1",
+            "pw2",
+            "pw3",
+        ]
+        assert got[0] == vault.get_entry(ids[5])
+
+
+def test_list_since_and_modified_since(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf) as vault:
+        vault.import_entries(
+            {
+                "service": f"svc{i}",
+                "username": "u",
+                "password": "pw",
+                "created_at": f"2024-01-0{i + 1}T00:00:00",
+            }
+            for i in range(5)
+        )
+        since = [e["service"] for e in vault.iter_entries_decrypted(since="2024-01-03")]
+        assert since == ["svc4", "svc3", "svc2"]
+        assert [
+            e["service"]
+            for e in vault.iter_entries_decrypted(
+                limit=2, after=vault.find_entries("svc4")[0]["id"], since="2024-01-02"
+            )
+        ] == ["svc3", "svc2"]
+
+        mark = storage.now_micros()
+        assert list(vault.iter_entries_preview(modified_since=mark)) == []
+        changed = vault.find_entries("svc1")[0]["id"]
+        vault.update_entry(changed, password="new")
+        recent = list(vault.iter_entries_decrypted(modified_since=mark))
+        assert [e["id"] for e in recent] == [changed]
+        assert recent[0]["created_at"] == "2024-01-02T00:00:00"
+        assert recent[0]["updated_at"] > recent[0]["created_at"]
+        assert vault.conn.execute(
+            "SELECT typeof(created_at) FROM entries LIMIT 1"
+        ).fetchone() == ("integer",)
+
+
+def test_search_index_follows_other_sessions(tmp_path, monkeypatch, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf) as vault:
+        gh = vault.add_entry("github.com", "alice", "pw", None)
+        key = vault.key
+    with core.Vault(db, key) as reader, core.Vault(db, key) as writer:
+        assert reader.search("gthub")[0]["id"] == gh
+        assert writer.search("github")[0]["id"] == gh  # loaded, not rebuilt
+
+        bank = writer.add_entry("bank", "alice", "pw", "joint savings")
+        writer.update_entry(gh, service="codeberg.org")
+        writer.import_entries(
+            [{"service": "gitlab.com", "username": "carol", "password": "pw"}]
+        )
+        assert reader.search("savings")[0]["id"] == bank
+        assert reader.search("codeberg")[0]["id"] == gh
+        assert reader.search("gitlab")[0]["username"] == "carol"
+        writer.delete_entry(bank)
+        assert reader.search("savings") == []
+
+        # Enough logged changes get folded into a new stored index.
+        monkeypatch.setattr(core, "SEARCH_LOG_LIMIT", 3)
+        for i in range(3):
+            writer.update_entry(gh, notes=f"note {i}")
+        reader.search("note")
+        assert reader.conn.execute("SELECT count(*) FROM search_log").fetchone() == (0,)
+        assert storage.search_index_seq(reader.conn) == reader._search_seq
+
+    with core.Vault(db, key, group_commit=True) as vault:
+        added = vault.add_entry("example.org", "dave", "pw", None)
+        assert vault.search("example")[0]["id"] == added
+        assert vault.search("note 2")[0]["id"] == gh
+
+
+def test_rekey_drops_search_index(tmp_path, fast_kdf):
+    db = tmp_path / "vault.db"
+    with core.Vault.create(db, "master-pass", fast_kdf) as vault:
+        vault.add_entry("github.com", "alice", "pw", None)
+        vault.search("github")
+        vault.rekey("new-pass")
+        assert storage.search_index_seq(vault.conn) is None
+        assert vault.search("github")[0]["username"] == "alice"
+        blob = vault.conn.execute("SELECT blob FROM search_index").fetchone()[0]
+        assert b"github" not in blob
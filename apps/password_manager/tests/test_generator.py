@@ -1,6 +1,6 @@
 import pytest
 import string
-from .. import crypto
+from .. import crypto, generator
 from typer.testing import CliRunner
 from ..main import app
 
@@ -99,3 +99,107 @@ def test_generate_command_error_too_short():
     assert "Password length must be at least 4 to ensure complexity." in str(
         result.exception
     )
+
+
+def test_generate_many_yields_count_valid_passwords():
+    passwords = list(generator.generate_many(500, length=8, include_symbols=True))
+    assert len(passwords) == 500
+    assert len(set(passwords)) == 500
+    for password in passwords:
+        assert len(password) == 8
+        assert any(c in crypto._LOWERCASE for c in password)
+        assert any(c in crypto._UPPERCASE for c in password)
+        assert any(c in crypto._DIGITS for c in password)
+        assert any(c in crypto._SYMBOLS for c in password)
+
+
+def test_generate_many_streams_and_carries_over_long_passwords():
+    stream = generator.generate_many(length=generator.RANDOM_BUFFER_SIZE + 7)
+    first, second = next(stream), next(stream)
+    assert len(first) == len(second) == generator.RANDOM_BUFFER_SIZE + 7
+    assert first != second
+
+
+def test_rejection_sampling_table_is_unbiased():
+    for include_symbols in (False, True):
+        policy = generator.PasswordPolicy.default(include_symbols=include_symbols)
+        compiled = policy.compile()
+        pool = "".join(c.alphabet for c in policy.classes).encode()
+        accepted = bytes(b for b in range(256) if b not in compiled._rejected)
+        mapped = accepted.translate(compiled._charset)
+        assert len({mapped.count(c) for c in pool}) == 1  # all equally likely
+        assert set(mapped) == set(pool)
+
+
+def test_generate_command_count():
+    result = runner.invoke(app, ["generate", "--count", "25", "--length", "12"])
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert len(lines) == 25
+    assert all(len(line) == 12 for line in lines)
+
+
+def test_policy_entropy_counts_valid_passwords():
+    # Length 2 over {a, b} x {0}: "a0", "0a", "b0", "0b".
+    policy = generator.PasswordPolicy(
+        length=2, classes=(generator.CharClass("ab"), generator.CharClass("0"))
+    )
+    assert policy.compile().entropy_bits == pytest.approx(2.0)
+    # With no minimums the count is just pool ** length.
+    free = generator.PasswordPolicy(
+        length=10, classes=(generator.CharClass("abcd", min_count=0),)
+    )
+    assert free.compile().entropy_bits == pytest.approx(20.0)
+
+
+def test_policy_compiles_once_and_honours_minimums():
+    policy = generator.parse_policy(
+        '{"length": 12, "exclude": "abc",'
+        ' "classes": [{"alphabet": "lower", "min": 2}, {"alphabet": "digits", "min": 8},'
+        ' {"alphabet": "-_", "min": 0}]}'
+    )
+    compiled = policy.compile()
+    assert policy.compile() is compiled
+    for password in compiled.generate_many(200):
+        assert len(password) == 12
+        assert not set(password) & set("abc")
+        assert sum(c in crypto._LOWERCASE for c in password) >= 2
+        assert sum(c in crypto._DIGITS for c in password) >= 8
+
+
+@pytest.mark.parametrize(
+    "policy",
+    [
+        generator.PasswordPolicy(length=2),  # shorter than the minimums
+        generator.PasswordPolicy(classes=(generator.CharClass("ab"),), exclude="ab"),
+        generator.PasswordPolicy(
+            classes=(generator.CharClass("ab"), generator.CharClass("bc"))
+        ),
+    ],
+)
+def test_invalid_policies_are_rejected(policy):
+    with pytest.raises(ValueError):
+        policy.compile()
+
+
+def test_passphrase_policy(tmp_path):
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("11111\tapple\n11112\tbanana\n11113\tcherry\n11114\tdate\n")
+    compiled = generator.parse_policy(
+        f'{{"wordlist": "{wordlist}", "words": 5, "separator": " "}}'
+    ).compile()
+    assert compiled.entropy_bits == pytest.approx(10.0)
+    words = compiled.generate().split(" ")
+    assert len(words) == 5
+    assert set(words) <= {"apple", "banana", "cherry", "date"}
+
+
+def test_generate_command_policy(tmp_path):
+    policy = tmp_path / "policy.json"
+    policy.write_text('{"length": 16, "classes": [{"alphabet": "digits", "min": 16}]}')
+    result = runner.invoke(app, ["generate", "--policy", str(policy), "-n", "3"])
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert len(lines) == 3
+    assert all(len(line) == 16 and line.isdigit() for line in lines)
+    assert "bits" in result.stderr
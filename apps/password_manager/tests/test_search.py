@@ -0,0 +1,68 @@
+from apps.password_manager.search import SCAN_BUDGET, SearchIndex, trigrams
+
+
+def _index():
+    return SearchIndex.build(
+        [
+            ("1", "github.com", "alice", None),
+            ("2", "gitlab.com", "alice", "work account"),
+            ("3", "bank", "alice.smith", "joint savings"),
+            ("4", "mygithub-mirror", "bob", None),
+        ]
+    )
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("Ab c") == {"  a", " ab", "ab ", "  c", " c "}
+
+
+def test_search_ranks_fuzzy_matches():
+    index = _index()
+    assert [r["id"] for r in index.search("github")][:2] == ["1", "4"]
+    assert index.search("githib")[0]["id"] == "1"
+    assert index.search("SAVINGS")[0]["id"] == "3"
+    assert {r["id"] for r in index.search("alice")} == {"1", "2", "3"}
+    assert len(index.search("alice", limit=2)) == 2
+    assert index.search("zzzz") == []
+    (top,) = index.search("work acount", limit=1)
+    assert top == {"id": "2", "service": "gitlab.com", "username": "alice"} | {
+        "score": top["score"]
+    }
+
+
+def test_changes_and_compaction():
+    index = _index()
+    index.patch("1", {"service": "codeberg.org"})
+    index.remove("3")
+    index.put("5", "savings bank", "carol", None)
+    assert [r["id"] for r in index.search("github")] == ["4", "2"]
+    assert index.search("codeberg")[0]["username"] == "alice"
+    assert [r["id"] for r in index.search("savings")] == ["5"]
+    assert len(index) == 4 and index.needs_compaction
+
+    compact = index.compacted()
+    assert not compact.needs_compaction
+    for query in ("github", "codeberg", "savings", "alice"):
+        assert compact.search(query) == index.search(query)
+
+
+def test_common_trigrams_keep_newer_entries_and_dead_ones_take_no_places():
+    # Every trigram of "mail" is in more entries than the scan budget.
+    count = SCAN_BUDGET + 100
+    index = SearchIndex.build((str(n), f"s{n}", "u", "mail") for n in range(count))
+    index.put("new", "mail", "u", None)
+    assert index.search("mail", limit=1)[0]["id"] == "new"
+
+    for n in range(10, count):
+        index.remove(str(n))
+    index.remove("new")
+    assert sorted(r["id"] for r in index.search("mail")) == [str(n) for n in range(10)]
+
+
+def test_bytes_round_trip():
+    index = _index()
+    index.remove("2")
+    loaded = SearchIndex.from_bytes(index.to_bytes())
+    assert len(loaded) == 3
+    for query in ("github", "alice", "work", "savings"):
+        assert loaded.search(query) == index.search(query)
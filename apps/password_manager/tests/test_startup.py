@@ -0,0 +1,44 @@
+"""Which modules the CLI loads at startup, seen through `python -X importtime`."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+# Modules that only commands touching a vault may load.
+HEAVY_MODULES = (
+    "argon2",
+    "cryptography",
+    "sqlite3",
+    "apps.password_manager.core",
+    "apps.password_manager.crypto",
+    "apps.password_manager.storage",
+)
+
+def _import_times(*args: str) -> dict:
+    """Run the CLI under -X importtime; map module name -> cumulative us."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "apps.password_manager.main", *args],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("args", [["generate"], ["--help"], ["generate", "--help"]])
+def test_light_commands_skip_vault_imports(args):
+    times = _import_times(*args)
+    loaded = [m for m in HEAVY_MODULES if m in times]
+    assert not loaded, f"{' '.join(args)} imported {loaded}"
+    assert "apps.password_manager.commands" in times
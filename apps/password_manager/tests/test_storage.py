@@ -1,13 +1,232 @@
 import os
+import sqlite3
 from apps.password_manager import storage
+from apps.password_manager.models import KdfParams
 
 
 def test_initialize_and_metadata(tmp_path):
     db = tmp_path / "vault.db"
     salt = os.urandom(16)
-    storage.initialize_db(db, salt, "phash")
+    storage.initialize_db(db, salt, b"key-check")
     meta = storage.read_metadata(db)
     assert meta is not None
-    s, h = meta
-    assert s == salt
-    assert h == "phash"
+    assert meta.salt == salt
+    assert meta.key_check == b"key-check"
+    assert meta.master_hash is None
+
+
+def test_new_vault_records_schema_version(tmp_path):
+    db = tmp_path / "vault.db"
+    storage.initialize_db(db, os.urandom(16), b"key-check")
+    conn = storage.open_connection(db)
+    assert storage.schema_version(conn) == storage.SCHEMA_VERSION
+    conn.close()
+
+
+def test_legacy_metadata_is_migrated(tmp_path):
+    """A v1 vault (no user_version, PHC master_hash) is upgraded on open."""
+    db = tmp_path / "vault.db"
+    salt = os.urandom(16)
+    conn = sqlite3.connect(str(db))
+    conn.executescript("""
+        CREATE TABLE metadata (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            salt BLOB NOT NULL,
+            master_hash TEXT NOT NULL
+        );
+        CREATE TABLE entries (
+            id TEXT PRIMARY KEY,
+            service BLOB NOT NULL,
+            username BLOB NOT NULL,
+            password BLOB NOT NULL,
+            notes BLOB,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """)
+    conn.execute(
+        "INSERT INTO metadata(id, salt, master_hash) VALUES(1, ?, ?)", (salt, "phash")
+    )
+    conn.execute(
+        "INSERT INTO entries VALUES('e1', x'01', x'02', x'03', NULL, 't0', 't1')"
+    )
+    conn.commit()
+    conn.close()
+
+    meta = storage.read_metadata(db)
+    assert meta.salt == salt
+    assert meta.master_hash == "phash"
+    assert meta.key_check is None
+    # Vaults from before KDF settings were stored used the defaults.
+    assert meta.kdf == KdfParams(time_cost=2, memory_cost=65536, parallelism=1)
+    # Existing entries survive the entries rebuild and stay in format 1.
+    assert meta.record_format == 1
+    conn = storage.open_connection(db)
+    row = conn.execute(
+        "SELECT id, service, username, password, record FROM entries"
+    ).fetchone()
+    assert row == ("e1", b"\x01", b"\x02", b"\x03", None)
+    conn.close()
+
+    storage.write_key_check(db, b"key-check")
+    meta = storage.read_metadata(db)
+    assert meta.key_check == b"key-check"
+    assert meta.master_hash is None
+
+
+def test_text_timestamps_migrate_to_epoch_micros(tmp_path):
+    db = tmp_path / "vault.db"
+    conn = sqlite3.connect(str(db))
+    conn.executescript("""
+        CREATE TABLE metadata (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            salt BLOB NOT NULL,
+            master_hash TEXT NOT NULL
+        );
+        CREATE TABLE entries (
+            id TEXT PRIMARY KEY,
+            service BLOB NOT NULL,
+            username BLOB NOT NULL,
+            password BLOB NOT NULL,
+            notes BLOB,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """)
+    conn.executemany(
+        "INSERT INTO entries VALUES(?, x'01', x'02', x'03', NULL, ?, ?)",
+        [
+            ("a", "2024-01-01T00:00:00", "2024-01-01T00:00:00.000250"),
+            ("b", "2024-01-01T02:00:00+02:00", "not a date"),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    conn = storage.open_connection(db)
+    rows = conn.execute(
+        "SELECT id, created_at, updated_at, typeof(created_at) FROM entries ORDER BY id"
+    ).fetchall()
+    assert rows == [
+        ("a", 1704067200000000, 1704067200000250, "integer"),
+        ("b", 1704067200000000, 0, "integer"),
+    ]
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM entries WHERE updated_at >= ?", (0,)
+    ).fetchall()
+    assert "entries_updated_idx" in plan[0][3]
+    conn.close()
+    assert storage.micros_to_iso(1704067200000250) == "2024-01-01T00:00:00.000250"
+    assert storage.to_micros("2024-01-01T00:00:00.000250") == 1704067200000250
+    for bad in (1.5, True, 2**63, storage.to_micros("9999-12-31") * 2):
+        try:
+            storage.to_micros(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{bad!r} was accepted as a timestamp")
+
+
+def test_entries_need_fields_or_record(tmp_path):
+    conn = storage.open_connection(tmp_path / "vault.db")
+    conn.execute(
+        "INSERT INTO entries(id, record, created_at, updated_at) VALUES('a', x'00', 't', 't')"
+    )
+    try:
+        conn.execute(
+            "INSERT INTO entries(id, service, created_at, updated_at) VALUES('b', x'00', 't', 't')"
+        )
+    except sqlite3.IntegrityError:
+        pass
+    else:
+        raise AssertionError("row without a record or all fields was accepted")
+    conn.close()
+
+
+def _fill(conn, rows):
+    conn.executemany(
+        "INSERT INTO entries(id, service, username, password, created_at, updated_at) VALUES(?, ?, ?, ?, 't', 't')",
+        [
+            (str(i), os.urandom(64), os.urandom(64), os.urandom(512))
+            for i in range(rows)
+        ],
+    )
+    conn.commit()
+
+
+def test_maintain_reclaims_pages_and_truncates_wal(tmp_path):
+    db = tmp_path / "vault.db"
+    conn = storage.open_connection(db)
+    _fill(conn, 2000)
+    conn.execute("DELETE FROM entries WHERE CAST(id AS INTEGER) >= 100")
+    conn.commit()
+    pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+
+    report = storage.maintain(conn)
+    assert report.auto_vacuum == "incremental"
+    assert report.pages_vacuumed > 0
+    assert report.page_count == pages_before - report.pages_vacuumed
+    assert report.free_pages == 0
+    assert report.wal_bytes == 0
+    assert not report.checkpoint_busy
+    assert report.ok
+    assert report.row_counts == {
+        "changes": 0,
+        "entries": 100,
+        "metadata": 0,
+        "rekey_progress": 0,
+        "replica": 1,
+        "search_index": 0,
+        "search_log": 0,
+        "sync_peers": 0,
+    }
+    # ANALYZE leaves statistics for the planner.
+    assert conn.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0] > 0
+    conn.close()
+
+
+def test_maintain_with_active_reader(tmp_path):
+    db = tmp_path / "vault.db"
+    conn = storage.open_connection(db)
+    _fill(conn, 50)
+    reader = sqlite3.connect(str(db))
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT count(*) FROM entries").fetchone()[0] == 50
+    conn.execute("DELETE FROM entries WHERE id='1'")
+    conn.commit()
+
+    report = storage.maintain(conn)
+    assert report.checkpoint_busy
+    assert report.wal_bytes > 0
+    # The reader's snapshot is untouched.
+    assert reader.execute("SELECT count(*) FROM entries").fetchone()[0] == 50
+    reader.close()
+    assert not storage.maintain(conn).checkpoint_busy
+    conn.close()
+
+
+def test_maintain_full_enables_incremental_vacuum(tmp_path):
+    db = tmp_path / "vault.db"
+    db.touch()  # an existing file is opened as-is, like a pre-auto_vacuum vault
+    conn = storage.open_connection(db)
+    assert storage.maintain(conn).auto_vacuum == "none"
+    assert storage.maintain(conn, full=True).auto_vacuum == "incremental"
+    conn.close()
+
+
+def test_maintain_prunes_superseded_changes(tmp_path):
+    conn = storage.open_connection(tmp_path / "vault.db")
+    for entry_id, op in [("a", "put"), ("b", "put"), ("a", "put"), ("b", "del")]:
+        conn.execute(storage.LOG_CHANGE_SQL, (entry_id, op, 1))
+    conn.commit()
+    hlcs = [r[0] for r in conn.execute("SELECT hlc FROM changes ORDER BY seq")]
+    assert hlcs == [1, 2, 3, 4]
+
+    report = storage.maintain(conn)
+    assert report.changes_pruned == 2
+    assert conn.execute("SELECT seq, entry_id, op FROM changes").fetchall() == [
+        (3, "a", "put"),
+        (4, "b", "del"),
+    ]
+    assert storage.last_change_seq(conn) == 4
+    conn.close()
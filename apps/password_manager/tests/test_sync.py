@@ -0,0 +1,142 @@
+import dataclasses
+import io
+import os
+import shutil
+import threading
+
+import pytest
+
+from apps.password_manager import core, storage, sync
+from apps.password_manager.backends import LogEntryStore
+from apps.password_manager.models import SyncReport
+
+
+@pytest.fixture
+def fast_kdf(fast_kdf):
+    return dataclasses.replace(fast_kdf, parallelism=2)
+
+
+def _replicas(make_vault, entries=("github", "gitlab")):
+    """Create a vault with entries and copy it; return both, unlocked, and ids."""
+    a_path, key = make_vault("a.db")
+    b_path = a_path.with_name("b.db")
+    with core.Vault(a_path, key) as vault:
+        ids = [vault.add_entry(s, "alice", "pw-" + s, None) for s in entries]
+    shutil.copy(a_path, b_path)
+    a, b = core.Vault(a_path), core.Vault(b_path)
+    assert a.unlock_with_key(key) and b.unlock_with_key(key)
+    return a, b, ids
+
+
+def _passwords(vault):
+    return {e["service"]: e["password"] for e in vault.export_entries()}
+
+
+def test_sync_merges_concurrent_edits(make_vault):
+    a, b, (github, gitlab) = _replicas(make_vault)
+    with a, b:
+        a.update_entry(github, password="from-a")
+        b.update_entry(github, password="from-b")
+        a.update_entry(gitlab, password="gitlab-a")
+        a.delete_entry(gitlab)
+        new = b.add_entry("bank", "bob", "pw-bank", None)
+
+        report = sync.sync_vaults(a, b)
+        assert storage.replica_id(a.conn) != storage.replica_id(b.conn)
+        # b's copy of the shared history comes along, but only b's two
+        # changes win; a's edit of github is older than b's.
+        assert (report.received, report.applied) == (3, 2)
+        assert (report.sent, report.peer_applied) == (3, 1)
+        expected = {"github": "from-b", "bank": "pw-bank"}
+        assert _passwords(a) == _passwords(b) == expected
+        assert a.get_entry(new)["username"] == "bob"
+        assert a.get_entry(gitlab) is None
+
+        # Changes applied on one side come back once and are ignored; after
+        # that only what changed since the last sync travels.
+        report = sync.sync_vaults(a, b)
+        assert report.applied == report.peer_applied == 0
+        assert sync.sync_vaults(a, b) == SyncReport()
+        a.update_entry(new, notes="joint")
+        report = sync.sync_vaults(b, a)
+        assert (report.received, report.applied, report.peer_applied) == (1, 1, 0)
+        assert b.get_entry(new)["notes"] == "joint"
+
+
+def test_sync_keeps_search_index_current(make_vault):
+    a, b, (github, _bank) = _replicas(make_vault, ("github", "bank"))
+    with a, b:
+        assert [r["id"] for r in b.search("github")] == [github]
+        a.update_entry(github, service="codeberg")
+        sync.sync_vaults(a, b)
+        assert b.search("github") == []
+        assert b.search("codeberg")[0]["id"] == github
+
+
+def test_sync_reads_rows_through_the_entry_store(tmp_path, make_vault):
+    a_path, key = make_vault("a.db")
+    shutil.copy(a_path, tmp_path / "b.db")
+    a = core.Vault(a_path, key, store=LogEntryStore(tmp_path / "a.log"))
+    b = core.Vault(tmp_path / "b.db", key)
+    with a, b:
+        github = a.add_entry("github", "alice", "pw-github", "work")
+        bank = b.add_entry("bank", "bob", "pw-bank", None)
+        assert sync.sync_vaults(b, a) == SyncReport(1, 1, 2, 1)
+        assert _passwords(a) == _passwords(b) == {
+            "github": "pw-github",
+            "bank": "pw-bank",
+        }
+        a.delete_entry(bank)
+        assert sync.sync_vaults(b, a).applied == 1
+        assert [e["id"] for e in b.export_entries()] == [github]
+
+
+def test_sync_rejects_vaults_with_another_key(make_vault):
+    a, _b, _ids = _replicas(make_vault)
+    other = core.Vault(*make_vault("other.db"))
+    with a, _b, other:
+        with pytest.raises(ValueError, match="share a key"):
+            sync.sync_vaults(a, other)
+
+
+def test_sync_over_pipes(tmp_path, make_vault):
+    a, b, (github, _gitlab) = _replicas(make_vault)
+    b_key = b.key
+    b.close()
+    a.update_entry(github, password="from-a")
+    a.add_entry("bank", "bob", "pw-bank", None)
+
+    to_server, to_client = os.pipe(), os.pipe()
+    result = {}
+
+    def run_server():
+        with core.Vault(tmp_path / "b.db") as server:
+            server.unlock_with_key(b_key)
+            with (
+                open(to_server[0], encoding="utf-8") as instream,
+                open(to_client[1], "w", encoding="utf-8") as outstream,
+            ):
+                result["report"] = sync.serve(server, instream, outstream)
+
+    thread = threading.Thread(target=run_server)
+    thread.start()
+    with (
+        a,
+        open(to_client[0], encoding="utf-8") as instream,
+        open(to_server[1], "w", encoding="utf-8") as outstream,
+    ):
+        report = sync.sync_stream(a, instream, outstream)
+        thread.join()
+        assert (report.sent, report.peer_applied) == (3, 2)
+        assert result["report"].applied == 2
+        with core.Vault(tmp_path / "b.db") as b:
+            b.unlock_with_key(b_key)
+            assert _passwords(b) == _passwords(a)
+
+
+def test_sync_peer_error_is_raised(make_vault):
+    a, b, _ids = _replicas(make_vault)
+    with a, b:
+        reply = io.StringIO('{"error": "no such vault"}\n')
+        with pytest.raises(RuntimeError, match="no such vault"):
+            sync.sync_stream(a, reply, io.StringIO())
@@ -0,0 +1,66 @@
+import io
+import json
+import sqlite3
+import time
+
+from apps.password_manager import core, storage, trace
+
+
+def test_spans_nest_and_count_self_time():
+    out = io.StringIO()
+    with trace.profiling(trace.jsonl_exporter(out)) as recorder:
+        with trace.span("outer"):
+            time.sleep(0.01)
+            for _ in range(2):
+                with trace.span("inner"):
+                    time.sleep(0.005)
+        trace.count("things", 3)
+        trace.count("things")
+    assert trace.recorder is None
+
+    summary = recorder.summary()
+    outer, inner = summary["spans"]["outer"], summary["spans"]["inner"]
+    assert inner["calls"] == 2 and outer["calls"] == 1
+    assert outer["total_ms"] >= 20
+    assert abs(outer["self_ms"] - (outer["total_ms"] - inner["total_ms"])) < 0.01
+    assert summary["counters"] == {"things": 4}
+
+    spans = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(s["name"], s["depth"]) for s in spans] == [
+        ("inner", 1),
+        ("inner", 1),
+        ("outer", 0),
+    ]
+    assert spans[0]["start_us"] >= spans[2]["start_us"] + 10_000
+    assert "outer" in recorder.format_summary()
+
+
+def test_disabled_tracing_is_inert(tmp_path):
+    assert trace.span("a") is trace.span("b")
+    trace.count("ignored")
+    conn = storage.open_connection(tmp_path / "vault.db")
+    assert type(conn) is sqlite3.Connection
+    conn.close()
+
+
+def test_vault_phases_are_traced(make_vault):
+    db, key = make_vault()
+    with core.Vault(db, key) as vault:
+        entry_id = vault.add_entry("github.com", "alice", "pw", "note")
+    with trace.profiling() as recorder:
+        with core.Vault(db) as vault:
+            assert isinstance(vault.conn, storage.TracedConnection)
+            vault.unlock("master-pass")
+            assert vault.get_entry(entry_id)["password"] == "pw"
+            assert len(vault.list_entries_decrypted()) == 1
+    summary = recorder.summary()
+    assert {"kdf", "aead", "sql.connect", "sql.execute", "sql.fetch"} <= set(
+        summary["spans"]
+    )
+    assert summary["spans"]["kdf"]["calls"] == 1
+    counters = summary["counters"]
+    # The key check, four fields of the entry, then service and username.
+    assert counters["aead.ops"] == 7
+    assert counters["aead.bytes"] > 0
+    assert counters["sql.rows_read"] >= 2
+    assert counters["sql.statements"] >= 3
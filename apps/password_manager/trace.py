@@ -0,0 +1,195 @@
+"""Named timing spans and counters for the vault's hot paths.
+
+Tracing is off unless enable() installs a Recorder. While it is off, span()
+hands back a shared no-op context manager, count() returns at once, hot
+loops test ``trace.recorder is not None`` before counting, and connections
+are plain sqlite3 ones, so instrumented code runs at full speed.
+
+Spans nest per thread. Each one records its duration and its self time, which
+is the duration minus that of its child spans, so a breakdown by span name
+adds up without double counting. Counters are plain running totals.
+"""
+
+import contextlib
+import json
+import threading
+import time
+from typing import IO, Callable, Dict, Iterator, List, Optional
+
+# The active Recorder, or None when tracing is off.
+recorder: Optional["Recorder"] = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start", "children")
+
+    def __init__(self, recorder: "Recorder", name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.recorder._stack().append(self)
+        self.children = 0
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        stack = self.recorder._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        self.recorder._finish(self, duration, len(stack))
+        return False
+
+
+class Recorder:
+    """Collects span timings and counters from every thread.
+
+    on_span, if given, is called with a dict for each finished span: name,
+    thread, depth (0 for outermost), start_us (since the recorder was
+    created), duration_us and self_us. jsonl_exporter() builds one that
+    writes them as JSON lines.
+    """
+
+    def __init__(self, on_span: Optional[Callable[[dict], None]] = None):
+        self.on_span = on_span
+        self.started = time.perf_counter_ns()
+        # name -> [calls, total ns, self ns]
+        self.spans: Dict[str, List[int]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _finish(self, span: _Span, duration: int, depth: int) -> None:
+        own = duration - span.children
+        with self._lock:
+            totals = self.spans.get(span.name)
+            if totals is None:
+                totals = self.spans[span.name] = [0, 0, 0]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += own
+        if self.on_span is not None:
+            self.on_span(
+                {
+                    "name": span.name,
+                    "thread": threading.current_thread().name,
+                    "depth": depth,
+                    "start_us": (span.start - self.started) // 1000,
+                    "duration_us": duration // 1000,
+                    "self_us": own // 1000,
+                }
+            )
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter_ns() - self.started) / 1e6
+
+    def summary(self) -> dict:
+        """Span totals (calls, total_ms, self_ms) and counters so far."""
+        with self._lock:
+            return {
+                "elapsed_ms": round(self.elapsed_ms(), 3),
+                "spans": {
+                    name: {
+                        "calls": calls,
+                        "total_ms": round(total / 1e6, 3),
+                        "self_ms": round(own / 1e6, 3),
+                    }
+                    for name, (calls, total, own) in self.spans.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def format_summary(self) -> str:
+        """A table of spans by self time, then the counters."""
+        summary = self.summary()
+        lines = [f"{'span':<16}{'calls':>8}{'total ms':>12}{'self ms':>12}"]
+        spans = sorted(summary["spans"].items(), key=lambda s: -s[1]["self_ms"])
+        for name, s in spans:
+            lines.append(
+                f"{name:<16}{s['calls']:>8}{s['total_ms']:>12.3f}{s['self_ms']:>12.3f}"
+            )
+        untraced = summary["elapsed_ms"] - sum(s["self_ms"] for _n, s in spans)
+        lines.append(f"{'(untraced)':<16}{'':>8}{'':>12}{untraced:>12.3f}")
+        lines.append(f"{'elapsed':<16}{'':>8}{summary['elapsed_ms']:>12.3f}")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name:<36}{value:>12}")
+        return "\n".join(lines)
+
+
+def jsonl_exporter(stream: IO[str]) -> Callable[[dict], None]:
+    """Return an on_span hook that writes each span to stream as a JSON line."""
+    lock = threading.Lock()
+
+    def export(span: dict) -> None:
+        line = json.dumps(span) + "\n"
+        with lock:
+            stream.write(line)
+
+    return export
+
+
+def span(name: str):
+    """Time the enclosed block under name; a no-op while tracing is off."""
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+def enable(on_span: Optional[Callable[[dict], None]] = None) -> Recorder:
+    """Start tracing into a new Recorder and return it."""
+    global recorder
+    recorder = Recorder(on_span)
+    return recorder
+
+
+def disable() -> Optional[Recorder]:
+    """Stop tracing; return the Recorder that was active, if any."""
+    global recorder
+    active, recorder = recorder, None
+    return active
+
+
+@contextlib.contextmanager
+def profiling(
+    on_span: Optional[Callable[[dict], None]] = None,
+) -> Iterator[Recorder]:
+    """Trace the enclosed block; connections must be opened inside it."""
+    active = enable(on_span)
+    try:
+        yield active
+    finally:
+        disable()
@@ -0,0 +1,133 @@
+"""Reading and writing entries as CSV, JSON, JSON Lines or TSV.
+
+Used by import/export and by the machine-readable output of get, list and find.
+"""
+
+import csv
+import json
+import re
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, Sequence
+
+FORMATS = ("csv", "json", "jsonl", "tsv")
+
+# Column order used when exporting; import accepts any subset that includes
+# service, username and password.
+FIELDS = ("id", "service", "username", "password", "notes", "created_at", "updated_at")
+
+REQUIRED_FIELDS = ("service", "username", "password")
+
+TEXT_FIELDS = (*REQUIRED_FIELDS, "notes")
+
+
+def detect_format(path: Optional[Path], fmt: Optional[str]) -> str:
+    """Pick the explicit format, or infer it from the file suffix."""
+    if fmt:
+        fmt = fmt.lower()
+    elif path is not None and path.suffix:
+        fmt = path.suffix[1:].lower()
+    else:
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(
+            f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}"
+        )
+    return fmt
+
+
+# TSV has no quoting, so tabs, line breaks and backslashes are escaped.
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_TSV_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+_TSV_ESCAPE_RE = re.compile(r"\\(.?)", re.DOTALL)
+
+
+def _tsv_field(value) -> str:
+    return "" if value is None else str(value).translate(_TSV_ESCAPES)
+
+
+def _tsv_unescape(field: str) -> str:
+    if "\\" not in field:
+        return field
+    return _TSV_ESCAPE_RE.sub(lambda m: _TSV_UNESCAPES.get(m[1], m[1]), field)
+
+
+def _read_tsv(stream: IO[str]) -> Iterator[dict]:
+    header = stream.readline().rstrip("\r\n").split("\t")
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line:
+            yield dict(zip(header, map(_tsv_unescape, line.split("\t"))))
+
+
+def _validated(rows: Iterable[dict]) -> Iterator[dict]:
+    for lineno, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Record {lineno} is not an object")
+        missing = [f for f in REQUIRED_FIELDS if not row.get(f)]
+        if missing:
+            raise ValueError(f"Record {lineno} is missing {', '.join(missing)}")
+        wrong = [
+            f
+            for f in TEXT_FIELDS
+            if row.get(f) is not None and not isinstance(row[f], str)
+        ]
+        if wrong:
+            raise ValueError(f"Record {lineno} has non-text {', '.join(wrong)}")
+        yield row
+
+
+def read_entries(stream: IO[str], fmt: str) -> Iterator[dict]:
+    """Yield entry dicts from stream.
+
+    CSV, TSV and JSON Lines are read one record at a time. A JSON document is a
+    single array and has to be parsed in full, so prefer jsonl for large files.
+    """
+    if fmt == "csv":
+        rows = csv.DictReader(stream)
+    elif fmt == "jsonl":
+        rows = (json.loads(line) for line in stream if line.strip())
+    elif fmt == "tsv":
+        rows = _read_tsv(stream)
+    else:
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON import must be an array of records")
+    return _validated(rows)
+
+
+def write_entries(
+    stream: IO[str],
+    entries: Iterable[dict],
+    fmt: str,
+    fields: Sequence[str] = FIELDS,
+) -> int:
+    """Write entries to stream as they are produced; return the count.
+
+    fields sets the CSV and TSV columns (a header row comes first); JSON
+    formats write each dict as it is.
+    """
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for entry in entries:
+            writer.writerow(entry)
+            count += 1
+    elif fmt == "tsv":
+        stream.write("\t".join(fields) + "\n")
+        for entry in entries:
+            stream.write("\t".join(_tsv_field(entry.get(f)) for f in fields) + "\n")
+            count += 1
+    elif fmt == "jsonl":
+        for entry in entries:
+            stream.write(json.dumps(entry) + "\n")
+            count += 1
+    else:
+        # Emit the array incrementally instead of json.dump()-ing a list.
+        stream.write("[")
+        for entry in entries:
+            stream.write(",\n" if count else "\n")
+            stream.write(json.dumps(entry))
+            count += 1
+        stream.write("\n]\n" if count else "]\n")
+    return count